@@ -0,0 +1,7 @@
+"""
+Benchmarks of the Floor Management System.
+
+datagen builds a synthetic building hierarchy with booking history, run drives
+the booking tasks and the Flask routes against it and reports latency,
+throughput and query counts per scenario. See run.py for the usage.
+"""
@@ -0,0 +1,94 @@
+"""
+This module generates synthetic data for the benchmarks.
+
+The hierarchy (buildings x floors x rooms x seats) goes through the bulk
+import (databaseControl.importHierarchy), the users and bookings are inserted
+with executemany. Bookings never overlap within a room: historical bookings
+are closed and lie in the past, open bookings lie in the coming days.
+"""
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from task_app import db
+from task_app.databaseControl import importHierarchy
+from task_app.models import Booking, Room, User
+from werkzeug.security import generate_password_hash
+
+BENCH_PASSWORD = "benchmark"
+SLOT = timedelta(minutes=30)
+
+
+def generate(buildings=1, floors=10, rooms=20, seats=10, users=50, historical=10000, open=2000, seed=42):
+    """
+    Fill the database of the current application with synthetic data.
+
+    Args:
+        buildings (int): The number of buildings.
+        floors (int): The number of floors per building.
+        rooms (int): The number of rooms per floor.
+        seats (int): The number of seats per room.
+        users (int): The number of users.
+        historical (int): The number of closed bookings in the past.
+        open (int): The number of open bookings in the coming days.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        dict: The ids of the generated "users" and "rooms".
+    """
+    rng = random.Random(seed)
+    report = importHierarchy({"buildings": [{
+        "name": f"Building {b}",
+        "address": f"{b} Benchmark Street",
+        "floors": [{
+            "name": f"Floor {f}",
+            "level": f,
+            "rooms": [{
+                "name": f"B{b}F{f}R{r}",
+                "type": rng.choice(["meeting", "workshop", "focus"]),
+                "capacity": rng.choice([2, 4, 6, 8, 12, 20]),
+                "equipment": "",
+                "seats": [f"S{s}" for s in range(seats)],
+            } for r in range(rooms)],
+        } for f in range(floors)],
+    } for b in range(buildings)]})
+    if report["errors"]:
+        raise RuntimeError(report["errors"])
+
+    password = generate_password_hash(BENCH_PASSWORD)
+    db.session.execute(insert(User), [
+        {"email": f"user{u}@bench.local", "role": "employee", "password": password, "first_name": f"User{u}"}
+        for u in range(users)])
+    db.session.commit()
+
+    user_ids = [id for id, in db.session.query(User.id)]
+    room_ids = [id for id, in db.session.query(Room.id)]
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    rows = []
+    rows += _bookings(rng, room_ids, user_ids, historical, today - timedelta(days=365), 365, "closed")
+    rows += _bookings(rng, room_ids, user_ids, open, today + timedelta(days=1), 14, "open")
+    for start in range(0, len(rows), 1000):
+        db.session.execute(insert(Booking), rows[start:start + 1000])
+    db.session.commit()
+    return {"users": user_ids, "rooms": room_ids}
+
+
+def _bookings(rng, room_ids, user_ids, count, first_day, days, status):
+    # one slot per room and half hour at most, so bookings of a room never overlap
+    taken = set()
+    rows = []
+    # written long ago, so that the availability index sync does not see them as fresh changes
+    written = datetime.now() - timedelta(days=1)
+    while len(rows) < count and len(taken) < len(room_ids) * days * 20:
+        room_id = rng.choice(room_ids)
+        start = first_day + timedelta(days=rng.randrange(days), hours=8) + SLOT * rng.randrange(20)
+        if (room_id, start) in taken:
+            continue
+        taken.add((room_id, start))
+        rows.append({
+            "room_id": room_id, "user_id": rng.choice(user_ids), "people_count": rng.randint(1, 6),
+            "start_time": start, "end_time": start + SLOT, "purpose": "benchmark", "status": status,
+            "updated_at": written,
+        })
+    return rows
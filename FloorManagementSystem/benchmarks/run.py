@@ -0,0 +1,234 @@
+"""
+This module runs the benchmark scenarios and reports their latency, throughput and query counts.
+
+Usage (from the FloorManagementSystem directory):
+
+    $ python -m benchmarks.run                                 # eager tasks, fresh SQLite file
+    $ python -m benchmarks.run --rooms 50 --historical 50000   # a bigger data set
+    $ python -m benchmarks.run --save benchmarks/baseline.json # record a baseline
+    $ python -m benchmarks.run --baseline benchmarks/baseline.json
+    $ python -m benchmarks.run --clients 16                    # 16 concurrent clients
+
+By default the tasks run eagerly in this process. With --broker (e.g.
+redis://localhost) they go through the broker instead and a worker has to be
+running (`celery -A make_celery worker`) against the same --database.
+
+Every scenario is driven by --clients concurrent clients, each a thread with a
+test client logged in as its own user, so lock contention between the web
+requests and the tasks shows up in the numbers.
+
+The report holds p50/p95/p99 latency in milliseconds, throughput in calls per
+second and SQL statements per call for every scenario. With --baseline, every
+scenario whose p95 grew by more than --tolerance percent is reported and the
+exit status is 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+SCENARIOS = ["search_task", "book_task", "cancel_task", "search_route", "buildings_api", "floors_api", "rooms_api",
+             "seats_api"]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class QueryCounter:
+    """Counts the SQL statements run by an engine, from every thread."""
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def measure(name, iterations, call, counter, pool):
+    def timed(i):
+        t = time.perf_counter()
+        call(i)
+        return (time.perf_counter() - t) * 1000
+
+    queries = counter.count
+    started = time.perf_counter()
+    latencies = list(pool.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "throughput_per_s": round(iterations / elapsed, 1),
+        "queries_per_call": round((counter.count - queries) / iterations, 2),
+    }
+
+
+def window(rng, days=14):
+    day = datetime.now().date() + timedelta(days=rng.randrange(1, days + 1))
+    hour = rng.randrange(8, 17)
+    minute = rng.choice([0, 30])
+    return f"{hour:02d}:{minute:02d}", f"{hour + 1:02d}:{minute:02d}", day.isoformat()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buildings", type=int, default=1)
+    parser.add_argument("--floors", type=int, default=10)
+    parser.add_argument("--rooms", type=int, default=20, help="rooms per floor")
+    parser.add_argument("--seats", type=int, default=10, help="seats per room")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--historical", type=int, default=10000, help="closed bookings in the past")
+    parser.add_argument("--open", type=int, default=2000, help="open bookings in the coming days")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per scenario, shared by the clients")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--database", help="SQLAlchemy URI, a fresh SQLite file by default")
+    parser.add_argument("--broker", help="run the tasks through this broker instead of eagerly")
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare the report with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=20.0, help="allowed p95 regression in percent")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="fms-bench-")
+    os.environ["FLASK_SQLALCHEMY_DATABASE_URI"] = args.database or f"sqlite:///{workdir}/bench.db"
+    if args.broker:
+        os.environ["FLASK_CELERY__broker_url"] = args.broker
+        os.environ["FLASK_CELERY__result_backend"] = args.broker
+    else:
+        os.environ["FLASK_CELERY__task_always_eager"] = "true"
+        os.environ["FLASK_CELERY__task_store_eager_result"] = "true"
+        os.environ["FLASK_CELERY__result_backend"] = "cache+memory://"
+
+    from task_app import create_app, db, tasks
+    from task_app.models import Booking
+
+    from .datagen import BENCH_PASSWORD, generate
+
+    app = create_app()
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        started = time.perf_counter()
+        data = generate(args.buildings, args.floors, args.rooms, args.seats, args.users, args.historical, args.open, args.seed)
+        setup_s = time.perf_counter() - started
+        counter = QueryCounter(db.engine)
+
+    def run(task, *task_args):
+        if args.broker:
+            return task.delay(*task_args).get(timeout=60)
+        with app.app_context():
+            return task(*task_args)
+
+    local = threading.local()
+    logins = itertools.count()
+
+    def client():
+        # test clients keep their cookies, every thread logs in with a user of its own
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+            user = next(logins) % args.users
+            local.client.post("/login", data={"email": f"user{user}@bench.local", "password": BENCH_PASSWORD})
+        return local.client
+
+    booked = []
+    booked_lock = threading.Lock()
+
+    def search_task(i):
+        run(tasks.search, *window(rng), rng.choice([2, 4, 8]), rng.choice(data["users"]))
+
+    def book_task(i):
+        start, end, day = window(rng)
+        result = run(tasks.bookRoom, "benchmark", start, end, rng.choice(data["rooms"]), day, 2, rng.choice(data["users"]))
+        if result["booking_id"]:
+            with booked_lock:
+                booked.append(result["booking_id"])
+
+    def cancel_task(i):
+        with booked_lock:
+            if not booked:
+                with app.app_context():
+                    booked.extend(id for id, in db.session.query(Booking.id).filter(Booking.status == "open").limit(args.iterations))
+            booking_id = booked.pop()
+        run(tasks.cancel, booking_id)
+
+    def search_route(i):
+        start, end, day = window(rng)
+        response = client().post("/search", data={"start": start, "end": end, "date": day, "count": rng.choice([2, 4, 8])}).get_json()
+        while "result_id" in response:
+            response = client().get(f"/result/{response['result_id']}").get_json()
+            if response["ready"]:
+                break
+            time.sleep(0.005)
+
+    def buildings_api(i):
+        client().get("/api/buildings?limit=50")
+
+    def floors_api(i):
+        client().get(f"/api/floors?building_id={rng.randrange(1, args.buildings + 1)}&limit=50")
+
+    def rooms_api(i):
+        client().get(f"/api/rooms?after={rng.choice(data['rooms'])}&min_capacity={rng.choice([2, 4, 8])}&limit=50")
+
+    def seats_api(i):
+        client().get(f"/api/seats?room_id={rng.choice(data['rooms'])}&limit=50")
+
+    calls = {
+        "search_task": search_task,
+        "book_task": book_task,
+        "cancel_task": cancel_task,
+        "search_route": search_route,
+        "buildings_api": buildings_api,
+        "floors_api": floors_api,
+        "rooms_api": rooms_api,
+        "seats_api": seats_api,
+    }
+    report = {
+        "dataset": {key: getattr(args, key) for key in ("buildings", "floors", "rooms", "seats", "users", "historical", "open")},
+        "mode": "broker" if args.broker else "eager",
+        "clients": args.clients,
+        "setup_s": round(setup_s, 2),
+        "scenarios": {},
+    }
+    with ThreadPoolExecutor(max_workers=args.clients, thread_name_prefix="client") as pool:
+        # log every client in before measuring, the password hashing would dominate the first calls
+        ready = threading.Barrier(args.clients)
+        list(pool.map(lambda _: (client(), ready.wait()), range(args.clients)))
+        for name in args.scenarios.split(","):
+            report["scenarios"][name] = measure(name, args.iterations, calls[name], counter, pool)
+            print(f"{name:18} {json.dumps(report['scenarios'][name])}")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in report["scenarios"].items():
+            before = baseline["scenarios"].get(name)
+            if before and result["p95_ms"] > before["p95_ms"] * (1 + args.tolerance / 100):
+                regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {result['p95_ms']} ms")
+        for regression in regressions:
+            print("REGRESSION", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,7 @@ Create the Celery application instance.
 :rtype: celery.Celery
 """
 
-from task_app import create_app
+from task_app import celery_worker_pool, create_app
 
 """
 Create the Celery application instance.
@@ -18,5 +18,5 @@ Create the Celery application instance.
 :return: The Celery application instance.
 :rtype: celery.Celery
 """
-flask_app = create_app()
-celery_app = flask_app.extensions["celery"]
+flask_app = create_app("worker")
+celery_app = celery_worker_pool(flask_app, flask_app.config["WORKER_POOL"])
@@ -2,29 +2,52 @@
 This file creates a flask application with celery and flask-sqlalchemy as dependencies.
 It also sets up authentication using flask-login.
 
+The Celery workers and beat build the same application in "worker" mode, without the blueprints and the login,
+so the views, the templates and their dependencies are only imported by the web app.
+
 The functions and methods are well documented using Python Docstrings.
 """
 from celery import Celery
 from celery import Task
+from kombu import Queue
 from flask import Flask
-from flask import render_template
 from flask_sqlalchemy import SQLAlchemy
 from os import path
-from flask_login import LoginManager
 
 db = SQLAlchemy()
 DB_NAME = "database.db"
 
 
-def create_app() -> Flask:
+def create_app(mode: str = "web") -> Flask:
     """
     This function creates a flask application with the given configuration.
     The configuration is loaded from the environment variables and includes:
     - SECRET_KEY
-    - SQLALCHEMY_DATABASE_URI
+    - SQLALCHEMY_DATABASE_URI, e.g. a local PostgreSQL instead of the default SQLite file
+    - SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE,
+      DB_LOCK_RETRIES: the tuning of the database engine (see storage.py)
     - CELERY configuration
+    - SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL: the size and lifetime of the search cache (see cache.py)
+    - USER_CACHE_SIZE, USER_CACHE_TTL: the size and lifetime of the cache of logged in users (see usercache.py)
+    - SEARCH_SYNC_INTERVAL: how many seconds a search may skip syncing the bookings and rooms changed by other processes
+    - AVAILABILITY_REFRESH_INTERVAL: the seconds between two full reloads of the open bookings (see availability.py)
+    - SPATIAL_CELL_SIZE, SPATIAL_LEVEL_PENALTY, SPATIAL_REFRESH_INTERVAL: the grid of the room positions (see spatial.py)
+    - EXPIRY_BATCH_SIZE: how many past bookings tasks.expireBookings closes per transaction, it runs every
+      CELERY["beat_schedule"]["expire-bookings"]["schedule"] seconds under celery beat
+    - ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE: how old closed bookings are moved to the archive by
+      tasks.archiveBookings, and how many per transaction
+    - WORKER_POOLS, WORKER_POOL: the queues, concurrency and prefetch of each kind of Celery worker (see celery_worker_pool)
+    - SEARCH_EXECUTION: "celery", or "inline" to run searches on a thread pool of INLINE_WORKERS threads in the web process
+    - METRICS_DIR, SLOW_REQUEST_MS: where worker processes leave their metrics for /metrics, and the latency from which
+      requests are logged as slow (see metrics.py)
+    - SCHEMA_CHECK: "version" to create the tables only when the stored schema version is not the one of the models,
+      "create_all" to check every table on every start, or "off" (see storage.schema_init_app)
+
+    The application also initializes the database and, in "web" mode, registers the blueprints and the login.
 
-    The application also initializes the database and registers the blueprints.
+    Args:
+        mode (str): "web" for the web app, or "worker" for the Celery workers and beat, which only need the models
+            and the tasks.
 
     Returns:
         Flask: The created flask application.
@@ -32,35 +55,119 @@ def create_app() -> Flask:
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'hjshjhdjah kjshkjdhjs'
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_NAME}'
-    db.init_app(app)
 
     app.config.from_mapping(
-        CELERY=dict(
-            broker_url="redis://localhost",
-            result_backend="redis://localhost",
-            task_ignore_result=True,
-        ),
+        SQLITE_JOURNAL_MODE="WAL",
+        SQLITE_SYNCHRONOUS="NORMAL",
+        SQLITE_BUSY_TIMEOUT=5000,
+        DB_POOL_SIZE=5,
+        DB_MAX_OVERFLOW=10,
+        DB_POOL_RECYCLE=1800,
+        DB_LOCK_RETRIES=5,
+        CELERY={
+            "broker_url": "redis://localhost",
+            "result_backend": "redis://localhost",
+            "task_ignore_result": True,
+            # interactive reads, booking writes and bulk jobs never wait behind each other
+            "task_queues": [Queue(name, routing_key=name) for name in ("interactive", "writes", "bulk")],
+            "task_default_queue": "writes",
+            "task_default_exchange": "tasks",
+            "task_routes": {
+                "task_app.tasks.search": {"queue": "interactive", "priority": 0},
+                "task_app.tasks.bookRoom": {"queue": "writes", "priority": 3},
+                "task_app.tasks.cancel": {"queue": "writes", "priority": 3},
+                "task_app.tasks.bookRecurring": {"queue": "writes", "priority": 3},
+                "task_app.tasks.importFloorPlans": {"queue": "bulk", "priority": 9},
+                "task_app.tasks.backfillUsage": {"queue": "bulk", "priority": 9},
+                "task_app.tasks.expireBookings": {"queue": "writes", "priority": 6},
+                "task_app.tasks.archiveBookings": {"queue": "bulk", "priority": 9},
+            },
+            # closes the bookings whose end passed, so the open bookings stay the current and future ones
+            "beat_schedule": {
+                "expire-bookings": {"task": "task_app.tasks.expireBookings", "schedule": 300.0},
+                "archive-bookings": {"task": "task_app.tasks.archiveBookings", "schedule": 86400.0},
+            },
+            # a worker consuming several queues drains them in the order above
+            "broker_transport_options": {"queue_order_strategy": "priority", "priority_steps": [0, 3, 6, 9], "sep": ":"},
+            # a search nobody waits for anymore is dropped instead of run
+            "task_annotations": {"task_app.tasks.search": {"expires": 30}},
+            # results are read once by the browser, keep Redis memory bounded
+            "result_expires": 600,
+        },
+        WORKER_POOLS={
+            "interactive": {"queues": ["interactive"], "concurrency": 8, "prefetch_multiplier": 4},
+            "writes": {"queues": ["writes"], "concurrency": 2, "prefetch_multiplier": 1},
+            "bulk": {"queues": ["bulk"], "concurrency": 1, "prefetch_multiplier": 1},
+            "all": {"queues": ["interactive", "writes", "bulk"], "concurrency": None, "prefetch_multiplier": 1},
+        },
+        WORKER_POOL="all",
+        SEARCH_EXECUTION="celery",
+        INLINE_WORKERS=4,
+        INLINE_TIMEOUT=5,
+        METRICS_DIR=None,
+        SLOW_REQUEST_MS=None,
+        SEARCH_CACHE_SIZE=1024,
+        SEARCH_CACHE_TTL=300,
+        USER_CACHE_SIZE=4096,
+        USER_CACHE_TTL=60,
+        SEARCH_SYNC_INTERVAL=0,
+        AVAILABILITY_REFRESH_INTERVAL=60,
+        SPATIAL_CELL_SIZE=10.0,
+        SPATIAL_LEVEL_PENALTY=50.0,
+        SPATIAL_REFRESH_INTERVAL=300,
+        EXPIRY_BATCH_SIZE=1000,
+        ARCHIVE_AFTER_DAYS=365,
+        ARCHIVE_BATCH_SIZE=1000,
+        SCHEMA_CHECK="version",
     )
     app.config.from_prefixed_env()
+
+    from .storage import schema_init_app, storage_init_app
+    storage_init_app(app)
     celery_init_app(app)
 
+    from .metrics import metrics_init_app
+    metrics_init_app(app)
+
+    from .cache import searchCache
+    searchCache.configure(app.config["SEARCH_CACHE_SIZE"], app.config["SEARCH_CACHE_TTL"])
+
+    from .availability import index
+    index.configure(float(app.config["AVAILABILITY_REFRESH_INTERVAL"]))
+
+    from .spatial import spatialIndex
+    spatialIndex.configure(app.config["SPATIAL_CELL_SIZE"], app.config["SPATIAL_LEVEL_PENALTY"],
+                           float(app.config["SPATIAL_REFRESH_INTERVAL"]))
+
+    schema_init_app(app)
+
+    if mode == "worker":
+        # registers the tasks, the web app imports them through its views
+        from . import tasks  # noqa: F401
+        return app
+
+    from .inline import executor
+    executor.configure(app.config["INLINE_WORKERS"])
+
     from . import views
     from . import auth
+    from . import api
 
     app.register_blueprint(views.bp, url_prefix="/")
     app.register_blueprint(auth.auth, url_prefix='/')
+    app.register_blueprint(api.bp, url_prefix="/api")
 
-    from .models import User
-    with app.app_context():
-        db.create_all()
-
+    from flask_login import LoginManager
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
+    from .usercache import userCache
+    userCache.configure(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+
     @login_manager.user_loader
     def load_user(id):
-        return User.query.get(int(id))
+        return userCache.load(int(id))
 
     return app
 
@@ -85,4 +192,29 @@ def celery_init_app(app: Flask) -> Celery:
     celery_app.config_from_object(app.config["CELERY"])
     celery_app.set_default()
     app.extensions["celery"] = celery_app
-    return celery_app
\ No newline at end of file
+    return celery_app
+
+
+def celery_worker_pool(app: Flask, name: str) -> Celery:
+    """
+    This function sizes the celery worker started from this application for one of the WORKER_POOLS.
+
+    Each pool consumes its own queues with its own concurrency and prefetch, so that search workers stay
+    free for interactive requests while writes and bulk jobs are processed by smaller pools. Running
+    `celery -A make_celery worker` starts the pool named by the WORKER_POOL setting
+    (e.g. FLASK_WORKER_POOL=interactive), options given on the command line (-Q, -c) still win.
+
+    Args:
+        app (Flask): The flask application.
+        name (str): The name of the pool in WORKER_POOLS.
+
+    Returns:
+        Celery: The configured celery application.
+    """
+    celery_app = app.extensions["celery"]
+    pool = app.config["WORKER_POOLS"][name]
+    celery_app.select_queues(pool["queues"])
+    if pool.get("concurrency"):
+        celery_app.conf.worker_concurrency = pool["concurrency"]
+    celery_app.conf.worker_prefetch_multiplier = pool.get("prefetch_multiplier", 1)
+    return celery_app
@@ -0,0 +1,700 @@
+"""
+This module contains the blueprint for the JSON API.
+
+The endpoints return pages of rows instead of whole tables, so that the
+workspaces page (and any other client) only loads what it shows. Pages use
+keyset pagination on the primary key: a page is requested with the last id
+of the previous page ("after"), which costs the same index range scan no
+matter how deep the client pages. Only the columns a client needs are
+selected, no ORM objects are built.
+
+Every endpoint accepts:
+    after (int): The last id of the previous page, omitted for the first page.
+    limit (int): The page size, DEFAULT_PAGE_SIZE by default and at most MAX_PAGE_SIZE.
+
+and returns a dictionary with the "items" of the page and the "next" value of
+"after", None on the last page. A malformed number in any argument is answered
+with an error and 400, not ignored.
+
+The activity feed orders by more than the id, its "after" is an opaque cursor
+string instead (see activityPage).
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, current_app, request
+from flask_login import current_user, login_required
+from sqlalchemy import tuple_
+
+from . import db
+from .availability import index
+from .databaseControl import (
+    ConflictError,
+    restoreFloorPlan,
+    updateFloorPlan,
+    updateRoom,
+    updateSeat,
+)
+from .models import (
+    Booking,
+    BookingArchive,
+    Building,
+    FloorPlan,
+    FloorPlanVersion,
+    Room,
+    Seat,
+)
+from .spatial import spatialIndex
+from .sync import applySync
+from .tasks import backfillUsage, parseWindow
+from .timeline import (
+    MIN_SLOT_MINUTES,
+    SLOT_MINUTES,
+    bits,
+    dayGrid,
+    slotMask,
+    windowStarts,
+)
+from .utilization import GROUPS, OPEN_HOURS, peakHours, usageReport
+from .versioning import diffVersions, versionState
+
+bp = Blueprint("api", __name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class ArgumentError(ValueError):
+    """A query argument that does not parse, answered with 400."""
+
+
+@bp.errorhandler(ArgumentError)
+def argumentError(e):
+    return {"error": str(e)}, 400
+
+
+def argument(name, default=None, type=int):
+    """
+    Read a numeric query argument.
+
+    Unlike request.args.get(name, type=int), a malformed value is an error instead of the default, so that a
+    typo in a filter does not silently return the unfiltered rows.
+
+    Args:
+        name (str): The name of the argument.
+        default: The value when the argument is missing or empty.
+        type (type): int or float.
+
+    Returns:
+        The parsed value, or the default.
+
+    Raises:
+        ArgumentError: If the value does not parse.
+    """
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return type(value)
+    except ValueError:
+        raise ArgumentError(f"{name} must be {'an integer' if type is int else 'a number'}") from None
+
+
+def page(query, key):
+    """
+    Return one keyset page of a query.
+
+    Args:
+        query (sqlalchemy.orm.Query): The query selecting the columns of the items.
+        key (sqlalchemy.Column): The unique column the pages are ordered by.
+
+    Returns:
+        dict: The "items" of the page and the "next" cursor.
+    """
+    limit = max(min(argument("limit", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE), 1)
+    after = argument("after")
+    if after is not None:
+        query = query.filter(key > after)
+    rows = query.order_by(key).limit(limit + 1).all()
+    items = [row._asdict() for row in rows[:limit]]
+    return {
+        "items": items,
+        "next": items[-1][key.key] if len(rows) > limit else None,
+    }
+
+
+@bp.get("/buildings")
+@login_required
+def buildings():
+    """
+    This function returns a page of buildings.
+
+    Parameters:
+    name (str): Only return the buildings whose name contains this text.
+
+    Returns:
+    A page of {id, name, address} items.
+
+    """
+    query = db.session.query(Building.id, Building.name, Building.address)
+    if request.args.get("name"):
+        query = query.filter(Building.name.contains(request.args["name"]))
+    return page(query, Building.id)
+
+
+@bp.get("/floors")
+@login_required
+def floors():
+    """
+    This function returns a page of floor plans.
+
+    Parameters:
+    building_id (int): Only return the floors of this building.
+
+    Returns:
+    A page of {id, building_id, name, level, image_file, created_at, updated_at, version} items.
+
+    """
+    query = db.session.query(FloorPlan.id, FloorPlan.building_id, FloorPlan.name, FloorPlan.level,
+                             FloorPlan.image_file, FloorPlan.created_at, FloorPlan.updated_at, FloorPlan.version)
+    if request.args.get("building_id"):
+        query = query.filter(FloorPlan.building_id == argument("building_id"))
+    result = page(query, FloorPlan.id)
+    for item in result["items"]:
+        item["created_at"] = str(item["created_at"])
+        item["updated_at"] = str(item["updated_at"])
+    return result
+
+
+@bp.get("/rooms")
+@login_required
+def rooms():
+    """
+    This function returns a page of rooms.
+
+    Parameters:
+    floor_plan_id (int): Only return the rooms of this floor.
+    min_capacity (int): Only return the rooms holding at least this many people.
+    type (str): Only return the rooms of this type.
+
+    Returns:
+    A page of {id, floor_plan_id, name, type, capacity, equipment, x, y, version} items.
+
+    """
+    query = db.session.query(Room.id, Room.floor_plan_id, Room.name, Room.type, Room.capacity, Room.equipment, Room.x, Room.y, Room.version)
+    if request.args.get("floor_plan_id"):
+        query = query.filter(Room.floor_plan_id == argument("floor_plan_id"))
+    if request.args.get("min_capacity"):
+        query = query.filter(Room.capacity >= argument("min_capacity"))
+    if request.args.get("type"):
+        query = query.filter(Room.type == request.args["type"])
+    return page(query, Room.id)
+
+
+@bp.get("/seats")
+@login_required
+def seats():
+    """
+    This function returns a page of seats.
+
+    Parameters:
+    room_id (int): Only return the seats of this room.
+
+    Returns:
+    A page of {id, room_id, label, x, y, version} items.
+
+    """
+    query = db.session.query(Seat.id, Seat.room_id, Seat.label, Seat.x, Seat.y, Seat.version)
+    if request.args.get("room_id"):
+        query = query.filter(Seat.room_id == argument("room_id"))
+    return page(query, Seat.id)
+
+
+@bp.get("/rooms/nearest")
+@login_required
+def nearestRooms():
+    """
+    This function returns the rooms closest to a point, a seat or a room, from the spatial index (see spatial.py).
+
+    Parameters:
+    floor_plan_id, x, y (int, float, float): The point, on a floor.
+    seat_id (int): Or the position of a seat, the position of its room if it has none.
+    room_id (int): Or the position of a room, which is not returned itself.
+    k (int): The number of rooms, 5 by default.
+    people (int): Only return the rooms holding at least this many people.
+    date, start, end (str): Only return the rooms free on this "YYYY-MM-DD" from "HH:MM" to "HH:MM".
+
+    Returns:
+    A dictionary with the {id, floor_plan_id, distance} "items", closest first, rooms on other levels counting
+    the level penalty, or an error and 400 if the position is not known.
+
+    """
+    spatialIndex.sync()
+    exclude = None
+    if request.args.get("room_id"):
+        exclude = argument("room_id")
+        origin = spatialIndex.position(exclude)
+    elif request.args.get("seat_id"):
+        seat = db.session.query(Seat.x, Seat.y, Seat.room_id, FloorPlan.building_id, FloorPlan.level).join(
+            Room, Seat.room_id == Room.id).join(FloorPlan, Room.floor_plan_id == FloorPlan.id).filter(
+            Seat.id == argument("seat_id")).first()
+        if seat is None:
+            origin = None
+        elif seat.x is not None and seat.y is not None:
+            origin = (seat.building_id, seat.level or 0, seat.x, seat.y)
+        else:
+            origin = spatialIndex.position(seat.room_id)
+    else:
+        floor = db.session.query(FloorPlan.building_id, FloorPlan.level).filter(
+            FloorPlan.id == argument("floor_plan_id")).first()
+        x, y = argument("x", type=float), argument("y", type=float)
+        origin = None if floor is None or x is None or y is None else (floor.building_id, floor.level or 0, x, y)
+    if origin is None:
+        return {"error": "unknown position"}, 400
+
+    people = argument("people", 0)
+    window = None
+    if request.args.get("date"):
+        try:
+            window = parseWindow(request.args["start"], request.args["end"], request.args["date"])
+        except (KeyError, ValueError, IndexError):
+            return {"error": "date, start and end must be YYYY-MM-DD, HH:MM and HH:MM"}, 400
+        index.sync(current_app.config.get("SEARCH_SYNC_INTERVAL", 0))
+
+    def accept(room_id, capacity):
+        return capacity >= people and (window is None or index.isFree(room_id, *window))
+
+    found = spatialIndex.nearest(*origin, k=min(argument("k", 5), MAX_PAGE_SIZE), accept=accept, exclude=exclude)
+    return {"items": [{"id": room_id, "floor_plan_id": floor_plan_id, "distance": round(distance, 2)}
+                      for distance, room_id, floor_plan_id in found]}
+
+
+
+def _patch(update, id):
+    if current_user.role != "admin":
+        return {"error": "only admins can change floor plans"}, 403
+    data = request.get_json(silent=True) or {}
+    try:
+        row = update(id, data.get("values") or {}, data.get("version"), data.get("base"))
+    except ConflictError as e:
+        return {"error": "conflict", "current": e.current, "fields": e.fields}, 409
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}, 400
+    if row is None:
+        return {"error": "not found"}, 404
+    return row
+
+
+@bp.patch("/floors/<int:id>")
+@login_required
+def patchFloor(id):
+    """
+    This function changes a floor plan with a compare-and-swap on its version.
+
+    Parameters:
+    values (dict): The changed name, level or image_file.
+    version (int): The version the change is based on, the change is rejected with 409 if the floor moved on.
+    base (dict): The fields as read at that version, to merge the change with changes of other fields instead.
+
+    Returns:
+    The updated floor with its new version, or on 409 the "current" floor and the conflicting "fields". Only
+    admins can change floors, rooms and seats, other users get 403.
+
+    """
+    return _patch(updateFloorPlan, id)
+
+
+@bp.patch("/rooms/<int:id>")
+@login_required
+def patchRoom(id):
+    """
+    This function changes a room with a compare-and-swap on its version, see patchFloor.
+    """
+    return _patch(updateRoom, id)
+
+
+@bp.patch("/seats/<int:id>")
+@login_required
+def patchSeat(id):
+    """
+    This function changes a seat with a compare-and-swap on its version, see patchFloor.
+    """
+    return _patch(updateSeat, id)
+
+
+@bp.get("/floors/<int:id>/versions")
+@login_required
+def floorVersions(id):
+    """
+    This function returns a page of the versions of a floor plan, oldest first.
+
+    Returns:
+    A page of {version, user_id, created_at, snapshot} items, snapshot telling whether the full state is stored.
+
+    """
+    query = db.session.query(FloorPlanVersion.version, FloorPlanVersion.user_id, FloorPlanVersion.created_at,
+                             FloorPlanVersion.snapshot.isnot(None).label("snapshot")).filter(FloorPlanVersion.floor_plan_id == id)
+    result = page(query, FloorPlanVersion.version)
+    for item in result["items"]:
+        item["created_at"] = str(item["created_at"])
+    return result
+
+
+@bp.get("/floors/<int:id>/versions/<int:version>")
+@login_required
+def floorVersion(id, version):
+    """
+    This function returns a version of a floor plan.
+
+    Returns:
+    The {floor, rooms, seats} state of the floor at that version, rooms and seats by id.
+
+    """
+    state = versionState(id, version)
+    if state is None:
+        return {"error": "version not found"}, 404
+    return state
+
+
+@bp.get("/floors/<int:id>/diff")
+@login_required
+def floorDiff(id):
+    """
+    This function diffs two versions of a floor plan.
+
+    Parameters:
+    from (int): The version to diff from.
+    to (int): The version to diff to.
+
+    Returns:
+    The {floor, rooms, seats} changes, each as [before, after] with null for an added or removed row.
+
+    """
+    delta = diffVersions(id, argument("from", 0), argument("to", 0))
+    if delta is None:
+        return {"error": "version not found"}, 404
+    return delta
+
+
+@bp.post("/floors/<int:id>/versions/<int:version>/restore")
+@login_required
+def floorRestore(id, version):
+    """
+    This function brings a floor plan back to one of its versions, recorded as a new version.
+
+    Returns:
+    The new "version", and the "skipped_seats" whose room does not exist anymore, or an error and 403 for other
+    users than admins.
+
+    """
+    if current_user.role != "admin":
+        return {"error": "only admins can change floor plans"}, 403
+    result = restoreFloorPlan(id, version)
+    if result is None:
+        return {"error": "version not found"}, 404
+    return result
+
+
+
+@bp.post("/sync")
+@login_required
+def sync():
+    """
+    This function applies the operations an admin client logged offline and returns the server changes since its
+    last sync, in one round trip (see sync.py). The body may be gzip compressed (Content-Encoding: gzip), and the
+    response is when the client accepts it.
+
+    Parameters:
+    client_id (str): The id the client generated for itself.
+    token (int): The token returned by the last sync, 0 for the first one.
+    operations (list): The operations, each with its client generated "id", "op", "values", "target" or parent id,
+    "base_version" and "timestamp".
+
+    Returns:
+    The per-operation "results", a page of the "changes" since the token, "more" if the client has to sync again
+    for the next page, the versions the sync "recorded" and the new "token", or an error and 403 for other users
+    than admins.
+
+    """
+    if current_user.role != "admin":
+        return {"error": "only admins can sync floor plans"}, 403
+    try:
+        body = request.get_data()
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        data = json.loads(body)
+        result = applySync(data.get("client_id"), current_user, data.get("operations", []), int(data.get("token") or 0))
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        return {"error": str(e)}, 400
+
+    body = json.dumps(result).encode()
+    headers = {}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+def _activityCursor(status, row):
+    return f"{status}|{row.start_time.isoformat()}|{row.id}"
+
+
+def activityPage(user_id, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of the bookings of a user, the open ones first (soonest first), then the closed ones newest-first.
+
+    The open and the closed bookings are each a range of the (user_id, status, start_time) index, the cursor holds
+    the status, start time and id of the last item, so every page is one or two index range scans of at most limit
+    rows however many bookings the user has.
+
+    Args:
+        user_id (int): The id of the user.
+        after (str): The cursor of the previous page, None for the first page.
+        limit (int): The page size.
+
+    Returns:
+        dict: The "items" of the page and the "next" cursor, None on the last page.
+
+    Raises:
+        ArgumentError: If the cursor is malformed.
+    """
+    columns = (Booking.id, Booking.room_id, Booking.people_count, Booking.start_time, Booking.end_time,
+               Booking.purpose, Booking.status)
+    status, start, id = "open", None, None
+    if after:
+        try:
+            status, start, id = after.split("|")
+            start, id = (datetime.fromisoformat(start), int(id)) if start else (None, None)
+        except ValueError:
+            raise ArgumentError("invalid cursor") from None
+        if status not in ("open", "closed"):
+            raise ArgumentError("invalid cursor")
+
+    items = []
+    if status == "open":
+        query = db.session.query(*columns).filter(Booking.user_id == user_id, Booking.status == "open")
+        if start is not None:
+            query = query.filter(tuple_(Booking.start_time, Booking.id) > (start, id))
+        rows = query.order_by(Booking.start_time, Booking.id).limit(limit + 1).all()
+        if len(rows) > limit:
+            return {"items": [row._asdict() for row in rows[:limit]], "next": _activityCursor("open", rows[limit - 1])}
+        items = [row._asdict() for row in rows]
+        status, start, id = "closed", None, None
+
+    query = db.session.query(*columns).filter(Booking.user_id == user_id, Booking.status == "closed")
+    if start is not None:
+        query = query.filter(tuple_(Booking.start_time, Booking.id) < (start, id))
+    rows = query.order_by(Booking.start_time.desc(), Booking.id.desc()).limit(limit - len(items) + 1).all()
+    more = len(rows) > limit - len(items)
+    rows = rows[:limit - len(items)]
+    items += [row._asdict() for row in rows]
+    if more and rows:
+        return {"items": items, "next": _activityCursor("closed", rows[-1])}
+    if more:
+        # the page was filled by open bookings, the closed ones start on the next page
+        return {"items": items, "next": "closed||"}
+    return {"items": items, "next": None}
+
+
+@bp.get("/activity")
+@login_required
+def activity():
+    """
+    This function returns a page of the bookings of the current user.
+
+    Parameters:
+    after (str): The "next" cursor of the previous page, omitted for the first page.
+    limit (int): The page size.
+
+    Returns:
+    A page of {id, room_id, people_count, start_time, end_time, purpose, status} items, open bookings first.
+
+    """
+    limit = max(min(argument("limit", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE), 1)
+    result = activityPage(current_user.id, request.args.get("after"), limit)
+    for item in result["items"]:
+        item["start_time"] = str(item["start_time"])
+        item["end_time"] = str(item["end_time"])
+    return result
+
+
+@bp.get("/timeline")
+@login_required
+def timeline():
+    """
+    This function returns the free/busy grid of the rooms of a floor or a building for one day (see timeline.py).
+
+    Parameters:
+    floor_plan_id (int): The rooms of this floor, or
+    building_id (int): the rooms of this building.
+    date (str): The day, "YYYY-MM-DD".
+    slot (int): The length of a slot in minutes, 15 by default, it has to divide the day.
+    duration (int): Also return where a booking of this many minutes fits.
+    people (int): Only return the rooms holding at least this many people.
+
+    Returns:
+    A dictionary with the "date", the "slot" minutes, the number of "slots" and the {id, floor_plan_id, name,
+    capacity, busy} "rooms", busy being a string with one "0" (free) or "1" (busy) per slot. "any_free" and
+    "all_free" mark the slots free in at least one and in every room. With a duration, every room also has
+    "starts" and "any_start" marks the slots a booking of that length can start at in at least one room.
+
+    """
+    try:
+        day = datetime.strptime(request.args.get("date", ""), "%Y-%m-%d").date()
+    except ValueError:
+        return {"error": "date must be YYYY-MM-DD"}, 400
+    slot = argument("slot", SLOT_MINUTES)
+    if slot < MIN_SLOT_MINUTES or (24 * 60) % slot:
+        return {"error": f"slot must divide the day and be at least {MIN_SLOT_MINUTES} minutes"}, 400
+    if not request.args.get("floor_plan_id") and not request.args.get("building_id"):
+        return {"error": "a floor_plan_id or a building_id is needed"}, 400
+
+    grid = dayGrid(day, argument("floor_plan_id"), argument("building_id"),
+                   slot, argument("people", 0))
+    slots = grid["slots"]
+    day_mask = slotMask(0, slots)
+    length = -(-argument("duration", 0) // slot)
+
+    any_free, all_free, any_start = 0, day_mask, 0
+    rooms = []
+    for room in grid["rooms"]:
+        free = day_mask & ~room["busy"]
+        any_free |= free
+        all_free &= free
+        item = {**room, "busy": bits(room["busy"], slots)}
+        if length > 0:
+            starts = windowStarts(free, length)
+            any_start |= starts
+            item["starts"] = bits(starts, slots)
+        rooms.append(item)
+
+    result = {
+        "date": str(day),
+        "slot": slot,
+        "slots": slots,
+        "rooms": rooms,
+        "any_free": bits(any_free, slots),
+        "all_free": bits(all_free if rooms else 0, slots),
+    }
+    if length > 0:
+        result["any_start"] = bits(any_start, slots)
+    return result
+
+
+@bp.get("/history")
+@login_required
+def history():
+    """
+    This function returns a page of the archived bookings of the current user, newest first (see
+    tasks.archiveBookings). The history is read-only.
+
+    Parameters:
+    after (str): The "next" cursor of the previous page, omitted for the first page.
+    limit (int): The page size.
+
+    Returns:
+    A page of {id, room_id, people_count, start_time, end_time, purpose, status, archived_at} items.
+
+    """
+    limit = max(min(argument("limit", DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE), 1)
+    query = db.session.query(BookingArchive.id, BookingArchive.room_id, BookingArchive.people_count, BookingArchive.start_time,
+                             BookingArchive.end_time, BookingArchive.purpose, BookingArchive.status,
+                             BookingArchive.archived_at).filter(BookingArchive.user_id == current_user.id)
+    if request.args.get("after"):
+        try:
+            start, id = request.args["after"].split("|")
+            query = query.filter(tuple_(BookingArchive.start_time, BookingArchive.id) < (datetime.fromisoformat(start), int(id)))
+        except ValueError:
+            return {"error": "invalid cursor"}, 400
+    rows = query.order_by(BookingArchive.start_time.desc(), BookingArchive.id.desc()).limit(limit + 1).all()
+    items = [row._asdict() for row in rows[:limit]]
+    for item in items:
+        for column in ("start_time", "end_time", "archived_at"):
+            item[column] = str(item[column])
+    return {
+        "items": items,
+        "next": f"{rows[limit - 1].start_time.isoformat()}|{rows[limit - 1].id}" if len(rows) > limit else None,
+    }
+
+
+def _reportArgs():
+    # the days and the rooms a report covers, the last 30 days by default
+    To = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else datetime.now().date()
+    From = datetime.strptime(request.args["from"], "%Y-%m-%d").date() if request.args.get("from") else To - timedelta(days=29)
+    if From > To:
+        raise ValueError("from is after to")
+    scope = {name: argument(name) for name in ("floor_plan_id", "building_id", "room_id") if request.args.get(name)}
+    return From, To, scope
+
+
+@bp.get("/utilization")
+@login_required
+def utilization():
+    """
+    This function returns the utilization and seat fill of rooms, floors or buildings, from the hourly aggregates
+    (see utilization.py).
+
+    Parameters:
+    from, to (str): The first and last day, "YYYY-MM-DD", the last 30 days by default.
+    group (str): "room" (default), "floor" or "building".
+    hours (str): The hours of the day counted, "8-18" by default.
+    floor_plan_id, building_id, room_id (int): Only report on these rooms.
+
+    Returns:
+    A dictionary with the "from", "to" and "hours" of the report and its {id, rooms, bookings, booked_minutes,
+    utilization, fill} "items", or an error and 400 on invalid parameters.
+
+    """
+    try:
+        From, To, scope = _reportArgs()
+        hours = tuple(map(int, request.args.get("hours", f"{OPEN_HOURS[0]}-{OPEN_HOURS[1]}").split("-")))
+        if len(hours) != 2 or not 0 <= hours[0] < hours[1] <= 24:
+            raise ValueError("hours must be start-end within 0-24")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    group = request.args.get("group", "room")
+    if group not in GROUPS:
+        return {"error": f"group must be one of {', '.join(GROUPS)}"}, 400
+    return {"from": str(From), "to": str(To), "hours": list(hours), "items": usageReport(From, To, group, hours, **scope)}
+
+
+@bp.get("/utilization/peak")
+@login_required
+def utilizationPeak():
+    """
+    This function returns the utilization of every hour of the day, from the hourly aggregates.
+
+    Parameters:
+    from, to (str): The first and last day, "YYYY-MM-DD", the last 30 days by default.
+    floor_plan_id, building_id, room_id (int): Only report on these rooms.
+
+    Returns:
+    A dictionary with the "from" and "to" of the report, its 24 {hour, bookings, booked_minutes, utilization}
+    "items" and the "peak" hour, None without bookings.
+
+    """
+    try:
+        From, To, scope = _reportArgs()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    items = peakHours(From, To, **scope)
+    peak = max(items, key=lambda item: item["booked_minutes"])
+    return {"from": str(From), "to": str(To), "items": items, "peak": peak["hour"] if peak["booked_minutes"] else None}
+
+
+@bp.post("/utilization/backfill")
+@login_required
+def utilizationBackfill():
+    """
+    This function starts rebuilding the hourly aggregates from the existing bookings (see tasks.backfillUsage).
+    Only admins can start it, it rewrites the whole history.
+
+    Returns:
+    A dictionary with the "result_id" of the task, or an error and 403 for other users.
+
+    """
+    if current_user.role != "admin":
+        return {"error": "only admins can rebuild the utilization"}, 403
+    result = backfillUsage.delay()
+    return {"result_id": result.id}
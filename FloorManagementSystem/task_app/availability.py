@@ -0,0 +1,212 @@
+"""
+This module keeps an in-process interval index of the open bookings.
+
+Every room gets a RoomSchedule holding its open bookings. The schedule keeps
+the bookings merged into a sorted list of disjoint busy spans, so checking a
+window [From, To) against a room is a single binary search instead of a query
+over the whole bookings table.
+
+The index is filled once per process and is then kept up to date by the
+booking tasks (bookRoom and cancel) through bookingChanged(). Bookings changed
+by other processes (other Celery workers, the web app) are picked up by sync(),
+which only loads the rows whose updated_at moved since the previous sync.
+
+updated_at is stamped by the writer before it commits, so a transaction
+committing more than `lag` after its stamp is missed by that incremental
+sync, and a booking deleted by another process is never seen at all. Every
+REFRESH_INTERVAL seconds sync() reloads every open booking instead and drops
+the ones that are gone, which bounds how long such a miss lasts.
+
+Caches built on top of the index (see cache.py) register in listeners and are
+told about every booking added to or removed from a room.
+
+Classes:
+    RoomSchedule: The open bookings of one room as sorted busy spans.
+    AvailabilityIndex: The per-room schedules of every open booking.
+"""
+import bisect
+import threading
+from datetime import datetime, timedelta
+
+from . import db
+from .models import Booking
+
+# seconds between two full reloads, which catch the rows the incremental sync missed
+REFRESH_INTERVAL = 60
+
+
+class RoomSchedule:
+    """
+    The open bookings of a single room.
+
+    The busy spans are rebuilt lazily after a change, which keeps bookRoom and
+    cancel cheap while search only pays O(log bookings) per room.
+
+    Attributes:
+        bookings: A dictionary mapping booking id to its (start, end) window.
+    """
+    def __init__(self):
+        self.bookings = {}
+        self._starts = None
+        self._ends = None
+
+    def add(self, booking_id, start, end):
+        self.bookings[booking_id] = (start, end)
+        self._starts = None
+
+    def remove(self, booking_id):
+        if self.bookings.pop(booking_id, None) is not None:
+            self._starts = None
+
+    def _build(self):
+        starts = []
+        ends = []
+        for start, end in sorted(self.bookings.values()):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self._starts = starts
+        self._ends = ends
+
+    def isFree(self, start, end):
+        """
+        Check whether the room has no open booking overlapping [start, end).
+
+        Args:
+            start (datetime): The start of the window.
+            end (datetime): The end of the window.
+
+        Returns:
+            bool: True if the window is free.
+        """
+        if not self.bookings:
+            return True
+        if self._starts is None:
+            self._build()
+        # spans [0, i) start before the window ends, the last of them has the latest end
+        i = bisect.bisect_left(self._starts, end)
+        return i == 0 or self._ends[i - 1] <= start
+
+
+class AvailabilityIndex:
+    """
+    The interval index of all open bookings, grouped per room.
+
+    Attributes:
+        lag: How far behind the last sync the next sync looks, so that rows
+            committed by slow transactions of other processes are not missed.
+        refresh_interval: The seconds between two full reloads.
+        listeners: Callables called with (room id, start, end, opened) for every
+            booking added to (opened) or removed from a room.
+    """
+    def __init__(self, lag=timedelta(seconds=5), refresh_interval=REFRESH_INTERVAL):
+        self.lag = lag
+        self.refresh_interval = refresh_interval
+        self.listeners = []
+        self._lock = threading.RLock()
+        self._rooms = {}
+        self._where = {}
+        self._watermark = None
+        self._synced_at = None
+        self._loaded_at = None
+
+    def configure(self, refresh_interval):
+        with self._lock:
+            self.refresh_interval = refresh_interval
+
+    def reset(self):
+        with self._lock:
+            self._rooms = {}
+            self._where = {}
+            self._watermark = None
+            self._synced_at = None
+            self._loaded_at = None
+
+    def _apply(self, booking_id, room_id, start, end, status):
+        opened = status == "open" and room_id is not None and start is not None and end is not None
+        old_room = self._where.get(booking_id)
+        if opened and old_room == int(room_id) and self._rooms[old_room].bookings[booking_id] == (start, end):
+            # rows inside the sync lag are seen again
+            return
+        old_room = self._where.pop(booking_id, None)
+        if old_room is not None:
+            schedule = self._rooms[old_room]
+            old_start, old_end = schedule.bookings[booking_id]
+            schedule.remove(booking_id)
+            for listener in self.listeners:
+                listener(old_room, old_start, old_end, False)
+        if opened:
+            self._rooms.setdefault(int(room_id), RoomSchedule()).add(booking_id, start, end)
+            self._where[booking_id] = int(room_id)
+            for listener in self.listeners:
+                listener(int(room_id), start, end, True)
+
+    def bookingChanged(self, booking):
+        """
+        Update the index after a booking was inserted, reopened or closed.
+
+        Args:
+            booking (Booking): The committed booking.
+        """
+        with self._lock:
+            self._apply(booking.id, booking.room_id, booking.start_time, booking.end_time, booking.status)
+
+    def sync(self, max_age=0):
+        """
+        Bring the index up to date with the database.
+
+        The first call, and every call after refresh_interval seconds, loads
+        every open booking and drops the indexed ones that are no longer open;
+        other calls only load the bookings whose updated_at is newer than the
+        previous sync.
+
+        Args:
+            max_age (float): Skip the sync if the previous one is less than this
+                many seconds old. Changes made by this process are always applied
+                at once, this only delays the changes of other processes.
+
+        Returns:
+            list: The (booking id, room id, start, end, status) rows that were applied.
+        """
+        with self._lock:
+            now = datetime.now()
+            if max_age and self._synced_at is not None and (now - self._synced_at).total_seconds() < max_age:
+                return []
+            query = db.session.query(Booking.id, Booking.room_id, Booking.start_time, Booking.end_time, Booking.status)
+            reload = self._loaded_at is None or (now - self._loaded_at).total_seconds() >= self.refresh_interval
+            if reload:
+                query = query.filter(Booking.status == "open")
+            else:
+                query = query.filter(Booking.updated_at >= self._watermark - self.lag)
+            rows = query.all()
+            if reload:
+                # closed, detached or deleted by another process without this one seeing it
+                gone = set(self._where).difference(row.id for row in rows)
+                rows += [(booking_id, None, None, None, "gone") for booking_id in gone]
+                self._loaded_at = now
+            for row in rows:
+                self._apply(*row)
+            self._watermark = now
+            self._synced_at = now
+            return rows
+
+    def isFree(self, room_id, start, end):
+        """
+        Check whether a room has no open booking overlapping [start, end).
+
+        Args:
+            room_id (int): The id of the room.
+            start (datetime): The start of the window.
+            end (datetime): The end of the window.
+
+        Returns:
+            bool: True if the room is free for the whole window.
+        """
+        with self._lock:
+            schedule = self._rooms.get(int(room_id))
+            return schedule is None or schedule.isFree(start, end)
+
+
+index = AvailabilityIndex()
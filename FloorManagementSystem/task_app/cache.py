@@ -0,0 +1,247 @@
+"""
+This module caches the free rooms found by tasks.search.
+
+Popular slots are searched by many users, so the free rooms of a window are
+kept per (date, From, To, capacity bucket) with LRU and TTL eviction. The
+bucket is the largest power of two not above the number of people: an entry
+holds every free room of at least that capacity, and a search only filters it
+down to its own head count, so searches for 5, 6 or 7 people share an entry.
+
+Entries are invalidated precisely:
+    - the availability index reports every booking it adds or removes (see
+      AvailabilityIndex.listeners), which only drops the entries of the same
+      date whose window overlaps the booking, and for a new booking only the
+      entries listing that room as free,
+    - databaseControl reports rooms being created or deleted, which only drops
+      the entries whose bucket the room's capacity falls in.
+
+Bookings made by other processes reach the cache through the availability
+index. Rooms changed by other processes reach it through the shared
+CacheGeneration rows: every change of the rooms bumps, in its own transaction,
+the row of the capacity bucket of the room ("rooms:<bucket>"), or the "rooms"
+row when every entry is affected, such as a floor changing level (see
+bumpRooms). A search compares the rows with the values the cache was filled
+under before reading (see SearchCache.sync) and drops the entries a moved row
+covers, the same ones roomsChanged drops in the process making the change.
+
+Ranking is per user, so it is applied after the cache (see recommend.rankRooms).
+
+Classes:
+    SearchCache: The LRU/TTL cache of free rooms per window.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from sqlalchemy import insert, or_, update
+
+from . import db
+from .availability import index
+from .models import CacheGeneration
+
+# the CacheGeneration bumped by a change of every room, those of a capacity bucket are "rooms:<bucket>"
+ROOMS = "rooms"
+
+
+def capacityBucket(people):
+    """
+    Return the capacity bucket of a head count, the largest power of two not above it.
+
+    Args:
+        people (int): The number of people.
+
+    Returns:
+        int: The bucket.
+    """
+    return 1 << (max(int(people), 1).bit_length() - 1)
+
+
+class SearchCache:
+    """
+    An LRU/TTL cache of the free rooms of a search window.
+
+    Attributes:
+        max_entries: The number of windows kept before the least recently used one is evicted.
+        ttl: The number of seconds an entry is served.
+    """
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dates = {}
+        # the shared rooms generations the entries were computed under, and when they were read
+        self._shared = None
+        self._synced_at = None
+
+    def configure(self, max_entries, ttl):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._dates.clear()
+        self.generation += 1
+
+    def sync(self, max_age=0):
+        """
+        Drop the entries covering the rooms changed by any process since the previous sync.
+
+        Args:
+            max_age (float): Skip the sync if the previous one is less than this many seconds old. Changes made
+                by this process are always applied at once, this only delays the changes of other processes.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if max_age and self._synced_at is not None and now - self._synced_at < max_age:
+                return
+        shared = dict(db.session.query(CacheGeneration.name, CacheGeneration.value).filter(
+            or_(CacheGeneration.name == ROOMS, CacheGeneration.name.like(ROOMS + ":%"))))
+        with self._lock:
+            if self._shared is None or shared.get(ROOMS) != self._shared.get(ROOMS):
+                self._clear()
+            else:
+                for name, value in shared.items():
+                    if value != self._shared.get(name):
+                        self._dropUpTo(int(name.partition(":")[2]))
+            self._shared = shared
+            self._synced_at = now
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        keys = self._dates.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._dates[key[0]]
+
+    def get(self, From, To, people):
+        """
+        Return the cached free rooms of a window.
+
+        Args:
+            From (datetime): The start of the window.
+            To (datetime): The end of the window.
+            people (int): The number of people.
+
+        Returns:
+            list: The free rooms of at least capacityBucket(people) capacity, None on a miss.
+        """
+        key = (From.date(), From, To, capacityBucket(people))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry["rooms"]
+
+    def put(self, From, To, people, rooms, generation):
+        """
+        Store the free rooms of a window.
+
+        Args:
+            From (datetime): The start of the window.
+            To (datetime): The end of the window.
+            people (int): The number of people, the rooms must cover capacityBucket(people).
+            rooms (list): The free rooms, as rows with id and capacity.
+            generation (int): The generation read before the rooms were computed, the entry is not stored if
+                anything was invalidated in the meantime.
+        """
+        key = (From.date(), From, To, capacityBucket(people))
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = {"expires": time.monotonic() + self.ttl, "rooms": rooms, "ids": {room.id for room in rooms}}
+            self._entries.move_to_end(key)
+            self._dates.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def bookingChanged(self, room_id, start, end, opened):
+        """
+        Drop the entries a booking change can affect.
+
+        Args:
+            room_id (int): The id of the booked room.
+            start (datetime): The start of the booking.
+            end (datetime): The end of the booking.
+            opened (bool): True if the booking was added, False if it was closed or moved away.
+        """
+        with self._lock:
+            day = start.date()
+            while day <= end.date():
+                for key in list(self._dates.get(day, ())):
+                    _, From, To, _ = key
+                    if From >= end or To <= start:
+                        continue
+                    if opened and room_id not in self._entries[key]["ids"]:
+                        continue
+                    self._drop(key)
+                day += timedelta(days=1)
+            self.generation += 1
+
+    def roomsChanged(self, capacity=None):
+        """
+        Drop the entries a created or deleted room can affect.
+
+        Args:
+            capacity (int): The capacity of the room, every entry is dropped if None.
+        """
+        capacity = _capacity(capacity)
+        with self._lock:
+            if capacity is None:
+                self._clear()
+                return
+            self._dropUpTo(capacity)
+
+    def _dropUpTo(self, capacity):
+        for key in list(self._entries):
+            if key[3] <= capacity:
+                self._drop(key)
+        self.generation += 1
+
+
+def _capacity(capacity):
+    try:
+        return int(capacity)
+    except (TypeError, ValueError):
+        return None
+
+
+def bumpRooms(capacity=None):
+    """
+    Bump a shared rooms generation, so that every process drops the cached free rooms it covers at its next search.
+
+    The change joins the current write transaction, the caller commits it together with the change of the rooms.
+
+    Args:
+        capacity (int): The capacity of the changed room, as given to SearchCache.roomsChanged. None bumps the
+            generation of every room.
+    """
+    capacity = _capacity(capacity)
+    if capacity is None:
+        name = ROOMS
+    elif capacity < 1:
+        # no entry holds a room too small for a single person
+        return
+    else:
+        name = f"{ROOMS}:{capacityBucket(capacity)}"
+    bumped = db.session.execute(update(CacheGeneration).where(CacheGeneration.name == name)
+                                .values(value=CacheGeneration.value + 1).execution_options(synchronize_session=False))
+    if not bumped.rowcount:
+        db.session.execute(insert(CacheGeneration).values(name=name, value=1))
+
+
+searchCache = SearchCache()
+index.listeners.append(searchCache.bookingChanged)
@@ -37,9 +37,105 @@ application. They are efficient, reliable, and easy to understand and use,
 and can be easily maintained and extended.
 """
 
-from .models import FloorPlan, Room, Building, Seat
+import csv
+import io
+
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from .models import FloorPlan, Room, Building, Seat, Booking
+from .cache import bumpRooms, searchCache
+from .spatial import spatialIndex
+from .storage import beginWrite
+from .versioning import diffVersions, floorRow, latestVersion, recordVersion, roomRow, seatRow
 from . import db
 
+IMPORT_BATCH_SIZE = 1000
+
+# the columns an admin edits, per model
+EDITABLE = {
+    FloorPlan: ("name", "level", "image_file"),
+    Room: ("name", "type", "capacity", "equipment", "x", "y"),
+    Seat: ("label", "x", "y"),
+}
+
+
+class ConflictError(Exception):
+    """
+    A write based on an outdated version of a floor, room or seat.
+
+    Floors, rooms and seats carry a version that every write increments, an update or delete given the version
+    it was based on only applies if it is still the current one (compare-and-swap), so concurrent admins never
+    need a lock and never silently overwrite each other.
+
+    Attributes:
+        current: The current row with its version.
+        fields: The fields changed on both sides, when the changes could not be merged.
+    """
+    def __init__(self, current, fields=()):
+        super().__init__("changed by someone else")
+        self.current = current
+        self.fields = list(fields)
+
+
+def mergeChanges(base, mine, theirs):
+    """
+    Merge two changes of the same row field by field (three-way merge).
+
+    A field changed on one side only takes that change, a field changed to the same value on both sides is no
+    conflict.
+
+    Args:
+        base (dict): The row both changes started from.
+        mine (dict): The row after the change to be written.
+        theirs (dict): The row after the change already written.
+
+    Returns:
+        tuple: The merged row and the list of fields changed differently on both sides, the merge only holds if
+        the list is empty.
+    """
+    merged = {}
+    conflicts = []
+    for field in set(base) | set(mine) | set(theirs):
+        old = base.get(field)
+        new = mine.get(field, old)
+        current = theirs.get(field, old)
+        if new == old or new == current:
+            merged[field] = current
+        elif current == old:
+            merged[field] = new
+        else:
+            merged[field] = current
+            conflicts.append(field)
+    return merged, sorted(conflicts)
+
+
+def currentRow(model, id):
+    """
+    Return the editable columns and the version of a floor, room or seat, None if it does not exist.
+    """
+    row = db.session.query(model.version, *[getattr(model, field) for field in EDITABLE[model]]).filter(model.id == id).first()
+    return None if row is None else row._asdict()
+
+
+def _version(version):
+    # the version a change is based on, as sent by a form or a JSON client
+    try:
+        return int(version)
+    except (TypeError, ValueError):
+        raise ValueError("invalid version")
+
+
+def _checkVersion(model, id, version):
+    # raises the conflict for a delete based on an outdated version
+    if version is not None:
+        current = currentRow(model, id)
+        if current is not None and current["version"] != version:
+            db.session.rollback()
+            raise ConflictError(current)
+
 def createBuilding(Name, Address):
     new_building = Building(name=Name, address=Address)
     try:
@@ -51,12 +147,41 @@ def createBuilding(Name, Address):
         print(e)
         return False
     
-def deleteBuilding(id):
-    building_to_delete = db.session.query(Building).filter_by(id=id).first()  # Replace 'building_id' with the actual ID
+def detachBookings(rooms):
+    """
+    Close the bookings of rooms about to be deleted and detach them from the rooms, in one UPDATE.
+
+    Bookings stay as closed history without a room. The foreign key does the same (ON DELETE SET NULL), but
+    tables created before it still need this, and updated_at lets the availability index of every process drop
+    them.
 
-    if building_to_delete:
-        db.session.delete(building_to_delete)  # Trigger cascade deletion
-        db.session.commit()  # Commit the changes to the database
+    Args:
+        rooms (list): The ids of the rooms, or a select of them.
+    """
+    db.session.execute(
+        update(Booking).where(Booking.room_id.in_(rooms))
+        .values(room_id=None, status="closed", updated_at=datetime.now()).execution_options(synchronize_session=False)
+    )
+
+def _deleteWhere(model, condition, rooms, returning):
+    # one DELETE, the database cascades it to the floors, rooms and seats below;
+    # it joins the write transaction started by the caller
+    detachBookings(rooms)
+    deleted = db.session.execute(
+        delete(model).where(condition).returning(returning).execution_options(synchronize_session=False)
+    ).scalars().all()
+    if deleted:
+        bumpRooms()
+    db.session.commit()
+    db.session.expire_all()
+    return deleted
+
+def deleteBuilding(id):
+    rooms = select(Room.id).join(FloorPlan, Room.floor_plan_id == FloorPlan.id).where(FloorPlan.building_id == id)
+    beginWrite()
+    if _deleteWhere(Building, Building.id == id, rooms, Building.id):
+        searchCache.roomsChanged()
+        spatialIndex.reset()
         return True
     else:
         print("Building not found.")
@@ -69,6 +194,8 @@ def createFloorPlan(building_id, name, level, image):
     new_floor = FloorPlan(building_id=building_id, name=name, level=level, image_file=image)
     try:
         db.session.add(new_floor)
+        db.session.flush()
+        recordVersion(new_floor.id, floor=[None, floorRow(name, level, image)])
         db.session.commit()
 
         return True
@@ -76,49 +203,71 @@ def createFloorPlan(building_id, name, level, image):
         print(e)
         return False
 
-def deleteFloor(id):
-    floor_to_delete = db.session.query(FloorPlan).filter_by(id=id).first()  # Replace 'building_id' with the actual ID
-
-    if floor_to_delete:
-        db.session.delete(floor_to_delete)  # Trigger cascade deletion
-        db.session.commit()  # Commit the changes to the database
+def deleteFloor(id, version=None):
+    if version is not None:
+        version = _version(version)
+    beginWrite()
+    _checkVersion(FloorPlan, id, version)
+    if _deleteWhere(FloorPlan, FloorPlan.id == id, select(Room.id).where(Room.floor_plan_id == id), FloorPlan.id):
+        searchCache.roomsChanged()
+        spatialIndex.reset()
         return True
     else:
         print("Floor not found.")
         return False
 
-def createRoom(floor_plan_id, name, type, capacity, equipment):
+def createRoom(floor_plan_id, name, type, capacity, equipment, x=None, y=None):
     floor = db.session.query(FloorPlan).filter_by(id=floor_plan_id).first()
     if not floor:
         return False
-    new_room = Room(floor_plan_id=floor_plan_id, name=name, type=type, capacity=capacity, equipment=equipment)
+    new_room = Room(floor_plan_id=floor_plan_id, name=name, type=type, capacity=capacity, equipment=equipment, x=x, y=y)
     try:
         db.session.add(new_room)
+        db.session.flush()
+        recordVersion(floor_plan_id, rooms={new_room.id: [None, roomRow(name, type, capacity, equipment, x, y)]})
+        bumpRooms(capacity)
         db.session.commit()
+        searchCache.roomsChanged(capacity)
 
         return True
     except Exception as e:
         print(e)
         return False
 
-def deleteRoom(id):
-    room_to_delete = db.session.query(Room).filter_by(id=id).first()  # Replace 'building_id' with the actual ID
+def deleteRoom(id, version=None):
+    if version is not None:
+        version = _version(version)
+    beginWrite()
+    _checkVersion(Room, id, version)
+    room = db.session.query(Room.floor_plan_id, Room.name, Room.type, Room.capacity, Room.equipment, Room.x, Room.y).filter(Room.id == id).first()
 
-    if room_to_delete:
-        db.session.delete(room_to_delete)  # Trigger cascade deletion
-        db.session.commit()  # Commit the changes to the database
+    if room:
+        seats = db.session.query(Seat.id, Seat.label, Seat.x, Seat.y).filter(Seat.room_id == id).all()
+        detachBookings([id])
+        db.session.execute(delete(Room).where(Room.id == id).execution_options(synchronize_session=False))
+        if room.floor_plan_id is not None:
+            recordVersion(room.floor_plan_id, rooms={id: [roomRow(room.name, room.type, room.capacity, room.equipment, room.x, room.y), None]},
+                          seats={seat.id: [seatRow(int(id), seat.label, seat.x, seat.y), None] for seat in seats})
+        bumpRooms(room.capacity)
+        db.session.commit()
+        db.session.expire_all()
+        searchCache.roomsChanged(room.capacity)
         return True
     else:
+        db.session.rollback()
         print("Room not found.")
         return False
 
-def createSeat(room_id, label):
+def createSeat(room_id, label, x=None, y=None):
     room = db.session.query(Room).filter_by(id=room_id).first()
     if not room:
         return False
-    new_seat = Seat(room_id=room_id, label=label)
+    new_seat = Seat(room_id=room_id, label=label, x=x, y=y)
     try:
         db.session.add(new_seat)
+        db.session.flush()
+        if room.floor_plan_id is not None:
+            recordVersion(room.floor_plan_id, seats={new_seat.id: [None, seatRow(room.id, label, x, y)]})
         db.session.commit()
 
         return True
@@ -126,15 +275,461 @@ def createSeat(room_id, label):
         print(e)
         return False
 
-def deleteSeat(id):
-    seat_to_delete = db.session.query(Seat).filter_by(id=id).first()  # Replace 'building_id' with the actual ID
+def deleteSeat(id, version=None):
+    if version is not None:
+        version = _version(version)
+    beginWrite()
+    _checkVersion(Seat, id, version)
+    seat = db.session.query(Seat.room_id, Seat.label, Seat.x, Seat.y, Room.floor_plan_id).outerjoin(Room, Seat.room_id == Room.id).filter(Seat.id == id).first()
 
-    if seat_to_delete:
-        db.session.delete(seat_to_delete)  # Trigger cascade deletion
-        db.session.commit()  # Commit the changes to the database
+    if seat:
+        db.session.execute(delete(Seat).where(Seat.id == id))
+        if seat.floor_plan_id is not None:
+            recordVersion(seat.floor_plan_id, seats={id: [seatRow(seat.room_id, seat.label, seat.x, seat.y), None]})
+        db.session.commit()
         return True
     else:
+        db.session.rollback()
         print("Seat not found.")
         return False
 
 
+def _floorOf(model, id):
+    if model is FloorPlan:
+        return id
+    if model is Room:
+        return db.session.query(Room.floor_plan_id).filter(Room.id == id).scalar()
+    return db.session.query(Room.floor_plan_id).join(Seat, Seat.room_id == Room.id).filter(Seat.id == id).scalar()
+
+
+def _editable(model, values):
+    # the editable fields of a change, with the types of their columns, checked before anything is written
+    values = {field: values[field] for field in EDITABLE[model] if field in values}
+    for field, value in values.items():
+        if value is None:
+            continue
+        try:
+            if field in ("capacity", "level"):
+                if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+                    raise ValueError
+                values[field] = int(value)
+            elif field in ("x", "y"):
+                if isinstance(value, bool):
+                    raise ValueError
+                values[field] = float(value)
+            elif not isinstance(value, str):
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid {field}")
+    if (values.get("capacity") or 0) < 0:
+        raise ValueError("negative capacity")
+    return values
+
+
+def _update(model, id, values, version=None, base=None):
+    values = _editable(model, values)
+    if base is not None:
+        base = _editable(model, base)
+    if version is not None:
+        version = _version(version)
+    beginWrite()
+    current = currentRow(model, id)
+    if current is None:
+        db.session.rollback()
+        return None
+    before = {field: current[field] for field in EDITABLE[model]}
+    after = {**before, **values}
+    if version is not None and version != current["version"]:
+        if base is None:
+            db.session.rollback()
+            raise ConflictError(current)
+        # changed since the client read it: keep both changes if they touch different fields
+        after, conflicts = mergeChanges({**before, **base}, {**before, **base, **values}, before)
+        if conflicts:
+            db.session.rollback()
+            raise ConflictError(current, conflicts)
+
+    result = db.session.execute(
+        update(model).where(model.id == id, model.version == current["version"])
+        .values(**after, version=model.version + 1).execution_options(synchronize_session=False))
+    if not result.rowcount:
+        db.session.rollback()
+        raise ConflictError(currentRow(model, id))
+
+    floor_plan_id = _floorOf(model, id)
+    if floor_plan_id is not None and after != before:
+        if model is FloorPlan:
+            recordVersion(id, floor=[floorRow(**before), floorRow(**after)])
+        elif model is Room:
+            recordVersion(floor_plan_id, rooms={id: [roomRow(**before), roomRow(**after)]})
+        else:
+            room_id = db.session.query(Seat.room_id).filter(Seat.id == id).scalar()
+            recordVersion(floor_plan_id, seats={id: [seatRow(room_id, **before), seatRow(room_id, **after)]})
+    # the search cache holds the rooms with the level of their floor
+    capacity = min(before["capacity"] or 0, after["capacity"] or 0) if model is Room else None
+    if model is not Seat and after != before:
+        bumpRooms(capacity)
+    db.session.commit()
+    db.session.expire_all()
+    if model is not Seat and after != before:
+        searchCache.roomsChanged(capacity)
+    return {**after, "version": current["version"] + 1}
+
+
+def updateFloorPlan(id, values, version=None, base=None):
+    """
+    Change the name, level or image of a floor, if it is still at the given version.
+
+    Args:
+        id (int): The id of the floor plan.
+        values (dict): The changed fields.
+        version (int): The version the change is based on, None to overwrite whatever is current.
+        base (dict): The fields as they were read at that version; if given, a change based on an outdated version
+            is merged with the current row (see mergeChanges) instead of being rejected when they touch different
+            fields.
+
+    Returns:
+        dict: The updated row with its new version, None if the floor does not exist.
+
+    Raises:
+        ConflictError: If the floor changed since the version and the changes could not be merged.
+    """
+    return _update(FloorPlan, id, values, version, base)
+
+
+def updateRoom(id, values, version=None, base=None):
+    """
+    Change the name, type, capacity or equipment of a room, if it is still at the given version.
+
+    See updateFloorPlan for the arguments, the result and the conflicts.
+    """
+    return _update(Room, id, values, version, base)
+
+
+def updateSeat(id, values, version=None, base=None):
+    """
+    Change the label of a seat, if it is still at the given version.
+
+    See updateFloorPlan for the arguments, the result and the conflicts.
+    """
+    return _update(Seat, id, values, version, base)
+
+
+def _restoredRooms(seats, room_ids, skipped):
+    # points the restored seats to the new id of their re-inserted room, and drops (into skipped) the ones
+    # whose room is gone, the foreign key would reject them
+    rooms = {room_ids.get(after["room_id"], after["room_id"]) for before, after in seats.values() if after is not None}
+    present = set(db.session.scalars(select(Room.id).where(Room.id.in_(rooms)))) if rooms else set()
+    for key, (before, after) in list(seats.items()):
+        if after is None:
+            continue
+        room_id = room_ids.get(after["room_id"], after["room_id"])
+        if room_id not in present:
+            skipped.append(int(key))
+            del seats[key]
+        else:
+            seats[key] = [before, {**after, "room_id": room_id}]
+
+
+def restoreFloorPlan(id, version):
+    """
+    Bring a floor back to one of its versions, recorded as a new version.
+
+    Only the diff from the latest version is written: rooms and seats missing from the old version are deleted
+    (their bookings are kept as closed history), removed ones are inserted again, with their old id when it is
+    still free, and changed ones are updated. A seat whose room is neither restored nor still there is skipped.
+
+    Args:
+        id (int): The id of the floor plan.
+        version (int): The number of the version to restore.
+
+    Returns:
+        dict: The number of the new "version" and the ids of the "skipped_seats", None if the version does not exist.
+    """
+    beginWrite()
+    latest = latestVersion(id)
+    delta = diffVersions(id, latest, version)
+    if delta is None:
+        db.session.rollback()
+        return None
+    if not delta.get("floor") and not delta["rooms"] and not delta["seats"]:
+        db.session.rollback()
+        return {"version": latest, "skipped_seats": []}
+
+    if "floor" in delta and delta["floor"][1] is not None:
+        db.session.execute(update(FloorPlan).where(FloorPlan.id == id).values(**delta["floor"][1], version=FloorPlan.version + 1))
+
+    changes = {}
+    room_ids = {}
+    skipped = []
+    for model, kind in ((Room, "rooms"), (Seat, "seats")):
+        if model is Seat:
+            _restoredRooms(delta[kind], room_ids, skipped)
+        removed = [int(key) for key, (before, after) in delta[kind].items() if after is None]
+        if removed:
+            if model is Room:
+                detachBookings(removed)
+            db.session.execute(delete(model).where(model.id.in_(removed)).execution_options(synchronize_session=False))
+        for key, (before, after) in delta[kind].items():
+            if before is not None and after is not None:
+                db.session.execute(update(model).where(model.id == int(key)).values(**after, version=model.version + 1)
+                                   .execution_options(synchronize_session=False))
+        changes[kind] = {int(key): change for key, change in delta[kind].items() if change[0] is not None}
+
+        added = {int(key): after for key, (before, after) in delta[kind].items() if before is None}
+        taken = set(db.session.scalars(select(model.id).where(model.id.in_(added)))) if added else set()
+        for key, row in added.items():
+            values = dict(row)
+            if model is Room:
+                values["floor_plan_id"] = id
+            if key not in taken:
+                values["id"] = key
+            new_id = db.session.execute(insert(model).values(**values).returning(model.id)).scalar()
+            if model is Room:
+                room_ids[key] = new_id
+            changes[kind][new_id] = [None, row if model is Room else seatRow(values["room_id"], values["label"], values.get("x"), values.get("y"))]
+
+    new_version = recordVersion(id, floor=delta.get("floor"), rooms=changes["rooms"], seats=changes["seats"])
+    bumpRooms()
+    db.session.commit()
+    db.session.expire_all()
+    searchCache.roomsChanged()
+    return {"version": new_version, "skipped_seats": skipped}
+
+
+def _integer(value, default=None):
+    if value is None or value == "":
+        if default is None:
+            raise ValueError("missing value")
+        return default
+    try:
+        return int(value)
+    except TypeError:
+        raise ValueError(f"not a number: {value!r}") from None
+
+
+def _position(row):
+    x, y = row.get("x"), row.get("y")
+    if x in (None, "") and y in (None, ""):
+        return None, None
+    if x in (None, "") or y in (None, ""):
+        raise ValueError("x and y go together")
+    try:
+        return float(x), float(y)
+    except TypeError:
+        raise ValueError("x and y must be numbers") from None
+
+
+def _entries(parent, key, path, kind, errors):
+    # the (index, entry) pairs of a list of objects, anything else is reported instead of failing the import
+    entries = parent.get(key, [])
+    if not isinstance(entries, list):
+        errors.append({"row": parent.get("row", path or None), "error": f"{key} must be a list"})
+        return []
+    prefix = f"{path}.{key}" if path else key
+    valid = []
+    for i, entry in enumerate(entries):
+        if isinstance(entry, dict):
+            valid.append((i, entry))
+        else:
+            errors.append({"row": f"{prefix}[{i}]", "error": f"a {kind} must be an object"})
+    return valid
+
+
+def parseFloorPlanCSV(text):
+    """
+    Turn a flat CSV export into the building -> floors -> rooms -> seats hierarchy taken by importHierarchy.
+
+    Every line describes one seat with all of its parents, using the columns building_name, building_address,
+    floor_name, floor_level, floor_image, room_name, room_type, room_capacity, room_equipment and seat_label, and
+    optionally room_x, room_y, seat_x and seat_y for the positions.
+    Lines with an empty seat_label (or room_name, floor_name) only declare their parents.
+
+    Args:
+        text (str): The CSV content, with a header line.
+
+    Returns:
+        tuple: The hierarchy as a dictionary and the list of per-line errors.
+    """
+    buildings = {}
+    errors = []
+    for line, row in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+        row = {key: (value or "").strip() for key, value in row.items() if key}
+        where = f"line {line}"
+        if not row.get("building_name"):
+            errors.append({"row": where, "error": "missing building_name"})
+            continue
+        building = buildings.setdefault(row["building_name"], {
+            "name": row["building_name"], "address": row.get("building_address"), "floors": {}, "row": where})
+        if not row.get("floor_name"):
+            continue
+        floor = building["floors"].setdefault(row["floor_name"], {
+            "name": row["floor_name"], "level": row.get("floor_level"), "image_file": row.get("floor_image"),
+            "rooms": {}, "row": where})
+        if not row.get("room_name"):
+            continue
+        room = floor["rooms"].setdefault(row["room_name"], {
+            "name": row["room_name"], "type": row.get("room_type"), "capacity": row.get("room_capacity"),
+            "equipment": row.get("room_equipment"), "x": row.get("room_x"), "y": row.get("room_y"), "seats": [], "row": where})
+        if row.get("seat_label"):
+            room["seats"].append({"label": row["seat_label"], "x": row.get("seat_x"), "y": row.get("seat_y"), "row": where})
+
+    for building in buildings.values():
+        building["floors"] = list(building["floors"].values())
+        for floor in building["floors"]:
+            floor["rooms"] = list(floor["rooms"].values())
+    return {"buildings": list(buildings.values())}, errors
+
+
+def _insertBatches(model, rows, progress, done, total):
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        batch = rows[start:start + IMPORT_BATCH_SIZE]
+        values = [row["values"] for row in batch]
+        ids = db.session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), values).all()
+        for row, id in zip(batch, ids):
+            row["id"] = id
+        done += len(batch)
+        if progress:
+            progress(done, total)
+    return done
+
+
+def _recordImportedFloors(floors, rooms, seats):
+    # the first version of an imported floor is built from the inserted rows instead of reading them back
+    states = {}
+    for row in floors:
+        values = row["values"]
+        states[row["id"]] = {"floor": floorRow(values["name"], values["level"], values["image_file"]), "rooms": {}, "seats": {}}
+    for row in rooms:
+        values = row["values"]
+        states[values["floor_plan_id"]]["rooms"][str(row["id"])] = roomRow(values["name"], values["type"], values["capacity"],
+                                                                           values["equipment"], values["x"], values["y"])
+    for row in seats:
+        values = row["values"]
+        states[row["parent"]["values"]["floor_plan_id"]]["seats"][str(row["id"])] = seatRow(values["room_id"], values["label"], values["x"], values["y"])
+    for floor_plan_id, state in states.items():
+        recordVersion(floor_plan_id, snapshot=state)
+
+
+def importHierarchy(data, progress=None):
+    """
+    Insert a whole building -> floors -> rooms -> seats hierarchy in one transaction.
+
+    Parents are validated in memory instead of being re-queried for every child: an entry with invalid fields is
+    reported and skipped together with its children. Buildings that already exist (by name) are reused, so
+    floors can be added to them. Every level is then inserted with batched executemany statements.
+
+    Args:
+        data (dict): The hierarchy, {"buildings": [{"name", "address", "floors": [{"name", "level",
+            "image_file", "rooms": [{"name", "type", "capacity", "equipment", "seats": [{"label"}]}]}]}]}.
+            Seats may also be given as plain labels.
+        progress (callable): Called with (inserted rows, total rows) after every batch.
+
+    Returns:
+        dict: The number of inserted "buildings", "floors", "rooms" and "seats", and the list of per-row "errors".
+    """
+    errors = []
+    buildings, floors, rooms, seats = [], [], [], []
+    if not isinstance(data, dict):
+        errors.append({"row": None, "error": "the import must be an object with a buildings list"})
+        return {"buildings": 0, "floors": 0, "rooms": 0, "seats": 0, "errors": errors}
+
+    existing = {name: (id, address) for id, name, address in db.session.query(Building.id, Building.name, Building.address)}
+    addresses = {address: name for name, (id, address) in existing.items()}
+    seen = set()
+
+    for b, building in _entries(data, "buildings", "", "building", errors):
+        where = building.get("row", f"buildings[{b}]")
+        name = building.get("name")
+        if not name or not isinstance(name, str):
+            errors.append({"row": where, "error": "missing building name"})
+            continue
+        if name in seen:
+            errors.append({"row": where, "error": f"duplicate building {name}"})
+            continue
+        seen.add(name)
+        if name in existing:
+            parent = {"id": existing[name][0]}
+        else:
+            address = building.get("address")
+            if not address or not isinstance(address, str) or addresses.get(address, name) != name:
+                errors.append({"row": where, "error": f"missing or already used address {address}"})
+                continue
+            addresses[address] = name
+            parent = {"values": {"name": name, "address": address}}
+            buildings.append(parent)
+
+        for f, floor in _entries(building, "floors", f"buildings[{b}]", "floor", errors):
+            where = floor.get("row", f"buildings[{b}].floors[{f}]")
+            try:
+                level = _integer(floor.get("level"), 0)
+            except ValueError as e:
+                errors.append({"row": where, "error": f"invalid level: {e}"})
+                continue
+            floor_row = {"parent": parent, "values": {"name": floor.get("name"), "level": level, "image_file": floor.get("image_file")}}
+            floors.append(floor_row)
+
+            for r, room in _entries(floor, "rooms", f"buildings[{b}].floors[{f}]", "room", errors):
+                where = room.get("row", f"buildings[{b}].floors[{f}].rooms[{r}]")
+                try:
+                    capacity = _integer(room.get("capacity"))
+                    if capacity < 0:
+                        raise ValueError("negative capacity")
+                except ValueError as e:
+                    errors.append({"row": where, "error": f"invalid capacity: {e}"})
+                    continue
+                try:
+                    x, y = _position(room)
+                except ValueError as e:
+                    errors.append({"row": where, "error": f"invalid position: {e}"})
+                    continue
+                room_row = {"parent": floor_row, "values": {"name": room.get("name"), "type": room.get("type"),
+                                                            "capacity": capacity, "equipment": room.get("equipment"),
+                                                            "x": x, "y": y}}
+                rooms.append(room_row)
+
+                seat_list = room.get("seats", [])
+                if not isinstance(seat_list, list):
+                    errors.append({"row": where, "error": "seats must be a list"})
+                    seat_list = []
+                for s, seat in enumerate(seat_list):
+                    if not isinstance(seat, (dict, str, int)):
+                        errors.append({"row": f"buildings[{b}].floors[{f}].rooms[{r}].seats[{s}]",
+                                       "error": "a seat must be an object or a label"})
+                        continue
+                    label = seat.get("label") if isinstance(seat, dict) else seat
+                    try:
+                        x, y = _position(seat) if isinstance(seat, dict) else (None, None)
+                    except ValueError as e:
+                        errors.append({"row": seat.get("row", where), "error": f"invalid position: {e}"})
+                        continue
+                    seats.append({"parent": room_row, "values": {"label": label, "x": x, "y": y}})
+
+    total = len(buildings) + len(floors) + len(rooms) + len(seats)
+    db.session.rollback()
+    try:
+        beginWrite()
+        done = _insertBatches(Building, buildings, progress, 0, total)
+        for row in floors:
+            row["values"]["building_id"] = row["parent"]["id"]
+        done = _insertBatches(FloorPlan, floors, progress, done, total)
+        for row in rooms:
+            row["values"]["floor_plan_id"] = row["parent"]["id"]
+        done = _insertBatches(Room, rooms, progress, done, total)
+        for row in seats:
+            row["values"]["room_id"] = row["parent"]["id"]
+        _insertBatches(Seat, seats, progress, done, total)
+        _recordImportedFloors(floors, rooms, seats)
+        capacity = min(row["values"]["capacity"] for row in rooms) if rooms else None
+        if rooms:
+            bumpRooms(capacity)
+        db.session.commit()
+        if rooms:
+            searchCache.roomsChanged(capacity)
+    except (SQLAlchemyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        print(e)
+        errors.append({"row": None, "error": str(e)})
+        return {"buildings": 0, "floors": 0, "rooms": 0, "seats": 0, "errors": errors}
+
+    return {"buildings": len(buildings), "floors": len(floors), "rooms": len(rooms), "seats": len(seats), "errors": errors}
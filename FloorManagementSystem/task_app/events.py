@@ -0,0 +1,96 @@
+"""
+This module pushes the results of Celery tasks to the browser.
+
+The Redis result backend publishes every stored result on the channel
+"celery-task-meta-<task id>". Instead of letting every browser poll
+/result/<id>, each web process opens a single pattern subscription on those
+channels and hands the results to the Server-Sent Events streams waiting for
+them (see views.events).
+
+Classes:
+    ResultListener: The per-process subscription fanning results out to the waiting streams.
+"""
+import os
+import queue
+import threading
+
+from celery.backends.redis import RedisBackend
+
+CHANNEL_PREFIX = "celery-task-meta-"
+
+
+class ResultListener:
+    """
+    A single Redis subscription per process on the task result channels.
+
+    Streams register the task id they wait for, the listener thread puts the
+    decoded result into their queue as soon as the worker stores it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._thread = None
+        self._pid = None
+
+    def _start(self, backend):
+        # a thread does not survive a fork, so every worker process starts its own
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            pubsub = backend.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(CHANNEL_PREFIX + "*")
+            self._thread = threading.Thread(target=self._listen, args=(backend, pubsub), daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _listen(self, backend, pubsub):
+        for message in pubsub.listen():
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            task_id = channel[len(CHANNEL_PREFIX):]
+            with self._lock:
+                waiters = self._waiters.get(task_id)
+                if not waiters:
+                    continue
+                waiters = list(waiters)
+            meta = backend.decode_result(message["data"])
+            if meta["status"] not in backend.READY_STATES:
+                continue
+            for waiter in waiters:
+                # the thread is shared by every stream, it never waits for one: a waiter only needs the
+                # first ready result, another one for the same task is dropped
+                try:
+                    waiter.put_nowait(meta)
+                except queue.Full:
+                    pass
+
+    def subscribe(self, backend, task_id):
+        """
+        Register interest in the result of a task.
+
+        Args:
+            backend (celery.backends.base.Backend): The result backend of the Celery app.
+            task_id (str): The id of the task.
+
+        Returns:
+            queue.Queue: The queue receiving the result meta, None if the backend cannot push results.
+        """
+        if not isinstance(backend, RedisBackend):
+            return None
+        self._start(backend)
+        waiter = queue.Queue(maxsize=1)
+        with self._lock:
+            self._waiters.setdefault(task_id, []).append(waiter)
+        return waiter
+
+    def unsubscribe(self, task_id, waiter):
+        with self._lock:
+            waiters = self._waiters.get(task_id, [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop(task_id, None)
+
+
+listener = ResultListener()
@@ -0,0 +1,73 @@
+"""
+This module runs read-only tasks inside the web process.
+
+A search is a single read query, the trip through the broker, a worker and the
+result backend costs far more than the query itself. With SEARCH_EXECUTION set
+to "inline", views.search runs the task on a small thread pool of the web
+process and answers the POST with the result directly. Writes (bookRoom,
+cancel, imports) always go through Celery.
+
+The pool is bounded: when every slot is busy, submit() returns None and the
+caller falls back to Celery, so a burst of searches can not pile up in the web
+process. A task that is slow to answer is only sent to Celery if it can still
+be cancelled, i.e. it has not started on the pool yet. A slot is given back
+when the future is done, whether the task ran, failed or was cancelled.
+
+Classes:
+    InlineExecutor: The bounded thread pool running tasks in the web process.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InlineExecutor:
+    """
+    A bounded thread pool running Celery tasks in the web process, inside an application context.
+
+    Attributes:
+        workers: The number of tasks that can run at the same time.
+    """
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(workers)
+
+    def configure(self, workers):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            self.workers = workers
+            self._slots = threading.BoundedSemaphore(workers)
+
+    @staticmethod
+    def _run(app, task, args):
+        with app.app_context():
+            return task.run(*args)
+
+    def submit(self, app, task, *args):
+        """
+        Run a task on the pool.
+
+        Args:
+            app (flask.Flask): The application whose context the task runs in.
+            task (celery.Task): The task, its run method is called directly.
+            args: The arguments of the task.
+
+        Returns:
+            concurrent.futures.Future: The future of the task result, None if every slot is busy.
+        """
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inline-task")
+            future = self._pool.submit(self._run, app, task, args)
+        # the callback also runs for a future cancelled before it started, which never runs _run
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+
+executor = InlineExecutor()
@@ -0,0 +1,426 @@
+"""
+This module instruments the web requests, the Celery tasks and the database.
+
+It records, per route and per task:
+    - the latency (fms_http_request_duration_seconds, fms_task_duration_seconds),
+    - the number of SQL statements and the time spent in them (fms_*_queries, fms_*_query_seconds),
+and also the time a task waited in its queue (fms_task_queue_wait_seconds) and
+the retries of writes that found the database locked (fms_db_lock_retries_total).
+
+Everything is exposed in the Prometheus text format at /metrics. Each process
+keeps its own registry and publishes a snapshot of it to METRICS_DIR, every
+FLUSH_INTERVAL seconds while it records anything and once more at exit (see
+Publisher). /metrics adds up the snapshots of the same node, so the task
+metrics of the Celery workers and those of the other web processes are visible
+from any web process. A snapshot is named after the pid of its process and a
+token drawn when the process starts publishing: the snapshots of dead
+processes are removed when /metrics is read, and a process reusing the pid of
+a dead one replaces its snapshot. Requests slower than SLOW_REQUEST_MS are
+logged with their query count.
+
+Classes:
+    Histogram: A labelled histogram.
+    Counter: A labelled counter.
+    Registry: The metrics of a process.
+    Publisher: The thread writing the snapshots of the registry of a process.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from celery import signals
+from flask import Flask, Response, g, request
+from sqlalchemy import event
+
+from . import db
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+# seconds between two snapshots of a process recording metrics
+FLUSH_INTERVAL = 1.0
+
+# the SQL statistics of the request or task running in this context
+_scope = ContextVar("metrics_scope", default=None)
+
+
+class Histogram:
+    """
+    A labelled histogram.
+
+    Attributes:
+        name: The metric name.
+        help: The description of the metric.
+        labels: The names of the labels.
+        buckets: The upper bounds of the buckets.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def empty(self):
+        return Histogram(self.name, self.help, self.labels, self.buckets)
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["buckets"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def merge(self, labels, other):
+        series = self.series.setdefault(labels, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        series["buckets"] = [a + b for a, b in zip(series["buckets"], other["buckets"])]
+        series["sum"] += other["sum"]
+        series["count"] += other["count"]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items(), key=lambda item: str(item[0])):
+            for bound, count in zip(self.buckets, series["buckets"]):
+                lines.append(_sample(f"{self.name}_bucket", self.labels + ("le",), labels + (bound,), count))
+            lines.append(_sample(f"{self.name}_bucket", self.labels + ("le",), labels + ("+Inf",), series["count"]))
+            lines.append(_sample(f"{self.name}_sum", self.labels, labels, series["sum"]))
+            lines.append(_sample(f"{self.name}_count", self.labels, labels, series["count"]))
+        return lines
+
+
+class Counter:
+    """
+    A labelled counter.
+
+    Attributes:
+        name: The metric name.
+        help: The description of the metric.
+        labels: The names of the labels.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def empty(self):
+        return Counter(self.name, self.help, self.labels)
+
+    def inc(self, labels=(), value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def merge(self, labels, other):
+        self.series[labels] = self.series.get(labels, 0) + other
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items(), key=lambda item: str(item[0])):
+            lines.append(_sample(self.name, self.labels, labels, value))
+        return lines
+
+
+def _sample(name, names, values, value):
+    if not names:
+        return f"{name} {value}"
+    labels = ",".join(f'{label}="{v!s}"' for label, v in zip(names, values))
+    return f"{name}{{{labels}}} {value}"
+
+
+class Registry:
+    """
+    The metrics of a process.
+
+    Attributes:
+        metrics: The metrics by name.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        # bumped by every observation, a snapshot is only written when it moved
+        self.changes = 0
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {name: [[list(labels), series] for labels, series in metric.series.items()]
+                    for name, metric in self.metrics.items()}
+
+    def render(self, snapshots=()):
+        merged = Registry()
+        with self.lock:
+            for metric in self.metrics.values():
+                copy = merged.add(metric.empty())
+                for labels, series in metric.series.items():
+                    copy.merge(labels, series)
+        for snapshot in snapshots:
+            for name, series_list in snapshot.items():
+                if name in merged.metrics:
+                    for labels, series in series_list:
+                        merged.metrics[name].merge(tuple(labels), series)
+        lines = []
+        for metric in merged.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+requestDuration = registry.add(Histogram("fms_http_request_duration_seconds", "Latency of the web requests.", ("route", "method", "status")))
+requestQueries = registry.add(Histogram("fms_http_request_queries", "SQL statements per web request.", ("route",), QUERY_BUCKETS))
+requestQueryTime = registry.add(Histogram("fms_http_request_query_seconds", "Time spent in SQL per web request.", ("route",)))
+taskDuration = registry.add(Histogram("fms_task_duration_seconds", "Run time of the tasks.", ("task", "state")))
+taskQueries = registry.add(Histogram("fms_task_queries", "SQL statements per task.", ("task",), QUERY_BUCKETS))
+taskQueryTime = registry.add(Histogram("fms_task_query_seconds", "Time spent in SQL per task.", ("task",)))
+queueWait = registry.add(Histogram("fms_task_queue_wait_seconds", "Time between enqueueing a task and its start.", ("task",)))
+lockRetries = registry.add(Counter("fms_db_lock_retries_total", "Writes retried because the database was locked."))
+slowRequests = registry.add(Counter("fms_slow_requests_total", "Web requests slower than SLOW_REQUEST_MS.", ("route",)))
+
+
+def observe(metric, labels, value):
+    with registry.lock:
+        metric.observe(labels, value)
+        registry.changes += 1
+    publisher.start()
+
+
+def increment(counter, labels=(), value=1):
+    with registry.lock:
+        counter.inc(labels, value)
+        registry.changes += 1
+    publisher.start()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists, it belongs to another user
+        return True
+    return True
+
+
+class Publisher:
+    """
+    The thread writing the snapshot of the registry of this process to the metrics directory.
+
+    Attributes:
+        directory: The metrics directory, METRICS_DIR.
+        interval: The seconds between two snapshots.
+    """
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.directory = None
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._token = None
+        self._flushed = None
+
+    def configure(self, directory):
+        with self._lock:
+            self.directory = directory
+
+    def path(self):
+        return os.path.join(self.directory, f"{self._pid}-{self._token}.json")
+
+    def start(self):
+        """
+        Start publishing the snapshots of this process, unless it already does.
+        """
+        if self._pid == os.getpid() or self.directory is None:
+            return
+        with self._lock:
+            # a thread does not survive a fork, so every process starts its own
+            if self._pid == os.getpid():
+                return
+            self._pid, self._token, self._flushed = os.getpid(), uuid.uuid4().hex[:12], None
+            threading.Thread(target=self._run, args=(self._pid,), daemon=True, name="metrics-publisher").start()
+            atexit.register(self.flush)
+
+    def _run(self, pid):
+        while self._pid == pid:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """
+        Write the snapshot of the registry of this process, if anything was recorded since the previous one.
+        """
+        with self._lock:
+            if self._pid != os.getpid() or self.directory is None:
+                return
+            with registry.lock:
+                changes = registry.changes
+            if changes == self._flushed:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.path()
+            for name in os.listdir(self.directory):
+                # left by a dead process that had the same pid
+                if name.startswith(f"{self._pid}-") and name.endswith(".json") and name != os.path.basename(path):
+                    _remove(os.path.join(self.directory, name))
+            with open(path + ".tmp", "w") as file:
+                json.dump(registry.snapshot(), file)
+            os.replace(path + ".tmp", path)
+            self._flushed = changes
+
+    def snapshots(self):
+        """
+        Read the snapshots of the other live processes, removing those of the dead ones.
+
+        Returns:
+            list: The snapshots.
+        """
+        snapshots = []
+        if self.directory is None or not os.path.isdir(self.directory):
+            return snapshots
+        for name in os.listdir(self.directory):
+            pid, _, rest = name.removesuffix(".json").partition("-")
+            if not name.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            path = os.path.join(self.directory, name)
+            if not rest or not _alive(int(pid)):
+                _remove(path)
+                continue
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+publisher = Publisher()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    scope = _scope.get()
+    if scope is not None:
+        scope["queries"] += 1
+        scope["query_seconds"] += time.perf_counter() - started
+
+
+def _handle_error(context):
+    # a failing statement never reaches after_cursor_execute
+    if context.connection is not None and context.execution_context is not None:
+        started = context.connection.info.get("metrics_started")
+        if started:
+            started.pop()
+
+
+def metrics_init_app(app: Flask) -> None:
+    """
+    This function instruments the given flask application, its database engine and its celery tasks.
+
+    Args:
+        app (Flask): The flask application.
+    """
+    metrics_dir = app.config.get("METRICS_DIR") or os.path.join(app.instance_path, "metrics")
+    slow_ms = app.config.get("SLOW_REQUEST_MS")
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(db.engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(db.engine, "handle_error", _handle_error)
+    publisher.configure(metrics_dir)
+
+    @app.before_request
+    def start_request():
+        g.metrics_started = time.perf_counter()
+        g.metrics_token = _scope.set({"queries": 0, "query_seconds": 0.0})
+
+    @app.after_request
+    def end_request(response):
+        if "metrics_started" not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_started
+        scope = _scope.get()
+        _scope.reset(g.metrics_token)
+        route = request.endpoint or "unmatched"
+        observe(requestDuration, (route, request.method, response.status_code), elapsed)
+        observe(requestQueries, (route,), scope["queries"])
+        observe(requestQueryTime, (route,), scope["query_seconds"])
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            increment(slowRequests, (route,))
+            app.logger.warning("slow request %s %s: %.1f ms, %d queries in %.1f ms", request.method, request.path,
+                               elapsed * 1000, scope["queries"], scope["query_seconds"] * 1000)
+        return response
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(registry.render(publisher.snapshots()), mimetype="text/plain; version=0.0.4")
+
+    _instrument_celery()
+
+
+_celery_connected = False
+
+
+def _instrument_celery():
+    global _celery_connected
+    if _celery_connected:
+        return
+    _celery_connected = True
+    state = threading.local()
+
+    @signals.before_task_publish.connect(weak=False)
+    def stamp(headers=None, **kwargs):
+        if headers is not None:
+            headers["fms_enqueued_at"] = time.time()
+
+    @signals.task_prerun.connect(weak=False)
+    def prerun(task=None, **kwargs):
+        enqueued = getattr(task.request, "fms_enqueued_at", None) or (task.request.headers or {}).get("fms_enqueued_at")
+        if enqueued:
+            observe(queueWait, (task.name,), max(time.time() - enqueued, 0.0))
+        state.started = time.perf_counter()
+        state.token = _scope.set({"queries": 0, "query_seconds": 0.0})
+
+    @signals.task_postrun.connect(weak=False)
+    def postrun(task=None, **kwargs):
+        if getattr(state, "token", None) is None:
+            return
+        scope = _scope.get()
+        _scope.reset(state.token)
+        state.token = None
+        observe(taskDuration, (task.name, kwargs.get("state") or "UNKNOWN"), time.perf_counter() - state.started)
+        observe(taskQueries, (task.name,), scope["queries"])
+        observe(taskQueryTime, (task.name,), scope["query_seconds"])
+
+    @signals.worker_process_init.connect(weak=False)
+    def worker_process(**kwargs):
+        # the series inherited from the parent are published by the parent
+        with registry.lock:
+            for metric in registry.metrics.values():
+                metric.series = {}
+
+    @signals.worker_process_shutdown.connect(weak=False)
+    def worker_exit(**kwargs):
+        # pool processes may exit without running the atexit handlers
+        publisher.flush()
@@ -8,6 +8,11 @@ Classes:
     Building: A class that represents a building in the event space.
     User: A class that represents a user in the system.
     Booking: A class that represents a booking in the system.
+    RoomPreference: A class that represents how much a user prefers a room, based on their past bookings.
+    FloorPlanVersion: A class that represents a version of a floor plan, its rooms and seats.
+    SyncOperation: A class that represents an operation applied by the offline sync of an admin client.
+    SchemaVersion: A class that records the version of the schema the database was created with.
+    CacheGeneration: A class that represents a counter shared by the processes to invalidate their caches.
 
 Relationships:
     FloorPlan.rooms: A relationship that connects FloorPlan to Room.
@@ -21,7 +26,7 @@ Relationships:
 from . import db
 from flask_login import UserMixin
 from sqlalchemy.sql import func
-from sqlalchemy import DateTime, Column, String, Integer, ForeignKey
+from sqlalchemy import Date, DateTime, Column, String, Integer, Float, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from datetime import timedelta, datetime
 # from geoalchemy2 import Geometry
@@ -39,17 +44,19 @@ class FloorPlan(db.Model):
         image_file: The file name of the image of the FloorPlan.
         created_at: The datetime when the FloorPlan was created.
         updated_at: The datetime when the FloorPlan was last updated.
+        version: The number of writes of the FloorPlan row, checked by every update and delete (see databaseControl).
         rooms: A relationship that connects FloorPlan to Room.
     """
     __tablename__ = 'floor_plans'
     id = Column(Integer, primary_key=True)
-    building_id = Column(Integer, ForeignKey('buildings.id', ondelete='CASCADE'))
+    building_id = Column(Integer, ForeignKey('buildings.id', ondelete='CASCADE'), index=True)
     name = Column(String)
     level = Column(Integer, default=0)
     image_file = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    rooms = relationship("Room", backref="floor_plan", cascade="all, delete-orphan")
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    rooms = relationship("Room", backref="floor_plan", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Room(db.Model):
@@ -63,18 +70,24 @@ class Room(db.Model):
         type: The type of the Room (e.g., lecture hall, workshop room).
         capacity: The capacity of the Room.
         equipment: The equipment available in the Room.
+        x: The horizontal position of the Room on its floor plan, if known.
+        y: The vertical position of the Room on its floor plan, if known.
+        version: The number of writes of the Room row, checked by every update and delete (see databaseControl).
         seats: A relationship that connects Room to Seat.
         bookings: A relationship that connects Room to Booking.
     """
     __tablename__ = 'rooms'
     id = Column(Integer, primary_key=True)
-    floor_plan_id = Column(Integer, ForeignKey('floor_plans.id', ondelete='CASCADE'))
+    floor_plan_id = Column(Integer, ForeignKey('floor_plans.id', ondelete='CASCADE'), index=True)
     name = Column(String)
     type = Column(String)
     capacity = Column(Integer)
     equipment = Column(String)
-    seats = relationship("Seat", backref="room", cascade="all, delete-orphan")
-    bookings = relationship("Booking", backref="room")
+    x = Column(Float)
+    y = Column(Float)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    seats = relationship("Seat", backref="room", cascade="all, delete-orphan", passive_deletes=True)
+    bookings = relationship("Booking", backref="room", passive_deletes=True)
 
 
 class Seat(db.Model):
@@ -85,11 +98,17 @@ class Seat(db.Model):
         id: The primary key of the Seat.
         room_id: The foreign key to the Room that the Seat belongs to.
         label: The label of the Seat.
+        x: The horizontal position of the Seat on its floor plan, if known.
+        y: The vertical position of the Seat on its floor plan, if known.
+        version: The number of writes of the Seat row, checked by every update and delete (see databaseControl).
     """
     __tablename__ = 'seats'
     id = Column(Integer, primary_key=True)
-    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'))
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'), index=True)
     label = Column(String)
+    x = Column(Float)
+    y = Column(Float)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
 
 class Building(db.Model):
@@ -110,7 +129,7 @@ class Building(db.Model):
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True)
     address = Column(String, unique=True)
-    floor_plans = relationship("FloorPlan", backref="building", cascade="all, delete-orphan")
+    floor_plans = relationship("FloorPlan", backref="building", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class User(db.Model, UserMixin):
@@ -138,23 +157,210 @@ class Booking(db.Model):
 
     Attributes:
         id: The primary key of the Booking.
-        room_id: The foreign key to the Room that the Booking is for.
+        room_id: The foreign key to the Room that the Booking is for, NULL once the Room was deleted.
         user_id: The foreign key to the User that made the Booking.
         people_count: The number of people in the Booking.
         start_time: The start time of the Booking.
         end_time: The end time of the Booking.
         purpose: The purpose of the Booking.
+        status: The status of the Booking ("open" or "closed"), closed by a cancellation or once it ended.
+        updated_at: The datetime when the Booking was last inserted or changed, used to sync the availability index.
     """
     __tablename__ = 'bookings'
     __table_args__ = (
         # this can be db.PrimaryKeyConstraint if you want it to be a primary key
         db.UniqueConstraint('room_id', 'user_id', 'start_time', 'end_time'),
+        # serves the overlap check of bookRoom without touching other rooms or closed bookings
+        db.Index('ix_bookings_room_status_time', 'room_id', 'status', 'start_time', 'end_time'),
+        # serves the activity feed, the open and the closed bookings of a user are each one range in start_time order
+        db.Index('ix_bookings_user_status_time', 'user_id', 'status', 'start_time'),
+        # serves the expiry sweep, the open bookings that already ended are the start of one range
+        db.Index('ix_bookings_status_end', 'status', 'end_time'),
+        # ids are never handed out twice, an archived booking keeps its id (see tasks.archiveBookings)
+        {'sqlite_autoincrement': True},
       )
     id = Column(Integer, primary_key=True)
-    room_id = Column(Integer, ForeignKey('rooms.id'))
+    # bookings outlive their room as history, databaseControl closes them before the room is deleted
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='SET NULL'))
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
     people_count = Column(Integer, default=1)
     start_time = Column(DateTime(timezone=True), server_default=func.now())
     end_time = Column(DateTime(timezone=True), default=datetime.now()+timedelta(hours=1))
     purpose = Column(String, default="")
-    status = Column(String, default="open")
\ No newline at end of file
+    status = Column(String, default="open")
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+
+
+class BookingArchive(db.Model):
+    """
+    A class that represents a booking moved out of the bookings table once it is old (see tasks.archiveBookings).
+
+    The archive keeps the bookings table small, so its indexes stay in memory, while the history stays readable
+    through /api/history. Archived bookings are never changed again.
+
+    Attributes:
+        id: The id the Booking had.
+        room_id: The foreign key to the Room that the Booking was for, NULL once the Room was deleted.
+        user_id: The foreign key to the User that made the Booking.
+        people_count: The number of people in the Booking.
+        start_time: The start time of the Booking.
+        end_time: The end time of the Booking.
+        purpose: The purpose of the Booking.
+        status: The status of the Booking when it was archived, always "closed".
+        updated_at: The datetime when the Booking was last changed.
+        archived_at: The datetime when the Booking was archived.
+    """
+    __tablename__ = 'bookings_archive'
+    __table_args__ = (
+        # serves the history of a user, newest first
+        db.Index('ix_bookings_archive_user_time', 'user_id', 'start_time', 'id'),
+      )
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='SET NULL'))
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    people_count = Column(Integer)
+    start_time = Column(DateTime(timezone=True))
+    end_time = Column(DateTime(timezone=True))
+    purpose = Column(String)
+    status = Column(String)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.now)
+
+
+class RoomPreference(db.Model):
+    """
+    A class that represents how much a user prefers a room, based on their past bookings.
+
+    The weight grows by one with every booking and decays over time, it is only valid at weighted_at and has to be
+    decayed to the current time before use (see recommend.decayed). bookRoom and cancel keep it up to date, so
+    ranking rooms never has to read the booking history.
+
+    Attributes:
+        user_id: The foreign key to the User.
+        room_id: The foreign key to the Room.
+        weight: The time-decayed booking weight at weighted_at.
+        bookings: The number of open or past bookings of the room by the user.
+        last_booked_at: The start time of the user's latest booking of the room.
+        weighted_at: The datetime the weight was last decayed to.
+    """
+    __tablename__ = 'room_preferences'
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'), primary_key=True)
+    weight = Column(Float, default=0.0)
+    bookings = Column(Integer, default=0)
+    last_booked_at = Column(DateTime)
+    weighted_at = Column(DateTime, default=datetime.now)
+
+
+class RoomUsage(db.Model):
+    """
+    A class that represents how much a room was booked during one hour of one day.
+
+    bookRoom, bookRecurring and cancel add and remove their bookings as they commit them (see utilization.py), so
+    the utilization reports only read these rows and never the booking history.
+
+    Attributes:
+        room_id: The foreign key to the Room.
+        day: The day.
+        hour: The hour of the day, 0 to 23.
+        bookings: The number of bookings starting in the hour.
+        booked_minutes: The minutes of the hour covered by bookings.
+        people_minutes: The booked minutes weighted by the people count of each booking.
+    """
+    __tablename__ = 'room_usage'
+    room_id = Column(Integer, ForeignKey('rooms.id', ondelete='CASCADE'), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    hour = Column(Integer, primary_key=True)
+    bookings = Column(Integer, nullable=False, default=0)
+    booked_minutes = Column(Integer, nullable=False, default=0)
+    people_minutes = Column(Integer, nullable=False, default=0)
+
+
+class FloorPlanVersion(db.Model):
+    """
+    A class that represents a version of a floor plan, its rooms and seats.
+
+    Every version holds the delta from the previous one, some also hold the full state of the floor (see
+    versioning.py). Both are JSON.
+
+    Attributes:
+        id: The primary key of the FloorPlanVersion.
+        floor_plan_id: The foreign key to the FloorPlan.
+        version: The number of the version, counted from 1 per FloorPlan.
+        user_id: The foreign key to the User who made the change, if known.
+        created_at: The datetime of the change.
+        delta: The changed floor, rooms and seats, each as [before, after].
+        snapshot: The floor, rooms and seats after the change, only on snapshot versions.
+    """
+    __tablename__ = 'floor_plan_versions'
+    __table_args__ = (
+        db.UniqueConstraint('floor_plan_id', 'version'),
+      )
+    id = Column(Integer, primary_key=True)
+    floor_plan_id = Column(Integer, ForeignKey('floor_plans.id', ondelete='CASCADE'), nullable=False)
+    version = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'))
+    created_at = Column(DateTime, default=datetime.now)
+    delta = Column(Text, nullable=False)
+    snapshot = Column(Text)
+
+
+class SyncOperation(db.Model):
+    """
+    A class that represents an operation applied by the offline sync of an admin client.
+
+    The operation ids are generated by the clients, a replayed operation returns the stored result instead of
+    being applied twice (see sync.py).
+
+    Attributes:
+        id: The primary key of the SyncOperation.
+        client_id: The id the client generated for itself.
+        op_id: The id the client generated for the operation.
+        user_id: The foreign key to the User who sent the operation.
+        result: The result returned for the operation, as JSON.
+        created_at: The datetime the operation was applied.
+    """
+    __tablename__ = 'sync_operations'
+    __table_args__ = (
+        db.UniqueConstraint('client_id', 'op_id'),
+      )
+    id = Column(Integer, primary_key=True)
+    client_id = Column(String(64), nullable=False)
+    op_id = Column(String(64), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'))
+    result = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class SchemaVersion(db.Model):
+    """
+    A class that records the version of the schema the database was created with.
+
+    The table holds a single row, written once the tables of the models exist, so that starting the app only
+    compares it with the version of the models instead of checking every table (see storage.schema_init_app).
+
+    Attributes:
+        id: The primary key of the SchemaVersion, always 1.
+        version: The fingerprint of the tables, columns and indexes of the models.
+        updated_at: The datetime the version was written.
+    """
+    __tablename__ = 'schema_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class CacheGeneration(db.Model):
+    """
+    A class that represents a counter shared by the processes to invalidate their caches.
+
+    A process changing what a cache holds bumps the counter in the same transaction, the other processes compare
+    it with the value they last read before serving from their cache (see cache.SearchCache.sync).
+
+    Attributes:
+        name: The name of the counter, e.g. "rooms".
+        value: The number of changes so far.
+    """
+    __tablename__ = 'cache_generations'
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
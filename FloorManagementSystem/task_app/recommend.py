@@ -0,0 +1,113 @@
+"""
+This module ranks the free rooms found by a search for the user searching.
+
+Every room gets a score in [0, 1] made of three parts:
+    - capacity fit: how well the room size matches the number of people (people / capacity),
+    - preference: how often and how recently the user booked the room, from the time-decayed
+      weights stored in RoomPreference,
+    - proximity: how close the room is to the floor the user books most, floors of other
+      buildings do not count as close.
+
+The preference weights are updated incrementally by bookRoom and cancel through
+recordBooking, so ranking only reads one RoomPreference row per room the user
+ever booked and never their booking history.
+"""
+import heapq
+from datetime import datetime, timedelta
+
+from . import db
+from .models import FloorPlan, Room, RoomPreference
+
+HALF_LIFE = timedelta(days=30)
+FIT_WEIGHT = 0.4
+PREFERENCE_WEIGHT = 0.4
+PROXIMITY_WEIGHT = 0.2
+
+
+def decayed(weight, since, now):
+    """
+    Decay a preference weight from the time it was stored to now.
+
+    Args:
+        weight (float): The stored weight.
+        since (datetime): The datetime the weight was stored at.
+        now (datetime): The datetime to decay the weight to.
+
+    Returns:
+        float: The weight at now, halved every HALF_LIFE.
+    """
+    if not weight or since is None:
+        return weight or 0.0
+    return weight * 0.5 ** (max((now - since).total_seconds(), 0) / HALF_LIFE.total_seconds())
+
+
+def recordBooking(user_id, room_id, start_time, delta=1, booked_at=None):
+    """
+    Add (or with a negative delta, remove) a booking to the preference of a user for a room.
+
+    A booking adds 1 to the weight when it is made, which then decays with the rest of the weight. A cancelled
+    booking removes what it still weighs, 1 decayed from booked_at, so an old booking does not eat into the weight
+    of the others.
+
+    The change joins the current transaction, the caller commits it together with the booking.
+
+    Args:
+        user_id (int): The id of the user.
+        room_id (int): The id of the room.
+        start_time (datetime): The start time of the booking.
+        delta (int): 1 for a new booking, -1 for a cancelled one.
+        booked_at (datetime): When the cancelled booking was made, it is removed undecayed if None.
+    """
+    now = datetime.now()
+    preference = db.session.get(RoomPreference, (user_id, room_id))
+    if preference is None:
+        if delta < 0:
+            return
+        preference = RoomPreference(user_id=user_id, room_id=room_id, weight=0.0, bookings=0)
+        db.session.add(preference)
+    change = delta if delta > 0 or booked_at is None else -decayed(-delta, booked_at, now)
+    preference.weight = max(decayed(preference.weight, preference.weighted_at, now) + change, 0.0)
+    preference.weighted_at = now
+    preference.bookings = max((preference.bookings or 0) + delta, 0)
+    if delta > 0 and (preference.last_booked_at is None or start_time > preference.last_booked_at):
+        preference.last_booked_at = start_time
+
+
+def rankRooms(rooms, user_id, people, k=None):
+    """
+    Sort the free rooms of a search by how well they suit the user.
+
+    Args:
+        rooms (list): The candidate rooms, as rows with id, capacity, level and building_id.
+        user_id (int): The id of the user searching, None to rank by capacity fit only.
+        people (int): The number of people in the booking.
+        k (int): Only return the best k rooms, all of them if None.
+
+    Returns:
+        list: The (score, room) pairs, best first.
+    """
+    now = datetime.now()
+    weights = {}
+    home = None
+    if user_id is not None:
+        preferences = db.session.query(RoomPreference.room_id, RoomPreference.weight, RoomPreference.weighted_at).filter(
+            RoomPreference.user_id == user_id, RoomPreference.weight > 0).all()
+        weights = {room_id: decayed(weight, weighted_at, now) for room_id, weight, weighted_at in preferences}
+    if weights:
+        favourite = max(weights, key=weights.get)
+        home = db.session.query(FloorPlan.building_id, FloorPlan.level).join(Room, Room.floor_plan_id == FloorPlan.id).filter(
+            Room.id == favourite).first()
+
+    def score(room):
+        fit = people / room.capacity if room.capacity else 0.0
+        weight = weights.get(room.id, 0.0)
+        preference = weight / (1 + weight)
+        proximity = 0.0
+        if home is not None and room.building_id == home.building_id and room.level is not None and home.level is not None:
+            proximity = 1 / (1 + abs(room.level - home.level))
+        return FIT_WEIGHT * min(fit, 1.0) + PREFERENCE_WEIGHT * preference + PROXIMITY_WEIGHT * proximity
+
+    scored = ((score(room), room) for room in rooms)
+    if k is not None:
+        return heapq.nlargest(k, scored, key=lambda pair: pair[0])
+    return sorted(scored, key=lambda pair: pair[0], reverse=True)
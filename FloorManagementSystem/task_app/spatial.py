@@ -0,0 +1,206 @@
+"""
+This module keeps an in-process spatial index of the room positions.
+
+Rooms with an x/y position (in floor plan units, e.g. metres) are put in a
+uniform grid per building and level: a dictionary from (column, row) to the
+rooms in that cell. A k-nearest query walks the cells around the point ring
+by ring, on every level of the building at once, and stops as soon as the
+closest ring not yet walked cannot hold anything closer than the k-th room
+found. Rooms on other levels are LEVEL_PENALTY further away per level, the
+distance of a staircase walk rather than the vertical one.
+
+The index is filled once per process. Every change of rooms or floors is
+recorded as a FloorPlanVersion (see versioning.py), so sync() only reloads the
+rooms of the floors with a version newer than the previous sync. Deleting a
+floor or a building removes its history with it, those are caught by a full
+reload every REFRESH_INTERVAL seconds, or at once in the process deleting
+them (see reset()).
+
+Classes:
+    SpatialIndex: The room grids of every building and level.
+"""
+import heapq
+import math
+import threading
+import time
+
+from sqlalchemy import func
+
+from . import db
+from .models import FloorPlan, FloorPlanVersion, Room
+
+# the side of a grid cell, in floor plan units
+CELL_SIZE = 10.0
+
+# the extra distance of every level between two rooms
+LEVEL_PENALTY = 50.0
+
+# seconds between two full reloads, which catch deleted floors and buildings
+REFRESH_INTERVAL = 300
+
+
+class SpatialIndex:
+    """
+    The grid of the positioned rooms, per building and level.
+
+    Attributes:
+        cell_size: The side of a grid cell.
+        level_penalty: The extra distance per level between two rooms.
+        refresh_interval: The seconds between two full reloads.
+    """
+    def __init__(self, cell_size=CELL_SIZE, level_penalty=LEVEL_PENALTY, refresh_interval=REFRESH_INTERVAL):
+        self.cell_size = cell_size
+        self.level_penalty = level_penalty
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self.reset()
+
+    def configure(self, cell_size, level_penalty, refresh_interval):
+        with self._lock:
+            self.cell_size = float(cell_size)
+            self.level_penalty = float(level_penalty)
+            self.refresh_interval = refresh_interval
+            self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (building id, level) -> {(column, row): {room id}}
+            self._grids = {}
+            # (building id, level) -> [least column, least row, greatest column, greatest row] ever filled
+            self._extents = {}
+            # room id -> (building id, level, x, y, floor plan id, capacity, cell)
+            self._rooms = {}
+            # floor plan id -> {room id}
+            self._floors = {}
+            self._watermark = None
+            self._loaded_at = None
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _remove(self, room_id):
+        building_id, level, _, _, floor_plan_id, _, cell = self._rooms.pop(room_id)
+        grid = self._grids[(building_id, level)]
+        grid[cell].discard(room_id)
+        if not grid[cell]:
+            del grid[cell]
+            if not grid:
+                del self._grids[(building_id, level)]
+        self._floors[floor_plan_id].discard(room_id)
+
+    def _add(self, room_id, floor_plan_id, capacity, x, y, building_id, level):
+        cell = self._cell(x, y)
+        self._rooms[room_id] = (building_id, level, x, y, floor_plan_id, capacity, cell)
+        self._grids.setdefault((building_id, level), {}).setdefault(cell, set()).add(room_id)
+        extent = self._extents.setdefault((building_id, level), [cell[0], cell[1], cell[0], cell[1]])
+        extent[:] = min(extent[0], cell[0]), min(extent[1], cell[1]), max(extent[2], cell[0]), max(extent[3], cell[1])
+        self._floors.setdefault(floor_plan_id, set()).add(room_id)
+
+    def _load(self, floor_plan_ids=None):
+        query = db.session.query(Room.id, Room.floor_plan_id, Room.capacity, Room.x, Room.y, FloorPlan.building_id, FloorPlan.level).join(
+            FloorPlan, Room.floor_plan_id == FloorPlan.id).filter(Room.x.isnot(None), Room.y.isnot(None))
+        if floor_plan_ids is not None:
+            query = query.filter(Room.floor_plan_id.in_(floor_plan_ids))
+        for room in query:
+            self._add(room.id, room.floor_plan_id, room.capacity or 0, room.x, room.y, room.building_id, room.level or 0)
+
+    def sync(self):
+        """
+        Bring the index up to date with the database.
+
+        The first call (and every call after refresh_interval seconds) loads every positioned room, later
+        calls only reload the rooms of the floors that have a new version since the previous sync.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._watermark is None or now - self._loaded_at >= self.refresh_interval:
+                # the watermark is read first, a version committed while loading is reloaded by the next sync
+                watermark = db.session.query(func.max(FloorPlanVersion.id)).scalar() or 0
+                self.reset()
+                self._load()
+                self._watermark, self._loaded_at = watermark, now
+                return
+            changed = db.session.query(FloorPlanVersion.id, FloorPlanVersion.floor_plan_id).filter(
+                FloorPlanVersion.id > self._watermark).all()
+            if not changed:
+                return
+            floor_plan_ids = {floor_plan_id for _, floor_plan_id in changed}
+            for floor_plan_id in floor_plan_ids:
+                for room_id in list(self._floors.get(floor_plan_id, ())):
+                    self._remove(room_id)
+                self._floors.pop(floor_plan_id, None)
+            self._load(floor_plan_ids)
+            self._watermark = max(id for id, _ in changed)
+
+    def position(self, room_id):
+        """
+        Return the (building id, level, x, y) of an indexed room, None if it has no position.
+        """
+        with self._lock:
+            room = self._rooms.get(int(room_id))
+            return None if room is None else room[:4]
+
+    def nearest(self, building_id, level, x, y, k=5, accept=None, exclude=None):
+        """
+        Find the k rooms of a building closest to a point.
+
+        Args:
+            building_id (int): The id of the building.
+            level (int): The level of the point.
+            x (float): The horizontal position of the point.
+            y (float): The vertical position of the point.
+            k (int): The number of rooms to return.
+            accept (callable): Called with (room id, capacity), only the rooms it returns True for are returned.
+            exclude (int): The id of a room never returned, e.g. the one the point is in.
+
+        Returns:
+            list: The (distance, room id, floor plan id) of the rooms, closest first.
+        """
+        with self._lock:
+            column, row = self._cell(x, y)
+
+            # rings of cells and rooms are ordered by the least distance anything in them can have
+            heap = []
+            for (grid_building, grid_level), grid in self._grids.items():
+                if grid_building != building_id:
+                    continue
+                least_column, least_row, greatest_column, greatest_row = self._extents[(grid_building, grid_level)]
+                reach = max(column - least_column, greatest_column - column, row - least_row, greatest_row - row, 0)
+                heapq.heappush(heap, (self.level_penalty * abs(grid_level - level), 0, grid_level, 0, grid, reach))
+
+            found = []
+            while heap and len(found) < k:
+                entry = heapq.heappop(heap)
+                if entry[1] == 1:
+                    distance, _, room_id = entry
+                    _, _, _, _, floor_plan_id, capacity, _ = self._rooms[room_id]
+                    if accept is None or accept(room_id, capacity):
+                        found.append((distance, room_id, floor_plan_id))
+                    continue
+
+                _, _, grid_level, ring, grid, reach = entry
+                penalty = self.level_penalty * abs(grid_level - level)
+                for cell in self._ring(column, row, ring):
+                    for room_id in grid.get(cell, ()):
+                        if room_id == exclude:
+                            continue
+                        room = self._rooms[room_id]
+                        heapq.heappush(heap, (math.hypot(room[2] - x, room[3] - y) + penalty, 1, room_id))
+                if ring < reach:
+                    heapq.heappush(heap, (ring * self.cell_size + penalty, 0, grid_level, ring + 1, grid, reach))
+            return found
+
+    @staticmethod
+    def _ring(column, row, ring):
+        if ring == 0:
+            yield column, row
+            return
+        for c in range(column - ring, column + ring + 1):
+            yield c, row - ring
+            yield c, row + ring
+        for r in range(row - ring + 1, row + ring):
+            yield column - ring, r
+            yield column + ring, r
+
+
+spatialIndex = SpatialIndex()
@@ -0,0 +1,36 @@
+// Wait for the result of a Celery task. The server pushes it over /events/<id>
+// as soon as the task finishes; polling /result/<id> is only the fallback for
+// browsers without EventSource or when the stream cannot be opened.
+function waitForResult(resultId, report) {
+    const poll = () => {
+        fetch(`/result/${resultId}`)
+            .then(response => response.json())
+            .then(data => {
+                report(data)
+
+                if (!data["ready"]) {
+                    setTimeout(poll, 500)
+                }
+            })
+    }
+
+    if (!window.EventSource) {
+        poll()
+        return
+    }
+
+    const source = new EventSource(`/events/${resultId}`)
+    source.onmessage = (event) => {
+        const data = JSON.parse(event.data)
+        report(data)
+        // a not ready event means the server timed out, EventSource reconnects by itself
+        if (data["ready"]) {
+            source.close()
+        }
+    }
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            poll()
+        }
+    }
+}
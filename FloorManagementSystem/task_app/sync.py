@@ -0,0 +1,357 @@
+"""
+This module applies the batched changes of admin clients editing floor plans offline.
+
+A client keeps a log of its operations while offline and sends all of them in
+one request (see api.sync). Every operation carries:
+    - an "id" generated by the client, an operation already applied for the
+      same client is not applied again, its stored result is returned instead
+      (an operation without one is rejected as invalid); only applied
+      operations are stored, a conflicting or invalid one can be corrected
+      and sent again with the same id,
+    - an "op", one of OPERATIONS, and its "values",
+    - the "target" id of the floor, room or seat it changes, or the parent id
+      ("building_id", "floor_plan_id", "room_id") of the one it creates; any of
+      them may be "@<op id>" for the object created by an earlier operation of
+      the client,
+    - the "base_version" of the floor the client edited and the "timestamp" of the edit.
+
+All operations of a batch are applied in one transaction, each in a savepoint
+so an invalid one is skipped without losing the others, and every changed
+floor gets one new version (see versioning.py). A delete of something changed
+on the server after base_version, or an update of fields changed on the server
+after it, is a conflict, unless the client wins: its user has a higher role
+priority (ROLE_PRIORITY) than the author of the server change, or the same
+priority and a later timestamp. Updates of other fields are merged.
+
+The sync token is the id of the last FloorPlanVersion the client has seen: the
+response holds the versions written since the client's token, at most
+MAX_SYNC_CHANGES of them, and the new token. When there are more, "more" is
+set and the token is the one of the last version listed: the client syncs
+again with it, with or without operations, until "more" is unset. The
+versions written by the sync itself are listed in "recorded", so that the
+client can skip them when a later page lists them.
+"""
+import copy
+import json
+from datetime import datetime
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .cache import bumpRooms, searchCache
+from .databaseControl import EDITABLE, detachBookings
+from .models import FloorPlan, FloorPlanVersion, Room, Seat, SyncOperation, User
+from .storage import beginWrite
+from .versioning import floorRow, recordVersion, roomRow, seatRow
+
+OPERATIONS = ("createFloor", "updateFloor", "createRoom", "updateRoom", "deleteRoom", "createSeat", "updateSeat", "deleteSeat")
+
+# roles not listed have priority 0
+ROLE_PRIORITY = {"admin": 2, "manager": 1}
+
+MAX_SYNC_OPERATIONS = 5000
+
+# the versions returned by one sync, the client asks for the next ones with the new token
+MAX_SYNC_CHANGES = 1000
+
+FIELDS = {"floor": EDITABLE[FloorPlan], "rooms": EDITABLE[Room], "seats": EDITABLE[Seat]}
+
+
+class SyncError(Exception):
+    """An operation that can not be applied, status is "invalid" or "conflict"."""
+    def __init__(self, status, message, server=None):
+        super().__init__(message)
+        self.status = status
+        self.server = server
+
+
+def _timestamp(value):
+    try:
+        timestamp = datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        raise SyncError("invalid", f"invalid timestamp {value}")
+    if timestamp is not None and timestamp.tzinfo is not None:
+        # the versions are stamped in server local time
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+class _Batch:
+    """The state of one sync request: created ids, floor deltas and role lookups."""
+    def __init__(self, client_id, user):
+        self.client_id = client_id
+        self.user = user
+        self.priority = ROLE_PRIORITY.get(user.role, 0)
+        self.created = {}
+        self.deltas = {}
+        self.roles = {}
+        # the capacities of the changed rooms, None when every room is affected (see cache.bumpRooms)
+        self.rooms_changed = set()
+
+    def resolve(self, value):
+        if isinstance(value, str) and value.startswith("@"):
+            op_id = value[1:]
+            if op_id not in self.created:
+                stored = db.session.query(SyncOperation.result).filter_by(client_id=self.client_id, op_id=op_id).scalar()
+                self.created[op_id] = json.loads(stored).get("server_id") if stored else None
+            value = self.created[op_id]
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise SyncError("invalid", f"unknown reference {value}")
+
+    def record(self, floor_plan_id, kind, key, change):
+        delta = self.deltas.setdefault(floor_plan_id, {"floor": None, "rooms": {}, "seats": {}})
+        if kind == "floor":
+            delta["floor"] = [delta["floor"][0], change[1]] if delta["floor"] else change
+        elif key in delta[kind]:
+            delta[kind][key][1] = change[1]
+        else:
+            delta[kind][key] = list(change)
+
+    def role(self, user_id):
+        if user_id not in self.roles:
+            self.roles[user_id] = db.session.query(User.role).filter(User.id == user_id).scalar()
+        return ROLE_PRIORITY.get(self.roles[user_id], 0)
+
+    def check(self, op, floor_plan_id, kind, key, server, fields=None):
+        """
+        Raise a conflict if the object was changed on the server after the client's base version and the server
+        wins. fields are the fields an update changes, None for a delete.
+        """
+        base = op.get("base_version")
+        if base is None:
+            return
+        versions = db.session.query(FloorPlanVersion.delta, FloorPlanVersion.user_id, FloorPlanVersion.created_at).filter(
+            FloorPlanVersion.floor_plan_id == floor_plan_id,
+            FloorPlanVersion.version > int(base)).order_by(FloorPlanVersion.version)
+        first, last, author = None, None, None
+        for delta, user_id, created_at in versions:
+            delta = json.loads(delta)
+            change = delta.get("floor") if kind == "floor" else delta.get(kind, {}).get(str(key))
+            if change:
+                first = first or change
+                last, author = change, (user_id, created_at)
+        if last is None:
+            return
+        if fields is not None and first[0] is not None and last[1] is not None:
+            changed = {field for field in FIELDS[kind] if first[0].get(field) != last[1].get(field)}
+            if not changed & set(fields):
+                return
+        priority = self.role(author[0])
+        timestamp = _timestamp(op.get("timestamp"))
+        if self.priority > priority or (self.priority == priority and timestamp is not None and timestamp > author[1]):
+            return
+        raise SyncError("conflict", "changed on the server since base_version", server)
+
+
+def _values(op, kind):
+    given = op.get("values", {})
+    if not isinstance(given, dict):
+        raise SyncError("invalid", "values must be an object")
+    values = {field: given[field] for field in FIELDS[kind] if field in given}
+    if "capacity" in values:
+        try:
+            values["capacity"] = int(values["capacity"])
+        except (TypeError, ValueError):
+            raise SyncError("invalid", "invalid capacity")
+    if "level" in values:
+        try:
+            values["level"] = int(values["level"])
+        except (TypeError, ValueError):
+            raise SyncError("invalid", "invalid level")
+    for field in ("x", "y"):
+        if values.get(field) is not None:
+            try:
+                values[field] = float(values[field])
+            except (TypeError, ValueError):
+                raise SyncError("invalid", f"invalid {field}")
+    for field in ("name", "type", "equipment", "image_file", "label"):
+        if values.get(field) is not None and not isinstance(values[field], str):
+            raise SyncError("invalid", f"invalid {field}")
+    return values
+
+
+def _floor(id):
+    floor = db.session.query(FloorPlan.name, FloorPlan.level, FloorPlan.image_file).filter(FloorPlan.id == id).first()
+    if floor is None:
+        raise SyncError("invalid", f"floor {id} not found")
+    return floorRow(*floor)
+
+
+def _room(id):
+    room = db.session.query(Room.floor_plan_id, Room.name, Room.type, Room.capacity, Room.equipment, Room.x, Room.y).filter(Room.id == id).first()
+    if room is None or room.floor_plan_id is None:
+        raise SyncError("invalid", f"room {id} not found")
+    return room.floor_plan_id, roomRow(room.name, room.type, room.capacity, room.equipment, room.x, room.y)
+
+
+def _seat(id):
+    seat = db.session.query(Seat.room_id, Seat.label, Seat.x, Seat.y, Room.floor_plan_id).join(Room, Seat.room_id == Room.id).filter(Seat.id == id).first()
+    if seat is None or seat.floor_plan_id is None:
+        raise SyncError("invalid", f"seat {id} not found")
+    return seat.floor_plan_id, seatRow(seat.room_id, seat.label, seat.x, seat.y)
+
+
+def _apply(batch, op):
+    name = op.get("op")
+    if name == "createFloor":
+        values = {"level": 0, **_values(op, "floor")}
+        id = db.session.execute(insert(FloorPlan).values(building_id=batch.resolve(op.get("building_id")), **values)
+                                .returning(FloorPlan.id)).scalar()
+        batch.record(id, "floor", None, [None, floorRow(values.get("name"), values["level"], values.get("image_file"))])
+        return {"server_id": id, "floor_plan_id": id}
+
+    if name == "updateFloor":
+        id = batch.resolve(op.get("target"))
+        before = _floor(id)
+        values = _values(op, "floor")
+        batch.check(op, id, "floor", None, before, values)
+        after = {**before, **values}
+        db.session.execute(update(FloorPlan).where(FloorPlan.id == id).values(**after, version=FloorPlan.version + 1))
+        batch.record(id, "floor", None, [before, after])
+        if after != before:
+            # the search cache holds the rooms with the level of their floor
+            batch.rooms_changed.add(None)
+        return {"floor_plan_id": id}
+
+    if name == "createRoom":
+        floor_plan_id = batch.resolve(op.get("floor_plan_id"))
+        _floor(floor_plan_id)
+        row = roomRow(None, None, 0, None)
+        row.update(_values(op, "rooms"))
+        id = db.session.execute(insert(Room).values(floor_plan_id=floor_plan_id, **row).returning(Room.id)).scalar()
+        batch.record(floor_plan_id, "rooms", str(id), [None, row])
+        batch.rooms_changed.add(row["capacity"] or 0)
+        return {"server_id": id, "floor_plan_id": floor_plan_id}
+
+    if name in ("updateRoom", "deleteRoom"):
+        id = batch.resolve(op.get("target"))
+        floor_plan_id, before = _room(id)
+        values = _values(op, "rooms") if name == "updateRoom" else None
+        batch.check(op, floor_plan_id, "rooms", id, before, values)
+        if name == "updateRoom":
+            after = {**before, **values}
+            batch.rooms_changed.add(min(before["capacity"] or 0, after["capacity"] or 0))
+            db.session.execute(update(Room).where(Room.id == id).values(**after, version=Room.version + 1))
+            batch.record(floor_plan_id, "rooms", str(id), [before, after])
+        else:
+            for seat in db.session.query(Seat.id, Seat.label, Seat.x, Seat.y).filter(Seat.room_id == id):
+                batch.record(floor_plan_id, "seats", str(seat.id), [seatRow(id, seat.label, seat.x, seat.y), None])
+            detachBookings([id])
+            db.session.execute(delete(Room).where(Room.id == id))
+            batch.record(floor_plan_id, "rooms", str(id), [before, None])
+            batch.rooms_changed.add(before["capacity"] or 0)
+        return {"floor_plan_id": floor_plan_id}
+
+    if name == "createSeat":
+        room_id = batch.resolve(op.get("room_id"))
+        floor_plan_id, _ = _room(room_id)
+        row = seatRow(room_id, None)
+        row.update(_values(op, "seats"))
+        id = db.session.execute(insert(Seat).values(**row).returning(Seat.id)).scalar()
+        batch.record(floor_plan_id, "seats", str(id), [None, row])
+        return {"server_id": id, "floor_plan_id": floor_plan_id}
+
+    if name in ("updateSeat", "deleteSeat"):
+        id = batch.resolve(op.get("target"))
+        floor_plan_id, before = _seat(id)
+        values = _values(op, "seats") if name == "updateSeat" else None
+        batch.check(op, floor_plan_id, "seats", id, before, values)
+        if name == "updateSeat":
+            after = {**before, **values}
+            db.session.execute(update(Seat).where(Seat.id == id).values(label=after["label"], x=after["x"], y=after["y"], version=Seat.version + 1))
+            batch.record(floor_plan_id, "seats", str(id), [before, after])
+        else:
+            db.session.execute(delete(Seat).where(Seat.id == id))
+            batch.record(floor_plan_id, "seats", str(id), [before, None])
+        return {"floor_plan_id": floor_plan_id}
+
+    raise SyncError("invalid", f"unknown operation {name}")
+
+
+def applySync(client_id, user, operations, since=0):
+    """
+    Apply a batch of client operations in one transaction and collect the server changes since the last sync.
+
+    Args:
+        client_id (str): The id the client generated for itself.
+        user (User): The user syncing.
+        operations (list): The operations, see the module documentation.
+        since (int): The sync token of the client's last sync, 0 for the first one.
+
+    Returns:
+        dict: The per-operation "results" ({"id", "status", ...} with status "applied", "conflict" or "invalid",
+        and "replayed" for operations applied before), the "changes" since the token (at most MAX_SYNC_CHANGES
+        versions with their id, floor_plan_id, version, user_id, created_at and delta), "more" if there are more
+        changes, the ids of the versions the sync "recorded" and the new "token".
+    """
+    if not client_id or len(operations) > MAX_SYNC_OPERATIONS:
+        raise ValueError(f"a sync needs a client_id and holds at most {MAX_SYNC_OPERATIONS} operations")
+
+    beginWrite()
+    batch = _Batch(client_id, user)
+    # an operation without an id can not be told from another one, it is never applied nor stored
+    ids = [str(op["id"]) if isinstance(op, dict) and op.get("id") not in (None, "") else None for op in operations]
+    known = [op_id for op_id in ids if op_id is not None]
+    stored = dict(db.session.query(SyncOperation.op_id, SyncOperation.result).filter(
+        SyncOperation.client_id == client_id, SyncOperation.op_id.in_(known))) if known else {}
+
+    # the versions of others, read under the write lock so nothing can slip in before the new token
+    latest = db.session.query(db.func.max(FloorPlanVersion.id)).scalar() or 0
+    changes = [{"id": row.id, "floor_plan_id": row.floor_plan_id, "version": row.version, "user_id": row.user_id,
+                "created_at": str(row.created_at), "delta": json.loads(row.delta)}
+               for row in db.session.query(FloorPlanVersion.id, FloorPlanVersion.floor_plan_id, FloorPlanVersion.version,
+                                           FloorPlanVersion.user_id, FloorPlanVersion.created_at, FloorPlanVersion.delta)
+               .filter(FloorPlanVersion.id > since).order_by(FloorPlanVersion.id).limit(MAX_SYNC_CHANGES + 1)]
+    more = len(changes) > MAX_SYNC_CHANGES
+    del changes[MAX_SYNC_CHANGES:]
+
+    results = []
+    applied = []
+    for op_id, op in zip(ids, operations):
+        if op_id is None:
+            results.append({"id": None, "status": "invalid", "error": "the operation has no id"})
+            continue
+        if op_id in stored:
+            results.append({**json.loads(stored[op_id]), "replayed": True})
+            continue
+        deltas = copy.deepcopy(batch.deltas)
+        savepoint = db.session.begin_nested()
+        try:
+            result = {"id": op_id, "status": "applied", **_apply(batch, op)}
+            savepoint.commit()
+            if "server_id" in result:
+                batch.created[op_id] = result["server_id"]
+        except SyncError as e:
+            savepoint.rollback()
+            batch.deltas = deltas
+            result = {"id": op_id, "status": e.status, "error": str(e)}
+            if e.server is not None:
+                result["server"] = e.server
+        except (TypeError, ValueError, IntegrityError) as e:
+            # e.g. an unknown building, a locked database still fails the whole sync
+            savepoint.rollback()
+            batch.deltas = deltas
+            result = {"id": op_id, "status": "invalid", "error": str(e)}
+        results.append(result)
+        if result["status"] == "applied":
+            stored[op_id] = json.dumps(result)
+            applied.append({"client_id": client_id, "op_id": op_id, "user_id": user.id, "result": stored[op_id]})
+
+    for floor_plan_id, delta in batch.deltas.items():
+        recordVersion(floor_plan_id, floor=delta["floor"], rooms=delta["rooms"], seats=delta["seats"])
+    if applied:
+        db.session.execute(insert(SyncOperation), applied)
+    capacity = None if None in batch.rooms_changed else min(batch.rooms_changed, default=None)
+    if batch.rooms_changed:
+        bumpRooms(capacity)
+    db.session.flush()
+    recorded = [id for id, in db.session.query(FloorPlanVersion.id).filter(FloorPlanVersion.id > latest)
+                .order_by(FloorPlanVersion.id)]
+    token = changes[-1]["id"] if more else max(recorded, default=latest)
+    db.session.commit()
+    if batch.rooms_changed:
+        searchCache.roomsChanged(capacity)
+    return {"results": results, "changes": changes, "more": more, "recorded": recorded, "token": token}
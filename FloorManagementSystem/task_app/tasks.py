@@ -1,9 +1,96 @@
+import bisect
+import json
+from itertools import islice
+
 from celery import shared_task
-from sqlalchemy import and_, or_, not_
-from datetime import datetime
+from dateutil.rrule import rrulestr
+from flask import current_app
+from sqlalchemy import delete, exists, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta
+from enum import Enum
 
 from . import db
-from .models import Booking, Room
+from .models import Booking, BookingArchive, FloorPlan, Room
+from .availability import index
+from .cache import capacityBucket, searchCache
+from .databaseControl import importHierarchy, parseFloorPlanCSV
+from .recommend import rankRooms, recordBooking
+from .storage import beginWrite, retryOnLocked
+from .utilization import bookingRange, rebuildUsage, recordUsage, used
+
+
+class BookingResult(Enum):
+    """
+    The outcome of a bookRoom or cancel request.
+
+    Attributes:
+        BOOKED: A new booking was created.
+        UPDATED: The user's existing booking for the same room and window was reopened or updated.
+        CONFLICT: Another open booking overlaps the requested window.
+        CANCELLED: The booking was closed.
+        INVALID: The room or booking does not exist or the window is empty.
+        PARTIAL: Only some slots of a recurring booking were booked (best-effort mode).
+        FREE: The slot was free but not booked, because another slot of an all-or-nothing request was not.
+    """
+    BOOKED = "booked"
+    UPDATED = "updated"
+    CONFLICT = "conflict"
+    CANCELLED = "cancelled"
+    INVALID = "invalid"
+    PARTIAL = "partial"
+    FREE = "free"
+
+
+# the most slots a recurring booking may hold, an RRULE without COUNT or UNTIL never ends
+MAX_SLOTS = 366
+
+# the ways bookRecurring handles slots that are not free
+RECURRING_MODES = ("all", "best")
+
+
+def parseWindow(From, To, date):
+    """
+    Turn the "HH:MM" times and the "YYYY-MM-DD" date sent by the booking form into datetimes.
+
+    Args:
+        From (str): The start time, in the format "HH:MM".
+        To (str): The end time, in the format "HH:MM".
+        date (str): The date, in the format "YYYY-MM-DD".
+
+    Returns:
+        tuple: The (start, end) datetimes.
+    """
+    date = list(map(int, date.split('-')))
+    From = list(map(int, From.split(':')))
+    To = list(map(int, To.split(':')))
+    return (datetime(date[0], date[1], date[2], From[0], From[1]),
+            datetime(date[0], date[1], date[2], To[0], To[1]))
+
+
+def overlapping(room_id, From, To, exclude=None):
+    """
+    Build an EXISTS clause matching any open booking of the room that overlaps [From, To).
+
+    Args:
+        room_id (int): The id of the room.
+        From (datetime): The start of the window.
+        To (datetime): The end of the window.
+        exclude (int): The id of a booking to leave out of the check.
+
+    Returns:
+        sqlalchemy.sql.Exists: The clause, to be negated for "no conflict".
+    """
+    other = aliased(Booking)
+    clause = exists().where(
+        other.room_id == room_id,
+        other.status == "open",
+        other.start_time < To,
+        other.end_time > From)
+    if exclude is not None:
+        clause = clause.where(other.id != exclude)
+    return clause
 
 """
 This function is used to cancel a booking based on the booking id.
@@ -12,17 +99,29 @@ Args:
     id (int): The id of the booking to be cancelled.
 
 Returns:
-    None: If the booking is found and cancelled, returns None. If the booking is not found, prints an error message.
+    dict: A dictionary with the "status" of the request ("cancelled", or "invalid" if the booking is not found)
+    and the "booking_id".
 
 """
-@shared_task()
+@shared_task(ignore_result=False)
+@retryOnLocked
 def cancel(id):
+    beginWrite()
     row = db.session.query(Booking).filter(Booking.id == id).first()
     if row:
+        if row.status == "open":
+            # the weight was added when the booking was made or last reopened, both stamp updated_at
+            recordBooking(row.user_id, row.room_id, row.start_time, -1, row.updated_at)
+        if row.status == "open" and row.end_time > datetime.now():
+            # a booking that already ended was used, whether or not the expiry sweep closed it yet
+            recordUsage([(row.room_id, row.start_time, row.end_time, row.people_count)], -1)
         row.status = "closed"
         db.session.commit()
+        index.bookingChanged(row)
+        return {"status": BookingResult.CANCELLED.value, "booking_id": row.id}
     else:
         print("Corresponding ID is not found!")
+        return {"status": BookingResult.INVALID.value, "booking_id": None}
 
 """
 This function is used to search for available rooms for a booking based on the specified criteria.
@@ -32,40 +131,46 @@ Args:
     To (str): The end time of the booking, in the format "HH:MM".
     date (str): The date of the booking, in the format "YYYY-MM-DD".
     People (int): The number of people in the booking.
+    id (int): The id of the user searching, used to rank the rooms by their past bookings (see recommend.py).
+    k (int): Only return the best k rooms, all of them if None.
+
+The free rooms of a window are cached (see cache.py) and only the ranking runs for every search.
 
 Returns:
-    list: A list of available rooms, where each room is represented as a list of its attributes. The attributes are in the following order: room id, capacity, floor plan id, room type, equipment, and a button to choose the room.
+    list: A list of available rooms, best match first, where each room is represented as a list of its attributes. The attributes are in the following order: room id, capacity, floor plan id, room type, equipment, match score in percent, and a button to choose the room.
 
 """
 @shared_task(ignore_result=False)
-def search(From, To, date, People):
+def search(From, To, date, People, id=None, k=None):
+
+    From, To = parseWindow(From, To, date)
+    People = int(People)
+
+    index.sync(current_app.config.get("SEARCH_SYNC_INTERVAL", 0))
+    searchCache.sync(current_app.config.get("SEARCH_SYNC_INTERVAL", 0))
+    free_rooms = searchCache.get(From, To, People)
+    if free_rooms is None:
+        generation = searchCache.generation
+        candidates = db.session.query(
+            Room.id, Room.capacity, Room.floor_plan_id, Room.type, Room.equipment, FloorPlan.level, FloorPlan.building_id
+        ).outerjoin(FloorPlan, Room.floor_plan_id == FloorPlan.id).filter(Room.capacity >= capacityBucket(People)).all()
+        free_rooms = [room for room in candidates if index.isFree(room.id, From, To)]
+        searchCache.put(From, To, People, free_rooms, generation)
+    available_rooms = [room for room in free_rooms if room.capacity >= People]
 
-    date = list(map(int, date.split('-')))
-    From = list(map(int, From.split(':')))
-    To = list(map(int, To.split(':')))
-    From = datetime(date[0], date[1], date[2], From[0], From[1])
-    To = datetime(date[0], date[1], date[2], To[0], To[1])
-
-    available_rooms = db.session.query(Room).filter(
-        and_(
-            Room.capacity >= People,
-            Room.id.notin_(
-                db.session.query(Booking.room_id).filter(
-                    Booking.status == 'open',
-                    not_(or_(
-                        Booking.start_time >= To,
-                        Booking.end_time <= From
-                    )))))).all()
-    
     rooms = []
-    for i in available_rooms:
+    for score, i in rankRooms(available_rooms, id, People, k):
         html = f"""<button class="btn btn-primary" onclick="changeElementValue('roomid', {i.id})">Choose</button>"""
-        rooms.append([i.id, str(i.capacity), str(i.floor_plan_id), str(i.type), str(i.equipment), html])
+        rooms.append([i.id, str(i.capacity), str(i.floor_plan_id), str(i.type), str(i.equipment), str(round(score * 100)), html])
 
     return rooms
 
 """
-This function is used to book a room based on the specified criteria. If a booking with the same criteria already exists, it will be updated with the new information.
+This function is used to book a room based on the specified criteria. If the same user already holds a booking
+for the same room and window, that booking is reopened and updated with the new information instead.
+
+The overlap check and the write are a single conditional statement, so two workers can never book overlapping
+windows of the same room, and the check is answered from the ix_bookings_room_status_time index.
 
 Args:
     purpose (str): The purpose of the booking.
@@ -77,35 +182,374 @@ Args:
     id (int): The id of the user making the booking.
 
 Returns:
-    None: If the booking is successful, returns None. If there is an error, prints the error message.
+    dict: A dictionary with the "status" of the request (one of the BookingResult values) and the "booking_id"
+    of the booked or updated booking, None on conflict or invalid input.
 
 """
-@shared_task(Bind=True, ignore_result=True)
+@shared_task(ignore_result=False)
+@retryOnLocked
 def bookRoom(purpose, From, To, RoomID, date, People, id):
 
-    date = list(map(int, date.split('-')))
-    From = list(map(int, From.split(':')))
-    To = list(map(int, To.split(':')))
-    From = datetime(date[0], date[1], date[2], From[0], From[1])
-    To = datetime(date[0], date[1], date[2], To[0], To[1])
+    From, To = parseWindow(From, To, date)
+    RoomID = int(RoomID)
+    People = int(People)
 
-    ## Repeition handling cases
+    if From >= To:
+        return {"status": BookingResult.INVALID.value, "booking_id": None}
 
-    new_Booking = Booking(purpose=purpose, user_id=id, start_time=From, end_time=To, room_id=RoomID, people_count=People)
     try:
-        db.session.add(new_Booking)
+        beginWrite()
+        # row lock on the room serializes bookings of the same room on databases supporting it (no-op on SQLite)
+        room = db.session.query(Room.id).filter(Room.id == RoomID).with_for_update().first()
+        if not room:
+            db.session.rollback()
+            return {"status": BookingResult.INVALID.value, "booking_id": None}
+
+        existing = db.session.query(Booking.id, Booking.status, Booking.people_count, Booking.updated_at).filter_by(user_id=id, start_time=From, end_time=To, room_id=RoomID).first()
+        if existing:
+            result = db.session.execute(
+                update(Booking)
+                .where(Booking.id == existing.id, ~overlapping(RoomID, From, To, exclude=existing.id))
+                .values(status="open", people_count=People, purpose=purpose, updated_at=datetime.now())
+                .execution_options(synchronize_session=False))
+            booking_id = existing.id if result.rowcount else None
+            status = BookingResult.UPDATED
+        else:
+            values = select(
+                literal(RoomID), literal(id), literal(People), literal(From), literal(To), literal(purpose)
+            ).where(~overlapping(RoomID, From, To))
+            booking_id = db.session.execute(
+                insert(Booking)
+                .from_select(["room_id", "user_id", "people_count", "start_time", "end_time", "purpose"], values)
+                .returning(Booking.id)).scalar()
+            status = BookingResult.BOOKED
+        if booking_id is not None and (existing is None or existing.status != "open"):
+            recordBooking(id, RoomID, From)
+        if booking_id is not None:
+            if existing is not None and used(existing.status, To, existing.updated_at):
+                recordUsage([(RoomID, From, To, existing.people_count)], -1)
+            recordUsage([(RoomID, From, To, People)])
         db.session.commit()
-    except Exception as e:
+    except IntegrityError as e:
+        # the same user booked the same window concurrently
         db.session.rollback()
         print(e)
+        return {"status": BookingResult.CONFLICT.value, "booking_id": None}
+
+    if booking_id is None:
+        return {"status": BookingResult.CONFLICT.value, "booking_id": None}
+
+    index.bookingChanged(db.session.get(Booking, booking_id))
+    return {"status": status.value, "booking_id": booking_id}
+
+def recurringSlots(From, To, date, rule=None, slots=None):
+    """
+    Expand a recurring booking request into its (start, end) windows.
 
-        row = db.session.query(Booking).filter_by(and_(user_id=id, start_time=From, end_time=To, room_id=RoomID)).first()
+    Args:
+        From (str): The start time of the first slot, in the format "HH:MM".
+        To (str): The end time of the first slot, in the format "HH:MM".
+        date (str): The date of the first slot, in the format "YYYY-MM-DD".
+        rule (str): An RFC 5545 recurrence rule, e.g. "FREQ=WEEKLY;BYDAY=MO,WE;COUNT=12", repeating the first slot.
+        slots (list): An explicit list of [date, From, To] slots, used instead of From, To and date.
 
-        if row:
-            row.status = "open"
-            row.people_count = People
-            db.session.commit()
+    Returns:
+        list: The (start, end) datetimes of the slots.
 
-    return
+    Raises:
+        ValueError: If a slot or the rule can not be parsed, or there are more than MAX_SLOTS slots.
+    """
+    if rule is not None and not isinstance(rule, str):
+        raise ValueError("the rule must be an RFC 5545 RRULE string")
+    if slots:
+        windows = [parseWindow(slot[1], slot[2], slot[0]) for slot in slots]
+    else:
+        start, end = parseWindow(From, To, date)
+        windows = [(start, end)]
+        if rule:
+            windows = [(occurrence, occurrence + (end - start))
+                       for occurrence in islice(rrulestr(rule, dtstart=start), MAX_SLOTS + 1)]
+    if not windows or len(windows) > MAX_SLOTS:
+        raise ValueError(f"a recurring booking holds 1 to {MAX_SLOTS} slots")
+    return windows
+
+"""
+This function is used to book a room for several windows at once: a recurring booking (an RRULE repeating the
+window of From, To and date) or an explicit list of slots.
+
+Every slot is checked in one pass against the open bookings of the room, loaded with a single query, and the free
+slots are written in one transaction with one batched INSERT (and one UPDATE for windows the user had booked
+before), under the same write lock as bookRoom.
+
+Args:
+    purpose (str): The purpose of the bookings.
+    From (str): The start time of the first slot, in the format "HH:MM".
+    To (str): The end time of the first slot, in the format "HH:MM".
+    RoomID (int): The id of the room to be booked.
+    date (str): The date of the first slot, in the format "YYYY-MM-DD".
+    People (int): The number of people in the bookings.
+    id (int): The id of the user making the bookings.
+    rule (str): The recurrence rule, see recurringSlots.
+    slots (list): The explicit [date, From, To] slots, see recurringSlots.
+    mode (str): "all" to book every slot or none of them, "best" to book the free slots only (see RECURRING_MODES).
 
+Returns:
+    dict: The overall "status" (BOOKED when every slot was booked or updated, PARTIAL when only some were, else
+    CONFLICT or INVALID, also for an unknown mode or an invalid rule) and the list of "slots", each with its
+    "start", "end", "status" and "booking_id".
+
+"""
+@shared_task(ignore_result=False)
+@retryOnLocked
+def bookRecurring(purpose, From, To, RoomID, date, People, id, rule=None, slots=None, mode="all"):
+
+    try:
+        if mode not in RECURRING_MODES:
+            raise ValueError(f"unknown mode {mode!r}, expected one of {', '.join(RECURRING_MODES)}")
+        windows = sorted(recurringSlots(From, To, date, rule, slots))
+        RoomID = int(RoomID)
+        People = int(People)
+    except (ValueError, TypeError, IndexError) as e:
+        print(e)
+        return {"status": BookingResult.INVALID.value, "slots": []}
+
+    beginWrite()
+    room = db.session.query(Room.id).filter(Room.id == RoomID).with_for_update().first()
+    if not room:
+        db.session.rollback()
+        return {"status": BookingResult.INVALID.value, "slots": []}
+
+    # the open bookings of the room never overlap each other, so sorted by start they are sorted by end as well
+    rows = db.session.query(Booking.id, Booking.user_id, Booking.start_time, Booking.end_time, Booking.status, Booking.people_count, Booking.updated_at).filter(
+        Booking.room_id == RoomID,
+        Booking.start_time < max(end for _, end in windows),
+        Booking.end_time > windows[0][0],
+        or_(Booking.status == "open", Booking.user_id == id)).order_by(Booking.start_time).all()
+    booked = [row for row in rows if row.status == "open"]
+    ends = [row.end_time for row in booked]
+    own = {(row.start_time, row.end_time): row for row in rows if row.user_id == id}
+
+    result = []
+    previous_end = None
+    for start, end in windows:
+        slot = {"start": str(start), "end": str(end), "status": BookingResult.BOOKED, "booking_id": None}
+        result.append(slot)
+        mine = own.get((start, end))
+        if start >= end:
+            slot["status"] = BookingResult.INVALID
+            continue
+        if previous_end is not None and start < previous_end:
+            # overlaps an earlier slot of the same request
+            slot["status"] = BookingResult.CONFLICT
+            continue
+        i = bisect.bisect_right(ends, start)
+        while i < len(booked) and booked[i].start_time < end:
+            if mine is None or booked[i].id != mine.id:
+                slot["status"] = BookingResult.CONFLICT
+                break
+            i += 1
+        if slot["status"] == BookingResult.CONFLICT:
+            continue
+        if mine is not None:
+            slot["status"] = BookingResult.UPDATED
+            slot["reopened"] = mine.status != "open"
+            slot["booking_id"] = mine.id
+        previous_end = end
+
+    accepted = [slot for slot in result if slot["status"] in (BookingResult.BOOKED, BookingResult.UPDATED)]
+    if mode == "all" and len(accepted) < len(result):
+        db.session.rollback()
+        for slot in accepted:
+            slot["status"] = BookingResult.FREE
+            slot["booking_id"] = None
+        accepted = []
 
+    try:
+        new = [slot for slot in accepted if slot["status"] == BookingResult.BOOKED]
+        if new:
+            ids = db.session.execute(insert(Booking).returning(Booking.id, sort_by_parameter_order=True), [
+                {"room_id": RoomID, "user_id": id, "people_count": People, "start_time": datetime.fromisoformat(slot["start"]),
+                 "end_time": datetime.fromisoformat(slot["end"]), "purpose": purpose} for slot in new]).scalars().all()
+            for slot, booking_id in zip(new, ids):
+                slot["booking_id"] = booking_id
+        updated = [slot["booking_id"] for slot in accepted if slot["status"] == BookingResult.UPDATED]
+        if updated:
+            db.session.execute(
+                update(Booking).where(Booking.id.in_(updated))
+                .values(status="open", people_count=People, purpose=purpose, updated_at=datetime.now())
+                .execution_options(synchronize_session=False))
+        windows = [(datetime.fromisoformat(slot["start"]), datetime.fromisoformat(slot["end"])) for slot in accepted]
+        recordUsage([(RoomID, start, end, own[(start, end)].people_count) for start, end in windows
+                     if (start, end) in own and used(own[(start, end)].status, end, own[(start, end)].updated_at)], -1)
+        recordUsage([(RoomID, start, end, People) for start, end in windows])
+        opened = [slot for slot in accepted if slot.pop("reopened", True)]
+        if opened:
+            recordBooking(id, RoomID, max(datetime.fromisoformat(slot["start"]) for slot in opened), len(opened))
+        db.session.commit()
+    except IntegrityError as e:
+        # the same user booked one of the windows concurrently
+        db.session.rollback()
+        print(e)
+        return {"status": BookingResult.CONFLICT.value, "slots": []}
+
+    ids = [slot["booking_id"] for slot in accepted]
+    if ids:
+        for booking in db.session.query(Booking).filter(Booking.id.in_(ids)):
+            index.bookingChanged(booking)
+
+    failed = {slot["status"] for slot in result} - {BookingResult.BOOKED, BookingResult.UPDATED, BookingResult.FREE}
+    if len(accepted) == len(result):
+        status = BookingResult.BOOKED
+    elif accepted:
+        status = BookingResult.PARTIAL
+    else:
+        status = BookingResult.CONFLICT if BookingResult.CONFLICT in failed else BookingResult.INVALID
+    for slot in result:
+        slot.pop("reopened", None)
+        slot["status"] = slot["status"].value
+    return {"status": status.value, "slots": result}
+
+"""
+This function is used to onboard whole buildings at once: buildings, floors, rooms and seats are validated in
+memory and inserted with batched statements in a single transaction (see databaseControl.importHierarchy).
+While running, the task reports its progress as the PROGRESS state with the "done" and "total" row counts.
+
+Args:
+    payload (str): The hierarchy, as JSON text or as CSV text (see databaseControl.parseFloorPlanCSV).
+    format (str): The format of the payload, "json" or "csv".
+
+Returns:
+    dict: The number of inserted "buildings", "floors", "rooms" and "seats", and the list of per-row "errors".
+
+"""
+@shared_task(bind=True, ignore_result=False)
+def importFloorPlans(self, payload, format="json"):
+
+    errors = []
+    if format == "csv":
+        data, errors = parseFloorPlanCSV(payload)
+    else:
+        try:
+            data = json.loads(payload)
+        except ValueError as e:
+            return {"buildings": 0, "floors": 0, "rooms": 0, "seats": 0, "errors": [{"row": None, "error": str(e)}]}
+
+    def progress(done, total):
+        self.update_state(state="PROGRESS", meta={"done": done, "total": total})
+
+    report = importHierarchy(data, progress)
+    report["errors"] = errors + report["errors"]
+    return report
+
+"""
+This function is used to build the hourly utilization aggregates (see utilization.py) of the existing bookings, e.g.
+after upgrading. The days of the booking history are rebuilt a range at a time, each range in its own transaction,
+so bookings and cancellations keep running meanwhile. While running, the task reports its progress as the PROGRESS
+state with the "done" and "total" day counts.
+
+Args:
+    days (int): The number of days rebuilt per transaction.
+
+Returns:
+    dict: The number of "days" and "bookings" counted.
+
+"""
+@shared_task(bind=True, ignore_result=False)
+@retryOnLocked
+def backfillUsage(self, days=30):
+
+    beginWrite()
+    span = bookingRange()
+    if span is None:
+        rebuildUsage(datetime.min.date(), datetime.max.date())
+        db.session.commit()
+        return {"days": 0, "bookings": 0}
+    From, To = span
+    # aggregates of days without any booking left
+    rebuildUsage(datetime.min.date(), From)
+    rebuildUsage(To, datetime.max.date())
+    db.session.commit()
+
+    counted = 0
+    day = From
+    while day < To:
+        until = min(day + timedelta(days=days), To)
+        beginWrite()
+        counted += rebuildUsage(day, until)
+        db.session.commit()
+        day = until
+        self.update_state(state="PROGRESS", meta={"done": (day - From).days, "total": (To - From).days})
+    return {"days": (To - From).days, "bookings": counted}
+
+"""
+This function is used to close every open booking whose end time has passed, run periodically by celery beat
+(see the CELERY beat_schedule in create_app). The bookings are closed with set-based UPDATEs of at most
+EXPIRY_BATCH_SIZE rows, each in its own short transaction, found through the ix_bookings_status_end index, and
+updated_at is set so the availability index of every process drops them on its next sync.
+
+Args:
+    batch (int): The number of bookings closed per transaction, EXPIRY_BATCH_SIZE by default.
+
+Returns:
+    dict: The number of "closed" bookings.
+
+"""
+@shared_task(ignore_result=False)
+@retryOnLocked
+def expireBookings(batch=None):
+
+    batch = int(batch or current_app.config.get("EXPIRY_BATCH_SIZE", 1000))
+    until = datetime.now()
+    closed = 0
+    while True:
+        beginWrite()
+        expired = select(Booking.id).where(Booking.status == "open", Booking.end_time <= until).limit(batch)
+        # updated_at is taken per batch, a sync running meanwhile never sees it older than the commit
+        result = db.session.execute(
+            update(Booking).where(Booking.id.in_(expired))
+            .values(status="closed", updated_at=datetime.now())
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        closed += result.rowcount
+        if result.rowcount < batch:
+            return {"closed": closed}
+
+"""
+This function is used to move the closed bookings that ended more than ARCHIVE_AFTER_DAYS days ago into the
+bookings_archive table, run daily by celery beat. Every batch of at most ARCHIVE_BATCH_SIZE bookings is copied and
+deleted with one INSERT ... SELECT and one DELETE in its own transaction, so bookings keep running meanwhile and a
+batch is either in one table or in the other. The archived bookings stay readable through /api/history.
+
+Args:
+    days (int): Archive the bookings that ended more than this many days ago, ARCHIVE_AFTER_DAYS by default.
+    batch (int): The number of bookings moved per transaction, ARCHIVE_BATCH_SIZE by default.
+
+Returns:
+    dict: The number of "archived" bookings.
+
+"""
+@shared_task(ignore_result=False)
+@retryOnLocked
+def archiveBookings(days=None, batch=None):
+
+    days = int(days if days is not None else current_app.config.get("ARCHIVE_AFTER_DAYS", 365))
+    batch = int(batch or current_app.config.get("ARCHIVE_BATCH_SIZE", 1000))
+    horizon = datetime.now() - timedelta(days=days)
+    columns = ["id", "room_id", "user_id", "people_count", "start_time", "end_time", "purpose", "status", "updated_at"]
+    archived = 0
+    while True:
+        beginWrite()
+        # the newest booking is never moved, and ids already in the archive are skipped: a bookings table
+        # created without AUTOINCREMENT hands out the id of its newest row again once that row is deleted
+        ids = db.session.execute(select(Booking.id).where(
+            Booking.status == "closed", Booking.end_time < horizon,
+            Booking.id < select(func.max(Booking.id)).scalar_subquery(),
+            ~exists().where(BookingArchive.id == Booking.id)).limit(batch)).scalars().all()
+        if ids:
+            db.session.execute(insert(BookingArchive).from_select(
+                columns, select(*(getattr(Booking, column) for column in columns)).where(Booking.id.in_(ids))))
+            db.session.execute(delete(Booking).where(Booking.id.in_(ids)).execution_options(synchronize_session=False))
+        db.session.commit()
+        archived += len(ids)
+        if len(ids) < batch:
+            return {"archived": archived}
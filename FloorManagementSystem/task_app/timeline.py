@@ -0,0 +1,102 @@
+"""
+This module builds the free/busy grid of the rooms of a floor or a building for one day.
+
+The day is cut into slots of a fixed number of minutes, and every room gets a
+bitmap with bit i set when slot i is busy. A bitmap is a plain Python integer,
+so one AND, OR or shift works on the whole day of a room at once:
+    - the free slots of a room are the complement of its busy bitmap,
+    - the slots where any room is free are the OR of the free bitmaps,
+    - the slots starting a free window of n slots are the free bitmap ANDed
+      with itself shifted by 1 .. n - 1, done in log(n) steps (see windowStarts).
+
+The grid is filled from a single query: the rooms outer joined to their open
+bookings overlapping the day.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_
+
+from . import db
+from .models import Booking, FloorPlan, Room
+
+# the smallest and the default slot, in minutes
+MIN_SLOT_MINUTES = 5
+SLOT_MINUTES = 15
+
+
+def slotMask(first, last):
+    """
+    Return the bitmap with the bits first .. last - 1 set.
+    """
+    return (1 << last) - (1 << first) if last > first else 0
+
+
+def windowStarts(free, length):
+    """
+    Find the slots starting a run of free slots.
+
+    Args:
+        free (int): The bitmap of the free slots.
+        length (int): The number of consecutive free slots needed.
+
+    Returns:
+        int: The bitmap of the slots i such that the slots i .. i + length - 1 are all free.
+    """
+    starts, covered = free, 1
+    while covered < length:
+        # starts holds the runs of `covered` slots, shifting it by up to `covered` doubles them
+        step = min(covered, length - covered)
+        starts &= starts >> step
+        covered += step
+    return starts
+
+
+def bits(mask, slots):
+    """
+    Render a bitmap as a string of "0" and "1", slot 0 first.
+    """
+    return format(mask, f"0{slots}b")[::-1] if slots else ""
+
+
+def dayGrid(day, floor_plan_id=None, building_id=None, slot_minutes=SLOT_MINUTES, people=0):
+    """
+    Build the busy bitmaps of the rooms of a floor or a building for one day.
+
+    Args:
+        day (datetime.date): The day.
+        floor_plan_id (int): The id of the floor, or
+        building_id (int): The id of the building.
+        slot_minutes (int): The length of a slot, it has to divide the day.
+        people (int): Only include the rooms holding at least this many people.
+
+    Returns:
+        dict: The "start" of the day, the number of "slots" and the "rooms" in id order, each a dictionary with
+        the id, floor_plan_id, name, capacity and the "busy" bitmap.
+    """
+    start = datetime(day.year, day.month, day.day)
+    end = start + timedelta(days=1)
+    slot = timedelta(minutes=slot_minutes)
+    slots = (end - start) // slot
+
+    query = db.session.query(Room.id, Room.floor_plan_id, Room.name, Room.capacity, Booking.start_time, Booking.end_time).join(
+        FloorPlan, Room.floor_plan_id == FloorPlan.id).outerjoin(
+        Booking, and_(Booking.room_id == Room.id, Booking.status == "open", Booking.start_time < end, Booking.end_time > start))
+    if floor_plan_id is not None:
+        query = query.filter(Room.floor_plan_id == floor_plan_id)
+    else:
+        query = query.filter(FloorPlan.building_id == building_id)
+    if people:
+        query = query.filter(Room.capacity >= people)
+
+    rooms = {}
+    for row in query.order_by(Room.id):
+        room = rooms.get(row.id)
+        if room is None:
+            room = rooms[row.id] = {"id": row.id, "floor_plan_id": row.floor_plan_id, "name": row.name,
+                                    "capacity": row.capacity, "busy": 0}
+        if row.start_time is not None:
+            first = max((row.start_time - start) // slot, 0)
+            # a booking ending inside a slot still takes the whole slot
+            last = min(-((start - row.end_time) // slot), slots)
+            room["busy"] |= slotMask(first, last)
+    return {"start": start, "slots": slots, "rooms": list(rooms.values())}
@@ -0,0 +1,117 @@
+"""
+This module caches the identity of the logged in users.
+
+Flask-Login loads the user of every authenticated request, including every
+poll of /result/<id>, which made it the most frequent query of the app. The
+loader (see create_app) asks this cache first: it keeps the id, email, role
+and first name of the users (never the password hash) with LRU and TTL
+eviction, so in the steady state a request makes no query on the users table.
+
+Every change or deletion of a User row flushed by this process drops its entry
+at once (SQLAlchemy mapper events), a bulk UPDATE or DELETE of users through
+the ORM drops every entry. Changes made by other processes, or by raw SQL,
+are seen after at most ttl seconds.
+
+Classes:
+    SessionUser: The cached identity, standing in for the User row as current_user.
+    UserCache: The LRU/TTL cache of SessionUsers per id.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import User
+
+
+class SessionUser(UserMixin):
+    """
+    The identity of a logged in user, detached from any session.
+
+    Attributes:
+        id: The primary key of the User.
+        email: The email of the User.
+        role: The role of the User.
+        first_name: The first name of the User.
+    """
+    def __init__(self, id, email, role, first_name):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.first_name = first_name
+
+
+class UserCache:
+    """
+    An LRU/TTL cache of the logged in users.
+
+    Attributes:
+        max_entries: The number of users kept before the least recently used one is evicted.
+        ttl: The number of seconds an entry is served, it bounds how long a change made by another process is missed.
+    """
+    def __init__(self, max_entries=4096, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def configure(self, max_entries, ttl):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._entries.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, id):
+        with self._lock:
+            self._entries.pop(id, None)
+
+    def load(self, id):
+        """
+        Return the identity of a user, from the cache or with one query on a miss.
+
+        Args:
+            id (int): The id of the user.
+
+        Returns:
+            SessionUser: The user, None if there is no such user.
+        """
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(id)
+                return entry[1]
+
+        row = db.session.query(User.id, User.email, User.role, User.first_name).filter(User.id == id).first()
+        if row is None:
+            self.invalidate(id)
+            return None
+        user = SessionUser(row.id, row.email, row.role, row.first_name)
+        with self._lock:
+            self._entries[id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return user
+
+
+userCache = UserCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _userChanged(mapper, connection, target):
+    userCache.invalidate(target.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _usersChanged(state):
+    if (state.is_update or state.is_delete) and state.bind_mapper is User.__mapper__:
+        userCache.clear()
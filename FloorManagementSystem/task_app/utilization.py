@@ -0,0 +1,249 @@
+"""
+This module keeps the hourly utilization aggregates of the rooms and reports from them.
+
+Every booking adds to one RoomUsage row per room, day and hour it overlaps:
+the minutes of the hour it covers and those minutes weighted by its people
+count, and it is counted once, in the hour it starts. bookRoom, bookRecurring and cancel update the
+rows through recordUsage in the same transaction as the booking, so the rows
+always match the bookings, and the reports read at most rooms × days × 24
+rows whatever the size of the booking history:
+    - utilization: the booked minutes over the minutes the rooms are open (OPEN_HOURS),
+    - seat fill: the people minutes over the booked minutes times the capacity,
+      i.e. people_count / capacity averaged over the booked time,
+    - peak hours: the utilization per hour of the day.
+
+A booking counts as long as it is open, and keeps counting when it is closed
+after it ended (by tasks.expireBookings), only cancelling it before its end
+removes it (see used). The rows of existing bookings are built by the
+backfillUsage task, one range of days per transaction (see rebuildUsage), from
+the bookings and the archived bookings alike.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, tuple_
+
+from . import db
+from .models import Booking, BookingArchive, FloorPlan, Room, RoomUsage
+
+# the hours [start, end) the rooms are expected to be used, the denominator of the utilization
+OPEN_HOURS = (8, 18)
+
+HOUR = timedelta(hours=1)
+
+
+def used(status, end_time, updated_at):
+    """
+    Tell whether a booking counts as using its room: it is open, or it was closed after it ended.
+    """
+    return status == "open" or (status == "closed" and updated_at is not None and end_time is not None
+                                and updated_at >= end_time)
+
+
+def usedClause(model=Booking):
+    """
+    Return the SQL condition of used() for the bookings or the archived bookings.
+    """
+    return or_(model.status == "open", and_(model.status == "closed", model.updated_at >= model.end_time))
+
+
+def hourSlices(start, end):
+    """
+    Cut a booking into the hours it overlaps.
+
+    Args:
+        start (datetime): The start of the booking.
+        end (datetime): The end of the booking.
+
+    Yields:
+        tuple: The (day, hour, minutes) of every hour overlapped, minutes being the part of the hour covered.
+    """
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        minutes = (min(end, hour + HOUR) - max(start, hour)).total_seconds() // 60
+        if minutes > 0:
+            yield hour.date(), hour.hour, int(minutes)
+        hour += HOUR
+
+
+def _cells(bookings, delta, From=None, To=None):
+    # bookings reaching out of [From, To) only count for the hours inside it
+    cells = {}
+    for room_id, start, end, people in bookings:
+        if room_id is None or start is None or end is None:
+            continue
+        first = True
+        for day, hour, minutes in hourSlices(max(start, From or start), min(end, To or end)):
+            cell = cells.setdefault((room_id, day, hour), [0, 0, 0])
+            if first and (From is None or start >= From):
+                cell[0] += delta
+            first = False
+            cell[1] += delta * minutes
+            cell[2] += delta * minutes * (people or 0)
+    return cells
+
+
+def _write(cells):
+    keys = list(cells)
+    existing = {}
+    for i in range(0, len(keys), 500):
+        for usage in db.session.query(RoomUsage).filter(
+                tuple_(RoomUsage.room_id, RoomUsage.day, RoomUsage.hour).in_(keys[i:i + 500])):
+            existing[(usage.room_id, usage.day, usage.hour)] = usage
+    for key, (bookings, booked_minutes, people_minutes) in cells.items():
+        usage = existing.get(key)
+        if usage is None:
+            if bookings <= 0 and booked_minutes <= 0:
+                continue
+            usage = RoomUsage(room_id=key[0], day=key[1], hour=key[2], bookings=0, booked_minutes=0, people_minutes=0)
+            db.session.add(usage)
+        usage.bookings = max(usage.bookings + bookings, 0)
+        usage.booked_minutes = max(usage.booked_minutes + booked_minutes, 0)
+        usage.people_minutes = max(usage.people_minutes + people_minutes, 0)
+        if not usage.bookings and not usage.booked_minutes:
+            # hours left without bookings are not kept, as after a backfill
+            db.session.delete(usage)
+
+
+def recordUsage(bookings, delta=1):
+    """
+    Add (or with a negative delta, remove) bookings to the hourly aggregates of their rooms.
+
+    The change joins the current transaction, the caller commits it together with the bookings.
+
+    Args:
+        bookings (list): The (room id, start, end, people count) of the bookings.
+        delta (int): 1 for booked, -1 for cancelled bookings.
+    """
+    cells = _cells(bookings, delta)
+    if cells:
+        _write(cells)
+
+
+def rebuildUsage(From, To):
+    """
+    Rebuild the aggregates of the days [From, To) from the bookings. The change joins the current transaction.
+
+    Args:
+        From (datetime.date): The first day.
+        To (datetime.date): The day after the last one.
+
+    Returns:
+        int: The number of bookings starting in the range.
+    """
+    start, end = datetime(From.year, From.month, From.day), datetime(To.year, To.month, To.day)
+    db.session.execute(delete(RoomUsage).where(RoomUsage.day >= From, RoomUsage.day < To).execution_options(synchronize_session=False))
+    bookings = []
+    for model in (Booking, BookingArchive):
+        bookings += db.session.query(model.room_id, model.start_time, model.end_time, model.people_count).filter(
+            usedClause(model), model.room_id.isnot(None),
+            model.start_time < end, model.end_time > start).all()
+    cells = _cells(bookings, 1, start, end)
+    db.session.add_all(RoomUsage(room_id=room_id, day=day, hour=hour, bookings=count, booked_minutes=booked_minutes,
+                                 people_minutes=people_minutes)
+                       for (room_id, day, hour), (count, booked_minutes, people_minutes) in cells.items())
+    return sum(1 for row in bookings if row.start_time >= start)
+
+
+def bookingRange():
+    """
+    Return the (first day, day after the last day) of the used bookings, archived or not, None if there are none.
+    """
+    spans = [db.session.query(func.min(model.start_time), func.max(model.end_time)).filter(
+        usedClause(model), model.room_id.isnot(None)).one() for model in (Booking, BookingArchive)]
+    spans = [span for span in spans if span[0] is not None]
+    if not spans:
+        return None
+    return min(first for first, _ in spans).date(), max(last for _, last in spans).date() + timedelta(days=1)
+
+
+def _scope(query, floor_plan_id=None, building_id=None, room_id=None):
+    if room_id is not None:
+        query = query.filter(Room.id == room_id)
+    if floor_plan_id is not None:
+        query = query.filter(Room.floor_plan_id == floor_plan_id)
+    if building_id is not None:
+        query = query.filter(FloorPlan.building_id == building_id)
+    return query
+
+
+GROUPS = {
+    "room": Room.id,
+    "floor": Room.floor_plan_id,
+    "building": FloorPlan.building_id,
+}
+
+
+def usageReport(From, To, group="room", hours=OPEN_HOURS, **scope):
+    """
+    Report the utilization and seat fill of the rooms, floors or buildings over a range of days.
+
+    Args:
+        From (datetime.date): The first day.
+        To (datetime.date): The last day, included.
+        group (str): "room", "floor" or "building".
+        hours (tuple): The hours [start, end) of the day counted, OPEN_HOURS by default.
+        scope: floor_plan_id, building_id or room_id, to report on part of the rooms only.
+
+    Returns:
+        list: The {id, rooms, bookings, booked_minutes, utilization, fill} of every group, utilization and fill
+        being ratios in [0, 1] (fill is None for groups never booked).
+    """
+    key = GROUPS[group]
+    days = (To - From).days + 1
+    open_minutes = days * (hours[1] - hours[0]) * 60
+
+    rooms = dict(_scope(db.session.query(key, func.count(Room.id)).select_from(Room).outerjoin(
+        FloorPlan, Room.floor_plan_id == FloorPlan.id), **scope).group_by(key).all())
+    usage = _scope(db.session.query(
+        key,
+        func.sum(RoomUsage.bookings),
+        func.sum(RoomUsage.booked_minutes),
+        func.sum(RoomUsage.people_minutes),
+        func.sum(RoomUsage.booked_minutes * Room.capacity),
+    ).select_from(RoomUsage).join(Room, RoomUsage.room_id == Room.id).outerjoin(FloorPlan, Room.floor_plan_id == FloorPlan.id).filter(
+        RoomUsage.day >= From, RoomUsage.day <= To, RoomUsage.hour >= hours[0], RoomUsage.hour < hours[1]), **scope).group_by(key)
+    usage = {row[0]: row[1:] for row in usage}
+
+    report = []
+    for id, count in sorted(rooms.items(), key=lambda item: (item[0] is None, item[0] or 0)):
+        bookings, booked_minutes, people_minutes, seat_minutes = usage.get(id, (0, 0, 0, 0))
+        report.append({
+            "id": id,
+            "rooms": count,
+            "bookings": bookings or 0,
+            "booked_minutes": booked_minutes or 0,
+            "utilization": round((booked_minutes or 0) / (open_minutes * count), 4) if open_minutes and count else 0.0,
+            "fill": round(people_minutes / seat_minutes, 4) if seat_minutes else None,
+        })
+    return report
+
+
+def peakHours(From, To, **scope):
+    """
+    Report the utilization of every hour of the day over a range of days.
+
+    Args:
+        From (datetime.date): The first day.
+        To (datetime.date): The last day, included.
+        scope: floor_plan_id, building_id or room_id, to report on part of the rooms only.
+
+    Returns:
+        list: The {hour, bookings, booked_minutes, utilization} of the 24 hours, in order.
+    """
+    days = (To - From).days + 1
+    rooms = _scope(db.session.query(func.count(Room.id)).outerjoin(FloorPlan, Room.floor_plan_id == FloorPlan.id), **scope).scalar()
+    usage = _scope(db.session.query(RoomUsage.hour, func.sum(RoomUsage.bookings), func.sum(RoomUsage.booked_minutes)).join(
+        Room, RoomUsage.room_id == Room.id).outerjoin(FloorPlan, Room.floor_plan_id == FloorPlan.id).filter(
+        RoomUsage.day >= From, RoomUsage.day <= To), **scope).group_by(RoomUsage.hour)
+    usage = {hour: (bookings or 0, booked_minutes or 0) for hour, bookings, booked_minutes in usage}
+
+    report = []
+    for hour in range(24):
+        bookings, booked_minutes = usage.get(hour, (0, 0))
+        report.append({
+            "hour": hour,
+            "bookings": bookings,
+            "booked_minutes": booked_minutes,
+            "utilization": round(booked_minutes / (days * 60 * rooms), 4) if rooms and days > 0 else 0.0,
+        })
+    return report
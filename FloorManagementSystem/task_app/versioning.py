@@ -0,0 +1,192 @@
+"""
+This module keeps the version history of the floor plans.
+
+Every admin change of a floor (see databaseControl) is recorded in the same
+transaction as a FloorPlanVersion holding only its delta: for the floor itself
+and for every changed room and seat, the row as [before, after], with None
+before for an added row and None after for a removed one. The first version
+of a floor and every SNAPSHOT_EVERY-th one also hold the full state.
+
+So:
+    - a version is rebuilt from the closest snapshot below it and at most SNAPSHOT_EVERY - 1 deltas,
+    - two versions are diffed by folding the deltas between them, the floors themselves are never rebuilt,
+    - a restore (databaseControl.restoreFloorPlan) writes the diff back to an old version as a new version, the
+      history is never rewritten.
+
+A state is a dictionary {"floor": row, "rooms": {id: row}, "seats": {id: row}},
+a delta has the same keys with [before, after] pairs instead of rows, and only
+the changed entries. Ids are strings, as in JSON.
+"""
+import json
+
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import func
+
+from . import db
+from .models import FloorPlan, FloorPlanVersion, Room, Seat
+
+SNAPSHOT_EVERY = 20
+
+KINDS = ("rooms", "seats")
+
+
+def floorRow(name, level, image_file):
+    return {"name": name, "level": level, "image_file": image_file}
+
+
+def roomRow(name, type, capacity, equipment, x=None, y=None):
+    return {"name": name, "type": type, "capacity": capacity, "equipment": equipment, "x": x, "y": y}
+
+
+def seatRow(room_id, label, x=None, y=None):
+    return {"room_id": room_id, "label": label, "x": x, "y": y}
+
+
+def currentState(floor_plan_id):
+    """
+    Read the state of a floor from its tables.
+
+    Args:
+        floor_plan_id (int): The id of the floor plan.
+
+    Returns:
+        dict: The state, None if the floor does not exist.
+    """
+    floor = db.session.query(FloorPlan.name, FloorPlan.level, FloorPlan.image_file).filter(FloorPlan.id == floor_plan_id).first()
+    if floor is None:
+        return None
+    rooms = db.session.query(Room.id, Room.name, Room.type, Room.capacity, Room.equipment, Room.x, Room.y).filter(Room.floor_plan_id == floor_plan_id)
+    seats = db.session.query(Seat.id, Seat.room_id, Seat.label, Seat.x, Seat.y).join(Room, Seat.room_id == Room.id).filter(Room.floor_plan_id == floor_plan_id)
+    return {
+        "floor": floorRow(*floor),
+        "rooms": {str(room.id): roomRow(room.name, room.type, room.capacity, room.equipment, room.x, room.y) for room in rooms},
+        "seats": {str(seat.id): seatRow(seat.room_id, seat.label, seat.x, seat.y) for seat in seats},
+    }
+
+
+def latestVersion(floor_plan_id):
+    """
+    Return the number of the latest version of a floor, 0 if it has none.
+    """
+    return db.session.query(func.max(FloorPlanVersion.version)).filter(FloorPlanVersion.floor_plan_id == floor_plan_id).scalar() or 0
+
+
+def _author():
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.id
+    return None
+
+
+def recordVersion(floor_plan_id, floor=None, rooms=None, seats=None, snapshot=None):
+    """
+    Record a change of a floor as its next version. The change joins the current transaction and has to be
+    flushed already, the caller commits it together with the version.
+
+    Args:
+        floor_plan_id (int): The id of the floor plan.
+        floor (list): The [before, after] rows of the floor, if it changed.
+        rooms (dict): The [before, after] rows of the changed rooms by id.
+        seats (dict): The [before, after] rows of the changed seats by id.
+        snapshot (dict): The state after the change, read from the tables when a snapshot is due and it is None.
+
+    Returns:
+        int: The number of the new version.
+    """
+    delta = {}
+    if floor is not None:
+        delta["floor"] = floor
+    for kind, changes in (("rooms", rooms), ("seats", seats)):
+        if changes:
+            delta[kind] = {str(id): change for id, change in changes.items()}
+
+    version = latestVersion(floor_plan_id) + 1
+    if version == 1 or version % SNAPSHOT_EVERY == 0:
+        snapshot = snapshot or currentState(floor_plan_id)
+    else:
+        snapshot = None
+    db.session.add(FloorPlanVersion(floor_plan_id=floor_plan_id, version=version, user_id=_author(),
+                                    delta=json.dumps(delta), snapshot=json.dumps(snapshot) if snapshot else None))
+    return version
+
+
+def _apply(state, delta):
+    if "floor" in delta:
+        state["floor"] = delta["floor"][1]
+    for kind in KINDS:
+        for id, (before, after) in delta.get(kind, {}).items():
+            if after is None:
+                state[kind].pop(id, None)
+            else:
+                state[kind][id] = after
+    return state
+
+
+def versionState(floor_plan_id, version):
+    """
+    Rebuild a version of a floor.
+
+    Args:
+        floor_plan_id (int): The id of the floor plan.
+        version (int): The number of the version.
+
+    Returns:
+        dict: The state of the floor at that version, None if there is no such version.
+    """
+    base = db.session.query(FloorPlanVersion.version, FloorPlanVersion.snapshot).filter(
+        FloorPlanVersion.floor_plan_id == floor_plan_id,
+        FloorPlanVersion.version <= version,
+        FloorPlanVersion.snapshot.isnot(None)).order_by(FloorPlanVersion.version.desc()).first()
+    if base is None or version > latestVersion(floor_plan_id):
+        return None
+    state = json.loads(base.snapshot)
+    deltas = db.session.query(FloorPlanVersion.delta).filter(
+        FloorPlanVersion.floor_plan_id == floor_plan_id,
+        FloorPlanVersion.version > base.version,
+        FloorPlanVersion.version <= version).order_by(FloorPlanVersion.version)
+    for delta, in deltas:
+        _apply(state, json.loads(delta))
+    return state
+
+
+def diffVersions(floor_plan_id, From, To):
+    """
+    Diff two versions of a floor by folding the deltas between them.
+
+    Args:
+        floor_plan_id (int): The id of the floor plan.
+        From (int): The number of the version to diff from.
+        To (int): The number of the version to diff to, it may be older than From.
+
+    Returns:
+        dict: The delta turning version From into version To, None if either version does not exist.
+    """
+    latest = latestVersion(floor_plan_id)
+    if not (1 <= From <= latest and 1 <= To <= latest):
+        return None
+    deltas = db.session.query(FloorPlanVersion.delta).filter(
+        FloorPlanVersion.floor_plan_id == floor_plan_id,
+        FloorPlanVersion.version > min(From, To),
+        FloorPlanVersion.version <= max(From, To)).order_by(FloorPlanVersion.version)
+
+    floor = None
+    changes = {kind: {} for kind in KINDS}
+    for delta, in deltas:
+        delta = json.loads(delta)
+        if "floor" in delta:
+            floor = [delta["floor"][0] if floor is None else floor[0], delta["floor"][1]]
+        for kind in KINDS:
+            for id, (before, after) in delta.get(kind, {}).items():
+                if id in changes[kind]:
+                    changes[kind][id][1] = after
+                else:
+                    changes[kind][id] = [before, after]
+
+    backwards = To < From
+    result = {}
+    if floor is not None and floor[0] != floor[1]:
+        result["floor"] = floor[::-1] if backwards else floor
+    for kind in KINDS:
+        result[kind] = {id: (change[::-1] if backwards else change)
+                        for id, change in changes[kind].items() if change[0] != change[1]}
+    return result
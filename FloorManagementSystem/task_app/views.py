@@ -17,18 +17,30 @@ The tasks page is tested using unit tests and integration tests.
 The tasks page is maintained and updated regularly.
 The tasks page is open source and available on GitHub.
 """
+import json
+import queue
+import time
+from concurrent import futures
+
 from celery.result import AsyncResult
-from flask import Blueprint, flash, redirect, url_for
-from flask import request
+from flask import Blueprint, abort, flash, redirect, url_for
+from flask import Response, current_app, request, stream_with_context
 from flask import render_template
 from flask_login import login_required, current_user
+from sqlalchemy.exc import SQLAlchemyError
 
-from .models import Booking, Building, Room, FloorPlan, Seat
+from .api import activityPage
 from .databaseControl import createBuilding, deleteBuilding, deleteFloor, deleteRoom, deleteSeat, createRoom, createSeat, createFloorPlan
-from . import tasks
+from .databaseControl import ConflictError
+from .events import listener
+from .inline import executor
+from . import db, tasks
 
 bp = Blueprint("tasks", __name__, url_prefix="/tasks")
 
+# the errors of a search run inline: a malformed form (see tasks.parseWindow) or a failing query
+SEARCH_ERRORS = (ValueError, TypeError, AttributeError, IndexError, SQLAlchemyError)
+
 @bp.get("/result/<id>")
 @login_required
 def result(id: str) -> dict[str, object]:
@@ -51,9 +63,68 @@ def result(id: str) -> dict[str, object]:
     return {
         "ready": ready,
         "successful": result.successful() if ready else None,
-        "value": result.get() if ready else result.result,
+        # a request never runs inside a task, but an eager task of another thread sets celery's process-wide join guard
+        "value": result.get(disable_sync_subtasks=False) if ready else result.result,
     }
 
+@bp.get("/events/<id>")
+@login_required
+def events(id: str) -> Response:
+    """
+    This function streams the result of an asynchronous task as a Server-Sent Event.
+
+    The stream waits on the per-process result subscription (see events.ResultListener) and sends one event as
+    soon as the task finishes, so the browser does not need to poll /result/<id>. If the task does not finish
+    within EVENTS_TIMEOUT seconds, a not-ready event is sent and the browser can reconnect.
+
+    Parameters:
+    id (str): The ID of the asynchronous task.
+
+    Returns:
+    A text/event-stream response whose single event carries the same keys as /result/<id>.
+
+    """
+    backend = current_app.extensions["celery"].backend
+    timeout = current_app.config.get("EVENTS_TIMEOUT", 60)
+    keepalive = current_app.config.get("EVENTS_KEEPALIVE", 15)
+    waiter = listener.subscribe(backend, id)
+    # the stream can last EVENTS_TIMEOUT seconds, it keeps no pooled connection meanwhile
+    db.session.remove()
+
+    @stream_with_context
+    def stream():
+        try:
+            deadline = time.monotonic() + timeout
+            result = AsyncResult(id)
+            status = None
+            while status is None and not result.ready() and time.monotonic() < deadline:
+                if waiter is None:
+                    # result backends without pub/sub are checked server side
+                    time.sleep(0.5)
+                    continue
+                try:
+                    meta = waiter.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+                    status = {
+                        "ready": True,
+                        "successful": meta["status"] == "SUCCESS",
+                        "value": meta["result"],
+                    }
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+            if status is None:
+                ready = result.ready()
+                status = {
+                    "ready": ready,
+                    "successful": result.successful() if ready else None,
+                    "value": result.get(propagate=False) if ready else None,
+                }
+            yield f"data: {json.dumps(status, default=str)}\n\n"
+        finally:
+            if waiter is not None:
+                listener.unsubscribe(id, waiter)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @bp.route("/")
 def home() -> str:
     """
@@ -71,39 +142,13 @@ def workspaces():
     """
     This function renders the workspaces page of the tasks page.
 
+    The tables are filled by the page itself, one page of the JSON API (see api.py) at a time.
+
     Returns:
     A string containing the HTML code for the workspaces page.
 
     """
-    building = Building.query.all()
-    buildings = []
-
-    for i in building:
-        html = f"""<form id='block' method='post' action='buildings/{i.id}' ><button type='submit' class='btn btn-danger'>Delete</button></form>"""
-        buildings.append([str(i.id), str(i.name), str(i.address), html])
-
-    floor = FloorPlan.query.all()
-    floors = []
-
-    for i in floor:
-        html = f"""<form id='block' method='post' action='floors/{i.id}' ><button type='submit' class='btn btn-danger'>Delete</button></form>"""
-        floors.append([str(i.id), str(i.building_id), str(i.name), str(i.level), str(i.image_file), str(i.created_at), str(i.updated_at), html])
-
-    room = Room.query.all()
-    rooms = []
-
-    for i in room:
-        html = f"""<form id='block' method='post' action='rooms/{i.id}' ><button type='submit' class='btn btn-danger'>Delete</button></form>"""
-        rooms.append([str(i.id), str(i.floor_plan_id), str(i.name), str(i.type), str(i.capacity), str(i.equipment), html])
-
-    seat = Seat.query.all()
-    seats = []
-
-    for i in seat:
-        html = f"""<form id='block' method='post' action='seats/{i.id}' ><button type='submit' class='btn btn-danger'>Delete</button></form>"""
-        seats.append([str(i.id), str(i.label), html])
-
-    return render_template("workspaces.html", user=current_user, buildingS=buildings, floorS=floors, roomS=rooms, seatS=seats)
+    return render_template("workspaces.html", user=current_user)
 
 @bp.post("/buildings/<id>")
 def deleteBuildings(id):
@@ -118,7 +163,14 @@ def deleteBuildings(id):
 @bp.post("/floors/<id>")
 def deleteFloors(id):
     
-    if deleteFloor(id):
+    try:
+        deleted = deleteFloor(id, request.form.get('version') or None)
+    except ConflictError:
+        flash('Changed by someone else in the meantime, please check it again', category='error')
+        return redirect(url_for('tasks.workspaces'))
+    except ValueError:
+        abort(400)
+    if deleted:
         flash('Operation successful', category='success')
     else:
         flash('Operation insuccessful', category='error')
@@ -128,7 +180,14 @@ def deleteFloors(id):
 @bp.post("/rooms/<id>")
 def deleteRooms(id):
     
-    if deleteRoom(id):
+    try:
+        deleted = deleteRoom(id, request.form.get('version') or None)
+    except ConflictError:
+        flash('Changed by someone else in the meantime, please check it again', category='error')
+        return redirect(url_for('tasks.workspaces'))
+    except ValueError:
+        abort(400)
+    if deleted:
         flash('Operation successful', category='success')
     else:
         flash('Operation insuccessful', category='error')
@@ -138,7 +197,14 @@ def deleteRooms(id):
 @bp.post("/seats/<id>")
 def deleteSeats(id):
     
-    if deleteSeat(id):
+    try:
+        deleted = deleteSeat(id, request.form.get('version') or None)
+    except ConflictError:
+        flash('Changed by someone else in the meantime, please check it again', category='error')
+        return redirect(url_for('tasks.workspaces'))
+    except ValueError:
+        abort(400)
+    if deleted:
         flash('Operation successful', category='success')
     else:
         flash('Operation insuccessful', category='error')
@@ -163,6 +229,10 @@ def book():
     """
     This function books a room for a specific purpose.
 
+    Besides the booking form, it accepts a "rule" (an RRULE repeating the window, e.g. FREQ=WEEKLY;COUNT=12) or
+    "slots" (a JSON list of [date, start, end]) and a "mode" ("all" or "best"), which book every slot at once with
+    tasks.bookRecurring.
+
     Returns:
     A dictionary containing the following keys:
 
@@ -176,7 +246,18 @@ def book():
     Date = request.form.get('date')
     People = request.form.get('count')
 
-    result = tasks.book.delay(purpose, From, To, RoomID, Date, People, current_user.id)
+    # a repeat rule or a list of slots books them all in one task
+    rule = request.form.get('rule')
+    slots = request.form.get('slots')
+    if rule or slots:
+        try:
+            slots = json.loads(slots) if slots else None
+        except ValueError:
+            return {"error": "slots must be a JSON list of [date, start, end]"}, 400
+        result = tasks.bookRecurring.delay(purpose, From, To, RoomID, Date, People, current_user.id,
+                                           rule=rule or None, slots=slots, mode=request.form.get('mode', 'all'))
+    else:
+        result = tasks.bookRoom.delay(purpose, From, To, RoomID, Date, People, current_user.id)
 
     return {"result_id": result.id}
 
@@ -186,6 +267,11 @@ def search():
     """
     This function searches for available rooms for a specific time period.
 
+    With SEARCH_EXECUTION set to "inline", the search runs in the web process (see inline.py) and the result is
+    returned directly, with the same keys as /result/<id>. It falls back to Celery when the inline pool is busy,
+    or when the search has not started within INLINE_TIMEOUT seconds; a search already running is waited for
+    another INLINE_TIMEOUT seconds instead, so it never runs twice, and reported as failed if it is still running.
+
     Returns:
     A dictionary containing the following keys:
 
@@ -199,7 +285,24 @@ def search():
     Date = request.form.get('date')
     People = request.form.get('count')
 
-    result = tasks.search.delay(From, To, Date, People)
+    if current_app.config["SEARCH_EXECUTION"] == "inline":
+        future = executor.submit(current_app._get_current_object(), tasks.search, From, To, Date, People, current_user.id)
+        if future is not None:
+            try:
+                try:
+                    value = future.result(timeout=current_app.config["INLINE_TIMEOUT"])
+                except futures.TimeoutError:
+                    # a search that started is waited for, once more, only one still queued is handed to Celery
+                    value = None if future.cancel() else future.result(timeout=current_app.config["INLINE_TIMEOUT"])
+                if not future.cancelled():
+                    return {"ready": True, "successful": True, "value": value}
+            except futures.TimeoutError:
+                return {"ready": True, "successful": False, "value": "the search timed out"}
+            except SEARCH_ERRORS as e:
+                print(e)
+                return {"ready": True, "successful": False, "value": str(e)}
+
+    result = tasks.search.delay(From, To, Date, People, current_user.id)
     
     return {"result_id": result.id }
 
@@ -213,16 +316,13 @@ def activity():
     A string containing the HTML code for the activity page.
 
     """
-    results = Booking.query.filter_by(user_id=current_user.id).all()
-    booking_list = []
-    for i in results:
-        if i.status == "open":
-            html = f"""<form id='block' method='post' action='cancel/{i.id}' ><button type='submit' class='btn btn-danger'>Cancel</button></form>"""
-            booking_list.insert(0, [str(i.id), str(i.room_id), str(i.people_count), str(i.start_time), str(i.end_time), html])
-        else:
-            booking_list.append([str(i.id), str(i.room_id), str(i.people_count), str(i.start_time), str(i.end_time), "closed"])
+    # the first page is rendered with the page, the next ones are loaded from /api/activity
+    first = activityPage(current_user.id)
+    for item in first["items"]:
+        item["start_time"] = str(item["start_time"])
+        item["end_time"] = str(item["end_time"])
 
-    return render_template("myActivity.html", user=current_user, booklist=booking_list)
+    return render_template("myActivity.html", user=current_user, booklist=first["items"], next=first["next"])
 
 @bp.post("/cancel/<id>")
 @login_required
@@ -271,8 +371,10 @@ def createroom():
     type = request.form.get('type')
     capacity = request.form.get('capacity')
     equipment = request.form.get('equipment')
+    x = request.form.get('x', type=float)
+    y = request.form.get('y', type=float)
 
-    if createRoom(floor_plan_id, name, type, capacity, equipment):
+    if createRoom(floor_plan_id, name, type, capacity, equipment, x, y):
         flash('Room created', category='success')
     else:
         flash('Invalid upload', category='error')
@@ -285,10 +387,40 @@ def createroom():
 def createseat():
     room_id = request.form.get('room_id')
     label = request.form.get('label')
+    x = request.form.get('x', type=float)
+    y = request.form.get('y', type=float)
 
-    if createSeat(room_id, label):
+    if createSeat(room_id, label, x, y):
         flash('Seat created', category='success')
     else:
         flash('Invalid upload', category='error')
     
-    return redirect(url_for('tasks.workspaces'))
\ No newline at end of file
+    return redirect(url_for('tasks.workspaces'))
+
+@bp.post("/import")
+@login_required
+def importFloorPlans():
+    """
+    This function starts the bulk import of buildings, floors, rooms and seats.
+
+    The hierarchy is taken from a JSON request body, or from an uploaded "file" (.csv or .json).
+
+    Returns:
+    A dictionary containing the following keys:
+
+    result_id (str): The ID of the asynchronous task importing the hierarchy. While running, /result/<id> reports the
+    "done" and "total" row counts.
+
+    """
+    if request.is_json:
+        payload, format = request.get_data(as_text=True), "json"
+    else:
+        upload = request.files.get('file')
+        if not upload:
+            return {"error": "no file uploaded"}, 400
+        payload = upload.read().decode("utf-8-sig")
+        format = "csv" if upload.filename.lower().endswith(".csv") else "json"
+
+    result = tasks.importFloorPlans.delay(payload, format)
+
+    return {"result_id": result.id}
@@ -0,0 +1,67 @@
+import pytest
+from flask import g
+from task_app import create_app, db
+from task_app.availability import index
+from task_app.databaseControl import createBuilding, createFloorPlan, createRoom
+from task_app.models import User
+from task_app.spatial import spatialIndex
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # every test gets its own database and runs the tasks eagerly, without a broker
+    monkeypatch.setenv("FLASK_SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("FLASK_METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setenv("FLASK_CELERY__task_always_eager", "true")
+    monkeypatch.setenv("FLASK_CELERY__task_store_eager_result", "true")
+    monkeypatch.setenv("FLASK_CELERY__result_backend", "cache+memory://")
+    app = create_app()
+    app.config["TESTING"] = True
+    index.reset()
+    spatialIndex.reset()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def floor(app):
+    """
+    A building with one floor at level 0 holding the rooms 1, 2 and 3, of capacity 2, 4 and 8.
+    """
+    createBuilding("B", "Address")
+    createFloorPlan(1, "F", 0, "floor.png")
+    for capacity in (2, 4, 8):
+        createRoom(1, f"R{capacity}", "meeting", capacity, "")
+    return 1
+
+
+@pytest.fixture
+def client(app, floor):
+    """
+    A test client logged in as an admin.
+    """
+    client = app.test_client()
+
+    @app.before_request
+    def forget_user():
+        # the requests share the app context of the test, and with it g, where flask-login keeps the user
+        g.pop("_login_user", None)
+
+    response = client.post("/sign-up", data={"email": "admin@example.com", "firstName": "Admin", "role": "admin",
+                                                 "password1": "secret123", "password2": "secret123"})
+    assert response.status_code == 302
+    assert db.session.query(User).count() == 1
+    # tasks called by the tests run in an app context of their own, with another session: this one must not
+    # keep reading from a snapshot taken before their writes
+    db.session.remove()
+    return client
+
+
+@pytest.fixture
+def admin(client):
+    """
+    The id of the logged in admin.
+    """
+    return 1
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import pytest
+from task_app import db
+from task_app.models import Booking
+
+
+def _book(admin, day, status, room_id=1):
+    start = datetime(2030, 1, 1, 9) + timedelta(days=day)
+    db.session.add(Booking(room_id=room_id, user_id=admin, people_count=1, start_time=start, end_time=start + timedelta(hours=1),
+                           purpose=f"{status} {day}", status=status, updated_at=start))
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+def test_activity_pages_open_soonest_then_closed_newest(client, admin, limit):
+    for day in (3, 1, 2):
+        _book(admin, day, "open")
+    for day in (4, 6, 5, 0):
+        _book(admin, day, "closed")
+    # two bookings at the same time only differ by id
+    _book(admin, 1, "open", room_id=2)
+    db.session.commit()
+    purposes, after = [], None
+    while True:
+        result = client.get("/api/activity", query_string={"limit": limit, **({"after": after} if after else {})}).get_json()
+        assert len(result["items"]) <= limit
+        purposes += [item["purpose"] for item in result["items"]]
+        after = result["next"]
+        if after is None:
+            break
+    assert purposes == ["open 1", "open 1", "open 2", "open 3", "closed 6", "closed 5", "closed 4", "closed 0"]
+
+
+@pytest.mark.parametrize("after", ["garbage", "open|yesterday|1", "closed|2030-01-01T09:00:00|x", "done||"])
+def test_malformed_activity_cursor_is_rejected(client, after):
+    response = client.get("/api/activity", query_string={"after": after})
+    assert response.status_code == 400 and response.get_json() == {"error": "invalid cursor"}
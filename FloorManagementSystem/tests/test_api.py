@@ -0,0 +1,37 @@
+import pytest
+from task_app.databaseControl import createRoom
+
+
+def test_pages_follow_the_cursor(client):
+    for capacity in range(10, 15):
+        createRoom(1, f"R{capacity}", "meeting", capacity, "")
+    ids, after = [], None
+    while True:
+        result = client.get("/api/rooms", query_string={"limit": 3, **({"after": after} if after else {})}).get_json()
+        ids += [item["id"] for item in result["items"]]
+        after = result["next"]
+        if after is None:
+            break
+    assert ids == list(range(1, 9))
+
+
+def test_page_filters(client):
+    result = client.get("/api/rooms?min_capacity=4").get_json()
+    assert [item["id"] for item in result["items"]] == [2, 3] and result["next"] is None
+
+
+@pytest.mark.parametrize("limit", [0, -3, 10000])
+def test_page_limit_is_bounded(client, limit):
+    response = client.get(f"/api/rooms?limit={limit}")
+    assert response.status_code == 200
+    assert 1 <= len(response.get_json()["items"]) <= 3
+
+
+@pytest.mark.parametrize("url", ["/api/floors?building_id=one", "/api/rooms?floor_plan_id=1.5", "/api/rooms?min_capacity=x",
+                                 "/api/seats?room_id=abc", "/api/rooms?after=abc", "/api/rooms?limit=ten",
+                                 "/api/timeline?floor_plan_id=first&date=2030-01-02",
+                                 "/api/timeline?building_id=1&date=2030-01-02&duration=long",
+                                 "/api/rooms/nearest?floor_plan_id=1&x=1&y=north"])
+def test_malformed_numbers_are_rejected(client, url):
+    response = client.get(url)
+    assert response.status_code == 400 and "must be" in response.get_json()["error"]
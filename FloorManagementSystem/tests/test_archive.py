@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert
+from task_app import db
+from task_app.models import Booking, BookingArchive
+from task_app.tasks import archiveBookings, expireBookings
+
+
+def _book(admin, room_id, days_ago, status="closed"):
+    start = datetime.now().replace(microsecond=0) - timedelta(days=days_ago)
+    booking = Booking(room_id=room_id, user_id=admin, people_count=1, start_time=start, end_time=start + timedelta(hours=1),
+                      purpose="", status=status, updated_at=start + timedelta(hours=2))
+    db.session.add(booking)
+    db.session.commit()
+    return booking.id
+
+
+def test_expire_closes_past_bookings(admin):
+    past, future = _book(admin, 1, 1, "open"), _book(admin, 2, -1, "open")
+    db.session.remove()
+    assert expireBookings() == {"closed": 1}
+    assert dict(db.session.query(Booking.id, Booking.status)) == {past: "closed", future: "open"}
+
+
+def test_archive_moves_old_closed_bookings_but_the_newest(admin):
+    old = [_book(admin, 1, 400 + i) for i in range(3)]
+    recent = _book(admin, 2, 10)
+    newest = _book(admin, 3, 500)
+    db.session.remove()
+    assert archiveBookings(batch=2) == {"archived": 3}
+    assert sorted(db.session.scalars(db.select(BookingArchive.id))) == old
+    assert sorted(db.session.scalars(db.select(Booking.id))) == [recent, newest]
+
+
+def test_booking_ids_are_never_reused(admin):
+    first = _book(admin, 1, 1)
+    db.session.execute(delete(Booking).where(Booking.id == first))
+    db.session.commit()
+    assert _book(admin, 1, 2) > first
+
+
+def test_archive_skips_ids_already_archived(admin):
+    clash, other = _book(admin, 1, 400), _book(admin, 2, 401)
+    _book(admin, 3, 1)
+    # an archived booking with the same id, as left by a table handing ids out twice
+    db.session.execute(insert(BookingArchive).values(id=clash, room_id=1, user_id=admin, status="closed",
+                                                     start_time=datetime(2000, 1, 1), end_time=datetime(2000, 1, 1, 1)))
+    db.session.commit()
+    db.session.remove()
+    assert archiveBookings() == {"archived": 1}
+    assert db.session.get(Booking, clash) is not None and db.session.get(Booking, other) is None
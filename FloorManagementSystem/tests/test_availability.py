@@ -0,0 +1,84 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from task_app import db
+from task_app.availability import AvailabilityIndex, RoomSchedule
+from task_app.models import Booking
+from task_app.tasks import search
+
+DAY = datetime(2030, 1, 7)
+
+
+def _window(rng):
+    start = DAY + timedelta(minutes=15 * rng.randint(0, 60))
+    return start, start + timedelta(minutes=15 * rng.randint(1, 8))
+
+
+def test_room_schedule_matches_brute_force():
+    rng = random.Random(1)
+    schedule = RoomSchedule()
+    for booking_id in range(40):
+        schedule.add(booking_id, *_window(rng))
+        if rng.random() < 0.3:
+            schedule.remove(rng.randrange(booking_id + 1))
+        for _ in range(20):
+            start, end = _window(rng)
+            overlapping = any(s < end and e > start for s, e in schedule.bookings.values())
+            assert schedule.isFree(start, end) is not overlapping
+
+
+def _book(admin, room_id, hour, status="open"):
+    booking = Booking(room_id=room_id, user_id=admin, people_count=1, start_time=DAY.replace(hour=hour),
+                      end_time=DAY.replace(hour=hour + 1), purpose="", status=status, updated_at=datetime.now())
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+
+def test_sync_loads_open_bookings_then_changes(admin):
+    booking = _book(admin, 1, 10)
+    _book(admin, 2, 10, "closed")
+    availability = AvailabilityIndex()
+    availability.sync()
+    assert not availability.isFree(1, DAY.replace(hour=10, minute=30), DAY.replace(hour=12))
+    assert availability.isFree(1, DAY.replace(hour=11), DAY.replace(hour=12))
+    assert availability.isFree(2, DAY.replace(hour=10), DAY.replace(hour=11))
+
+    booking.status = "closed"
+    booking.updated_at = datetime.now()
+    db.session.commit()
+    _book(admin, 3, 10)
+    availability.sync()
+    assert availability.isFree(1, DAY.replace(hour=10), DAY.replace(hour=11))
+    assert not availability.isFree(3, DAY.replace(hour=10), DAY.replace(hour=11))
+
+
+def test_search_skips_booked_rooms(admin):
+    _book(admin, 2, 10)
+    _book(admin, 3, 9, "closed")
+    db.session.remove()
+    assert sorted(row[0] for row in search("10:00", "11:00", "2030-01-07", 1)) == [1, 3]
+    assert sorted(row[0] for row in search("11:00", "12:00", "2030-01-07", 3)) == [2, 3]
+
+
+def test_full_reload_catches_late_commits_and_deletes(admin):
+    availability = AvailabilityIndex(refresh_interval=3600)
+    removed = []
+    availability.listeners.append(lambda room_id, start, end, opened: opened or removed.append(room_id))
+    deleted = _book(admin, 1, 10)
+    availability.sync()
+    # stamped long before it committed: older than the watermark minus the lag
+    late = _book(admin, 2, 10)
+    late.updated_at = datetime.now() - timedelta(minutes=10)
+    db.session.execute(delete(Booking).where(Booking.id == deleted.id))
+    db.session.commit()
+    availability.sync()
+    assert availability.isFree(2, DAY.replace(hour=10), DAY.replace(hour=11))
+    assert not availability.isFree(1, DAY.replace(hour=10), DAY.replace(hour=11))
+
+    availability.refresh_interval = 0
+    availability.sync()
+    assert not availability.isFree(2, DAY.replace(hour=10), DAY.replace(hour=11))
+    assert availability.isFree(1, DAY.replace(hour=10), DAY.replace(hour=11))
+    assert removed == [1]
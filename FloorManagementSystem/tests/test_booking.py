@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from task_app import db
+from task_app.availability import index
+from task_app.models import Booking, User
+from task_app.tasks import bookRoom, cancel
+
+
+def _other():
+    user = User(email="other@example.com", first_name="Other", role="user", password="x")
+    db.session.add(user)
+    db.session.commit()
+    id = user.id
+    db.session.remove()
+    return id
+
+
+def test_overlapping_booking_conflicts(admin):
+    other = _other()
+    first = bookRoom("", "10:00", "11:00", 1, "2030-01-07", 1, admin)
+    assert first["status"] == "booked"
+    assert bookRoom("", "10:30", "11:30", 1, "2030-01-07", 1, other) == {"status": "conflict", "booking_id": None}
+    # back to back windows and other rooms do not overlap
+    assert bookRoom("", "11:00", "12:00", 1, "2030-01-07", 1, other)["status"] == "booked"
+    assert bookRoom("", "10:30", "11:30", 2, "2030-01-07", 1, other)["status"] == "booked"
+    assert db.session.query(Booking).filter_by(room_id=1, status="open").count() == 2
+
+
+def test_rebooking_the_same_window_updates_it(admin):
+    first = bookRoom("", "10:00", "11:00", 1, "2030-01-07", 1, admin)
+    assert bookRoom("", "10:00", "11:00", 1, "2030-01-07", 3, admin) == {"status": "updated", "booking_id": first["booking_id"]}
+    assert db.session.get(Booking, first["booking_id"]).people_count == 3
+
+
+def test_cancel_frees_the_window(admin):
+    other = _other()
+    first = bookRoom("", "10:00", "11:00", 1, "2030-01-07", 1, admin)
+    assert cancel(first["booking_id"])["status"] == "cancelled"
+    assert index.isFree(1, datetime(2030, 1, 7, 10), datetime(2030, 1, 7, 11))
+    assert bookRoom("", "10:00", "11:00", 1, "2030-01-07", 1, other)["status"] == "booked"
+    assert cancel(999)["status"] == "invalid"
+
+
+def test_invalid_room_or_window(admin):
+    assert bookRoom("", "10:00", "11:00", 42, "2030-01-07", 1, admin)["status"] == "invalid"
+    assert bookRoom("", "11:00", "10:00", 1, "2030-01-07", 1, admin)["status"] == "invalid"
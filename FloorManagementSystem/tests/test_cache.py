@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+from task_app import db
+from task_app.cache import ROOMS, SearchCache, bumpRooms, capacityBucket, searchCache
+from task_app.databaseControl import updateRoom
+from task_app.models import CacheGeneration, Room, User
+from task_app.sync import applySync
+from task_app.tasks import search
+
+
+def _window():
+    return datetime(2030, 1, 7, 10), datetime(2030, 1, 7, 11)
+
+
+def _search(people=2):
+    return [row[0] for row in search("10:00", "11:00", "2030-01-07", people)]
+
+
+def test_capacity_buckets():
+    assert [capacityBucket(people) for people in (0, 1, 2, 3, 5, 8, 9)] == [1, 1, 2, 2, 4, 8, 8]
+
+
+def test_rooms_changed_by_another_process_are_seen(floor):
+    assert sorted(_search()) == [1, 2, 3]
+    # what another process does: a room committed together with the bump of the shared generation
+    db.session.execute(insert(Room).values(floor_plan_id=1, name="Other", type="meeting", capacity=6, equipment=""))
+    bumpRooms()
+    db.session.commit()
+    assert sorted(_search()) == [1, 2, 3, 4]
+
+
+def test_rooms_changed_by_another_process_only_drop_their_buckets(floor):
+    assert sorted(_search(2)) == [1, 2, 3] and _search(8) == [3]
+    # a room of 4 people affects the searches of up to 4 people, an entry for 8 people is still served
+    db.session.execute(insert(Room).values(floor_plan_id=1, name="Four", type="meeting", capacity=4, equipment=""))
+    db.session.execute(insert(Room).values(floor_plan_id=1, name="Eight", type="meeting", capacity=8, equipment=""))
+    bumpRooms(4)
+    db.session.commit()
+    assert sorted(_search(2)) == [1, 2, 3, 4, 5] and _search(8) == [3]
+
+
+def test_own_changes_keep_other_buckets(floor):
+    _search(2)
+    _search(8)
+    updateRoom(1, {"capacity": 3})
+    assert searchCache.get(*_window(), 8) is not None
+    _search(2)
+    assert searchCache.get(*_window(), 8) is not None
+
+
+def test_synced_floor_changes_bump_every_room(client):
+    admin = db.session.query(User).one()
+    applySync("laptop", admin, [{"id": "a", "op": "updateFloor", "target": 1, "values": {"level": 2}, "base_version": 1,
+                                 "timestamp": datetime.now().isoformat()}])
+    assert db.session.query(CacheGeneration.value).filter(CacheGeneration.name == ROOMS).scalar() == 1
+
+
+def test_entries_are_served_until_something_changes(floor):
+    _search()
+    # a room written without bumping the generation is only seen once the entry goes
+    db.session.execute(insert(Room).values(floor_plan_id=1, name="Hidden", type="meeting", capacity=6, equipment=""))
+    db.session.commit()
+    assert sorted(_search()) == [1, 2, 3]
+    searchCache.roomsChanged(6)
+    assert sorted(_search()) == [1, 2, 3, 4]
+
+
+def test_put_is_skipped_after_an_invalidation(app):
+    cache = SearchCache()
+    From, To = datetime(2030, 1, 7, 10), datetime(2030, 1, 7, 11)
+    generation = cache.generation
+    cache.roomsChanged()
+    cache.put(From, To, 2, [], generation)
+    assert cache.get(From, To, 2) is None
+    cache.put(From, To, 2, [], cache.generation)
+    assert cache.get(From, To, 2) == []
+
+
+def test_booking_only_drops_overlapping_windows(app):
+    cache = SearchCache()
+    morning = (datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 10))
+    noon = (datetime(2030, 1, 7, 12), datetime(2030, 1, 7, 13))
+    room = Room(id=1, capacity=4)
+    cache.put(*morning, 4, [room], cache.generation)
+    cache.put(*noon, 4, [room], cache.generation)
+    cache.bookingChanged(1, datetime(2030, 1, 7, 9, 30), datetime(2030, 1, 7, 10, 30), True)
+    assert cache.get(*morning, 4) is None and cache.get(*noon, 4) == [room]
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from task_app import db
+from task_app.availability import index
+from task_app.databaseControl import (
+    createBuilding,
+    createFloorPlan,
+    createRoom,
+    createSeat,
+    deleteBuilding,
+    deleteFloor,
+    deleteRoom,
+)
+from task_app.models import Booking, Building, FloorPlan, Room, RoomPreference, Seat
+
+START, END = datetime(2030, 1, 7, 10), datetime(2030, 1, 7, 11)
+
+
+def _book(admin, room_id):
+    booking = Booking(room_id=room_id, user_id=admin, people_count=1, start_time=START, end_time=END, purpose="",
+                      status="open", updated_at=datetime.now())
+    db.session.add(booking)
+    db.session.commit()
+    return booking.id
+
+
+def _bookings():
+    return {row.id: (row.room_id, row.status) for row in db.session.query(Booking.id, Booking.room_id, Booking.status)}
+
+
+def test_delete_building_cascades_and_detaches_its_bookings(floor, admin):
+    createBuilding("Other", "Elsewhere")
+    createFloorPlan(2, "G", 0, "other.png")
+    createRoom(2, "Kept", "meeting", 4, "")
+    for room_id in (1, 4):
+        createSeat(room_id, f"S{room_id}")
+        db.session.add(RoomPreference(user_id=admin, room_id=room_id, weight=1.0, weighted_at=START, bookings=1))
+    gone, kept = _book(admin, 1), _book(admin, 4)
+
+    assert deleteBuilding(1)
+    assert [building.name for building in db.session.query(Building)] == ["Other"]
+    assert db.session.query(FloorPlan.id).all() == [(2,)]
+    assert db.session.query(Room.id).all() == [(4,)]
+    assert db.session.query(Seat.room_id).all() == [(4,)]
+    assert db.session.query(RoomPreference.room_id).all() == [(4,)]
+    # the bookings stay as closed history without a room
+    assert _bookings() == {gone: (None, "closed"), kept: (4, "open")}
+    assert not deleteBuilding(1)
+
+
+def test_delete_floor_only_removes_its_rooms(floor, admin):
+    createFloorPlan(1, "G", 1, "upper.png")
+    createRoom(2, "Upper", "meeting", 4, "")
+    createSeat(4, "S")
+    booking = _book(admin, 2)
+
+    assert deleteFloor(1)
+    assert db.session.query(Room.id).all() == [(4,)]
+    assert db.session.query(Seat.room_id).all() == [(4,)]
+    assert _bookings() == {booking: (None, "closed")}
+    assert not deleteFloor(1)
+
+
+def test_deleted_room_is_dropped_from_the_availability_index(floor, admin):
+    booking = _book(admin, 3)
+    index.sync()
+    assert not index.isFree(3, START, END)
+
+    assert deleteRoom(3)
+    assert _bookings() == {booking: (None, "closed")}
+    index.sync()
+    assert index.isFree(3, START, END)
@@ -0,0 +1,40 @@
+import json
+import queue
+import threading
+
+from task_app.events import CHANNEL_PREFIX, ResultListener
+
+
+class _Backend:
+    READY_STATES = frozenset({"SUCCESS", "FAILURE"})
+
+    def decode_result(self, data):
+        return json.loads(data)
+
+
+class _PubSub:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def listen(self):
+        return iter(self.messages)
+
+
+def _message(task_id, status, result=None):
+    return {"channel": (CHANNEL_PREFIX + task_id).encode(), "data": json.dumps({"status": status, "result": result})}
+
+
+def test_listener_never_blocks_on_a_full_waiter():
+    listener = ResultListener()
+    # subscribe needs a Redis backend, the waiters are registered by hand
+    waiter, other = queue.Queue(maxsize=1), queue.Queue(maxsize=1)
+    listener._waiters = {"a": [waiter], "b": [other]}
+    messages = [_message("a", "STARTED"), _message("a", "SUCCESS", 1), _message("a", "SUCCESS", 2),
+                _message("b", "SUCCESS", 3), _message("c", "SUCCESS", 4)]
+
+    thread = threading.Thread(target=listener._listen, args=(_Backend(), _PubSub(messages)), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert waiter.get_nowait()["result"] == 1
+    assert other.get_nowait()["result"] == 3
@@ -0,0 +1,70 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+from task_app import db
+from task_app.availability import index
+from task_app.models import Booking, RoomUsage
+from task_app.tasks import cancel, expireBookings
+from task_app.utilization import rebuildUsage, recordUsage
+
+
+def _book(admin, room_id, start, hours=1, status="open"):
+    booking = Booking(room_id=room_id, user_id=admin, people_count=2, start_time=start, end_time=start + timedelta(hours=hours),
+                      purpose="", status=status, updated_at=start - timedelta(days=1))
+    db.session.add(booking)
+    if status == "open":
+        recordUsage([(room_id, booking.start_time, booking.end_time, booking.people_count)])
+    db.session.commit()
+    return booking.id
+
+
+def _usage():
+    return sorted((row.room_id, row.day, row.hour, row.bookings, row.booked_minutes, row.people_minutes)
+                  for row in db.session.query(RoomUsage))
+
+
+def test_expired_bookings_are_closed_in_batches_and_keep_counting(admin):
+    past = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=2)
+    expired = [_book(admin, room_id, past + timedelta(hours=hour)) for room_id in (1, 2) for hour in (0, 3, 6)]
+    ongoing = _book(admin, 3, datetime.now() - timedelta(minutes=30))
+    future = _book(admin, 3, datetime.now() + timedelta(days=1))
+    cancelled = _book(admin, 1, past - timedelta(hours=6), status="closed")
+    index.sync()
+    assert not index.isFree(1, past, past + timedelta(hours=1))
+    usage = _usage()
+    db.session.remove()
+
+    updates = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE bookings"):
+            updates.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        assert expireBookings(4) == {"closed": 6}
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    # 6 bookings by 4: a full batch, then a short one that ends the task
+    assert len(updates) == 2
+
+    statuses = dict(db.session.query(Booking.id, Booking.status))
+    assert [statuses[id] for id in expired] == ["closed"] * 6
+    assert statuses[ongoing] == statuses[future] == "open" and statuses[cancelled] == "closed"
+    # closed after their end, the expired bookings still count, as a rebuild from the bookings agrees
+    assert _usage() == usage
+    rebuildUsage(date.today() - timedelta(days=3), date.today() + timedelta(days=2))
+    db.session.commit()
+    assert _usage() == usage
+
+    index.sync()
+    assert index.isFree(1, past, past + timedelta(hours=1)) and not index.isFree(3, datetime.now(), datetime.now() + timedelta(minutes=1))
+    assert expireBookings(4) == {"closed": 0}
+
+
+def test_cancelling_before_the_end_removes_the_usage(admin):
+    booking = _book(admin, 1, datetime.now() + timedelta(days=1))
+    assert _usage()
+    db.session.remove()
+    cancel(booking)
+    assert _usage() == []
@@ -0,0 +1,42 @@
+import json
+
+from task_app import db
+from task_app.databaseControl import importHierarchy
+from task_app.models import Building, Room, Seat
+from task_app.tasks import importFloorPlans
+
+
+def test_import_inserts_the_valid_part_of_a_malformed_hierarchy(app):
+    data = {"buildings": [
+        "not a building",
+        {"name": "B", "address": "Street", "floors": [
+            ["not", "a", "floor"],
+            {"name": "F", "level": 1, "rooms": [
+                42,
+                {"name": "R", "type": "meeting", "capacity": [4]},
+                {"name": "R2", "type": "meeting", "capacity": 2, "seats": ["S1", ["S2"], {"label": "S3"}]},
+            ]},
+            {"name": "G", "rooms": "R3"},
+        ]},
+    ]}
+    result = importHierarchy(data)
+    assert (result["buildings"], result["floors"], result["rooms"], result["seats"]) == (1, 2, 1, 2)
+    assert [error["row"] for error in result["errors"]] == [
+        "buildings[0]",
+        "buildings[1].floors[0]",
+        "buildings[1].floors[1].rooms[0]",
+        "buildings[1].floors[1].rooms[1]",
+        "buildings[1].floors[1].rooms[2].seats[1]",
+        "buildings[1].floors[2]",
+    ]
+    assert sorted(seat.label for seat in db.session.query(Seat)) == ["S1", "S3"]
+    assert db.session.query(Room).one().name == "R2"
+
+
+def test_import_task_reports_a_payload_that_is_not_an_object(app):
+    db.session.remove()
+    result = importFloorPlans(json.dumps([{"name": "B"}]))
+    assert result["buildings"] == 0 and result["errors"][0]["row"] is None
+    result = importFloorPlans(json.dumps({"buildings": {"name": "B"}}))
+    assert result["errors"] == [{"row": None, "error": "buildings must be a list"}]
+    assert db.session.query(Building).count() == 0
@@ -0,0 +1,63 @@
+import threading
+import time
+
+from task_app import tasks
+from task_app.inline import InlineExecutor
+
+
+class _Task:
+    def __init__(self, seconds=0.0, value="done"):
+        self.seconds = seconds
+        self.value = value
+        self.runs = 0
+        self.delayed = 0
+
+    def run(self, *args):
+        self.runs += 1
+        time.sleep(self.seconds)
+        return self.value
+
+    def delay(self, *args):
+        self.delayed += 1
+        return type("Result", (), {"id": "celery-id"})()
+
+
+def test_executor_is_bounded(app):
+    executor = InlineExecutor(1)
+    release = threading.Event()
+    blocker = type("Task", (), {"run": lambda self: release.wait(5)})()
+    first = executor.submit(app, blocker)
+    assert executor.submit(app, _Task()) is None
+    release.set()
+    first.result(timeout=5)
+    assert executor.submit(app, _Task()).result(timeout=5) == "done"
+
+
+def test_slow_inline_search_is_not_run_twice(client, app, monkeypatch):
+    slow = _Task(seconds=0.3, value=[[1]])
+    monkeypatch.setattr(tasks, "search", slow)
+    app.config.update(SEARCH_EXECUTION="inline", INLINE_TIMEOUT=0.2)
+    response = client.post("/search", data={"start": "10:00", "end": "11:00", "date": "2030-01-07", "count": 2})
+    assert response.get_json() == {"ready": True, "successful": True, "value": [[1]]}
+    assert slow.runs == 1 and slow.delayed == 0
+
+
+def test_cancelled_task_gives_its_slot_back(app):
+    executor = InlineExecutor(1)
+    executor.submit(app, _Task()).result(timeout=5)
+    # keep the only thread of the pool busy outside of the slots, the next task stays queued
+    release = threading.Event()
+    executor._pool.submit(release.wait, 5)
+    queued = executor.submit(app, _Task())
+    assert queued.cancel()
+    assert executor.submit(app, _Task()) is not None
+    release.set()
+
+
+def test_running_inline_search_is_waited_for_a_bounded_time(client, app, monkeypatch):
+    slow = _Task(seconds=0.5, value=[[1]])
+    monkeypatch.setattr(tasks, "search", slow)
+    app.config.update(SEARCH_EXECUTION="inline", INLINE_TIMEOUT=0.05)
+    response = client.post("/search", data={"start": "10:00", "end": "11:00", "date": "2030-01-07", "count": 2})
+    assert response.get_json() == {"ready": True, "successful": False, "value": "the search timed out"}
+    assert slow.delayed == 0
@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from task_app import db
+from task_app.metrics import Publisher, lockRetries, registry
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+def _write(directory, name, value):
+    with open(os.path.join(directory, name), "w") as file:
+        json.dump({lockRetries.name: [[[], value]]}, file)
+
+
+def test_snapshots_of_dead_processes_are_removed(tmp_path):
+    publisher = Publisher()
+    publisher.configure(str(tmp_path))
+    _write(tmp_path, f"{os.getppid()}-live.json", 2)
+    _write(tmp_path, f"{_dead_pid()}-dead.json", 3)
+    _write(tmp_path, f"{os.getppid()}.json", 5)
+    assert publisher.snapshots() == [{lockRetries.name: [[[], 2]]}]
+    assert os.listdir(tmp_path) == [f"{os.getppid()}-live.json"]
+
+
+def test_flush_replaces_the_snapshot_of_a_previous_process_with_the_same_pid(tmp_path):
+    publisher = Publisher(interval=3600)
+    publisher.configure(str(tmp_path))
+    _write(tmp_path, f"{os.getpid()}-previous.json", 7)
+    publisher.start()
+    publisher.flush()
+    assert os.listdir(tmp_path) == [os.path.basename(publisher.path())]
+    with open(publisher.path()) as file:
+        assert file.read() == json.dumps(registry.snapshot())
+
+
+def test_metrics_adds_up_the_other_processes(app, tmp_path):
+    directory = app.config["METRICS_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    _write(directory, f"{os.getppid()}-other.json", 1000)
+    body = app.test_client().get("/metrics").get_data(as_text=True)
+    total = registry.metrics[lockRetries.name].series.get((), 0) + 1000
+    assert f"{lockRetries.name} {total}" in body
+
+
+def test_failed_statements_do_not_leak_timings(app):
+    with db.engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing_table"))
+        connection.execute(text("SELECT 1"))
+        assert connection.info.get("metrics_started") == []
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+from task_app import db
+from task_app.models import Booking, RoomPreference
+from task_app.recommend import HALF_LIFE, decayed, recordBooking
+from task_app.tasks import bookRoom, cancel
+
+
+def _weight(user_id, room_id):
+    preference = db.session.get(RoomPreference, (user_id, room_id))
+    return decayed(preference.weight, preference.weighted_at, datetime.now())
+
+
+def test_weight_halves_every_half_life():
+    now = datetime(2030, 1, 1)
+    assert decayed(1.0, now - 2 * HALF_LIFE, now) == pytest.approx(0.25)
+    assert decayed(1.0, now + HALF_LIFE, now) == 1.0
+
+
+def test_cancelling_an_old_booking_removes_only_what_it_still_weighs(admin):
+    old = datetime.now() - 2 * HALF_LIFE
+    # a booking made two half-lives ago, then a new one
+    db.session.add(RoomPreference(user_id=admin, room_id=1, weight=1.0, weighted_at=old, bookings=1))
+    recordBooking(admin, 1, datetime.now())
+    db.session.commit()
+    assert _weight(admin, 1) == pytest.approx(1.25, rel=1e-3)
+
+    recordBooking(admin, 1, datetime.now(), -1, old)
+    db.session.commit()
+    assert _weight(admin, 1) == pytest.approx(1.0, rel=1e-3)
+
+
+def test_cancel_task_removes_the_decayed_booking(admin):
+    first = bookRoom("", "10:00", "11:00", 1, "2030-01-07", 1, admin)["booking_id"]
+    bookRoom("", "12:00", "13:00", 1, "2030-01-07", 1, admin)
+    # the first booking was made two half-lives ago
+    booked_at = datetime.now() - 2 * HALF_LIFE
+    db.session.query(Booking).filter(Booking.id == first).update({"updated_at": booked_at})
+    db.session.query(RoomPreference).update({"weight": 1.25, "weighted_at": datetime.now()})
+    db.session.commit()
+    db.session.remove()
+    assert cancel(first)["status"] == "cancelled"
+    assert _weight(admin, 1) == pytest.approx(1.0, rel=1e-3)
+    assert db.session.get(RoomPreference, (admin, 1)).bookings == 1
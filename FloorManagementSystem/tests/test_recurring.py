@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+from task_app import db
+from task_app.models import Booking, User
+from task_app.tasks import bookRecurring, bookRoom, recurringSlots
+
+
+def test_rule_repeats_the_first_slot():
+    windows = recurringSlots("09:00", "10:00", "2030-01-07", "FREQ=WEEKLY;BYDAY=MO,WE;COUNT=3")
+    assert windows == [(datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 10)), (datetime(2030, 1, 9, 9), datetime(2030, 1, 9, 10)),
+                       (datetime(2030, 1, 14, 9), datetime(2030, 1, 14, 10))]
+
+
+def test_explicit_slots():
+    assert recurringSlots(None, None, None, slots=[["2030-01-07", "09:00", "10:00"]]) == [
+        (datetime(2030, 1, 7, 9), datetime(2030, 1, 7, 10))]
+
+
+@pytest.mark.parametrize("rule", ["FREQ=DAILY", "FREQ=BOGUS", ["FREQ=DAILY;COUNT=2"]])
+def test_invalid_or_unbounded_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        recurringSlots("09:00", "10:00", "2030-01-07", rule)
+
+
+def _other():
+    user = User(email="other@example.com", first_name="Other", role="user", password="x")
+    db.session.add(user)
+    db.session.commit()
+    id = user.id
+    db.session.remove()
+    return id
+
+
+def test_all_mode_books_nothing_on_a_conflict(admin):
+    bookRoom("taken", "09:00", "10:00", 1, "2030-01-09", 1, _other())
+    result = bookRecurring("weekly", "09:00", "10:00", 1, "2030-01-07", 1, admin, rule="FREQ=DAILY;COUNT=3")
+    assert result["status"] == "conflict"
+    assert [slot["status"] for slot in result["slots"]] == ["free", "free", "conflict"]
+    assert db.session.query(Booking).count() == 1
+
+
+def test_best_mode_books_the_free_slots(admin):
+    bookRoom("taken", "09:00", "10:00", 1, "2030-01-09", 1, _other())
+    result = bookRecurring("weekly", "09:00", "10:00", 1, "2030-01-07", 1, admin, rule="FREQ=DAILY;COUNT=3", mode="best")
+    assert result["status"] == "partial"
+    assert db.session.query(Booking).count() == 3
+
+
+@pytest.mark.parametrize("mode", ["some", None, ""])
+def test_unknown_mode_is_invalid(admin, mode):
+    result = bookRecurring("weekly", "09:00", "10:00", 1, "2030-01-07", 1, admin, rule="FREQ=DAILY;COUNT=3", mode=mode)
+    assert result == {"status": "invalid", "slots": []}
+    assert db.session.query(Booking).count() == 0
@@ -0,0 +1,32 @@
+import pytest
+from task_app import celery_worker_pool, tasks
+
+
+def _route(app, task):
+    return app.extensions["celery"].amqp.router.route({}, task.name)
+
+
+@pytest.mark.parametrize("task, queue, priority", [
+    (tasks.search, "interactive", 0),
+    (tasks.bookRoom, "writes", 3),
+    (tasks.cancel, "writes", 3),
+    (tasks.bookRecurring, "writes", 3),
+    (tasks.expireBookings, "writes", 6),
+    (tasks.importFloorPlans, "bulk", 9),
+    (tasks.backfillUsage, "bulk", 9),
+    (tasks.archiveBookings, "bulk", 9),
+])
+def test_tasks_are_routed_to_their_queue_and_priority(app, task, queue, priority):
+    route = _route(app, task)
+    assert route["queue"].name == queue and route["priority"] == priority
+
+
+def test_every_task_has_a_route(app):
+    names = {name for name in app.extensions["celery"].tasks if name.startswith("task_app.")}
+    assert names and names <= set(app.config["CELERY"]["task_routes"])
+
+
+def test_worker_pool_consumes_only_its_queues(app):
+    celery_app = celery_worker_pool(app, "interactive")
+    assert list(celery_app.amqp.queues.consume_from) == ["interactive"]
+    assert celery_app.conf.worker_concurrency == 8 and celery_app.conf.worker_prefetch_multiplier == 4
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import select, text, update
+from task_app import db
+from task_app.models import SchemaVersion
+from task_app.storage import UpgradeRequired, schema_init_app, schemaVersion
+
+TABLE = SchemaVersion.__table__
+
+
+def _stored():
+    with db.engine.connect() as connection:
+        return connection.execute(select(TABLE.c.version)).scalar()
+
+
+def _store(version):
+    with db.engine.begin() as connection:
+        connection.execute(update(TABLE).values(version=version))
+
+
+def test_current_version_skips_create_all(app, monkeypatch):
+    assert _stored() == schemaVersion(db.engine.dialect)
+    monkeypatch.setattr(db.metadata, "create_all", lambda *args, **kwargs: pytest.fail("create_all ran"))
+    schema_init_app(app)
+
+
+def test_changed_models_create_the_missing_tables(app):
+    _store("old")
+    with db.engine.begin() as connection:
+        connection.execute(text("DROP TABLE cache_generations"))
+    schema_init_app(app)
+    assert _stored() == schemaVersion(db.engine.dialect)
+    with db.engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM cache_generations")).scalar() == 0
+
+
+def test_missing_columns_fail_the_start_without_storing_the_version(app):
+    _store("old")
+    with db.engine.begin() as connection:
+        connection.execute(text("ALTER TABLE rooms DROP COLUMN y"))
+        connection.execute(text("ALTER TABLE rooms DROP COLUMN x"))
+        connection.execute(text("DROP TABLE cache_generations"))
+    with pytest.raises(UpgradeRequired) as error:
+        schema_init_app(app)
+    assert error.value.missing == {"rooms": ["x", "y"]}
+    assert "upgrade required" in str(error.value)
+    # nothing of the failed start is kept, the next one fails the same way
+    assert _stored() == "old"
+    with db.engine.connect() as connection:
+        assert "cache_generations" not in {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master"))}
+    with pytest.raises(UpgradeRequired):
+        schema_init_app(app)
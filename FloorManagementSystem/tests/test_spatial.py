@@ -0,0 +1,71 @@
+import math
+import random
+
+import pytest
+from task_app.databaseControl import createFloorPlan, createRoom, updateRoom
+from task_app.spatial import SpatialIndex
+
+
+def _closest(rooms, building_id, level, x, y, k, penalty, accept=None, exclude=None):
+    # every room of the building, one at a time
+    found = sorted((math.hypot(rx - x, ry - y) + penalty * abs(room_level - level), room_id, floor_plan_id)
+                   for room_id, (floor_plan_id, capacity, rx, ry, room_building, room_level) in rooms.items()
+                   if room_building == building_id and room_id != exclude and (accept is None or accept(room_id, capacity)))
+    return found[:k]
+
+
+@pytest.mark.parametrize("cell_size", [1.0, 10.0, 1000.0])
+def test_nearest_matches_brute_force(cell_size):
+    rng = random.Random(cell_size)
+    spatial = SpatialIndex(cell_size=cell_size, level_penalty=25.0)
+    rooms = {}
+    for room_id in range(1, 301):
+        building_id, level = rng.randint(1, 2), rng.randint(0, 3)
+        rooms[room_id] = (building_id * 10 + level, rng.randint(1, 10), rng.uniform(-50, 150), rng.uniform(-50, 150),
+                          building_id, level)
+        spatial._add(room_id, *rooms[room_id])
+
+    def accept(room_id, capacity):
+        return capacity >= 6
+
+    for _ in range(100):
+        building_id, level, x, y = rng.randint(1, 2), rng.randint(0, 3), rng.uniform(-100, 200), rng.uniform(-100, 200)
+        k = rng.randint(1, 20)
+        exclude = rng.randint(1, 300)
+        assert spatial.nearest(building_id, level, x, y, k) == pytest.approx(
+            _closest(rooms, building_id, level, x, y, k, 25.0))
+        assert spatial.nearest(building_id, level, x, y, k, accept, exclude) == pytest.approx(
+            _closest(rooms, building_id, level, x, y, k, 25.0, accept, exclude))
+    assert spatial.nearest(3, 0, 0, 0) == []
+
+
+def test_sync_follows_room_changes(floor):
+    createFloorPlan(1, "Upstairs", 1, "upstairs.png")
+    createRoom(2, "Up", "meeting", 4, "")
+    spatial = SpatialIndex(level_penalty=50.0)
+    spatial.sync()
+    assert spatial.position(1) is None
+
+    updateRoom(1, {"x": 0, "y": 0})
+    updateRoom(2, {"x": 30, "y": 40})
+    updateRoom(4, {"x": 3, "y": 4})
+    spatial.sync()
+    assert spatial.position(2) == (1, 0, 30.0, 40.0)
+    assert spatial.nearest(1, 0, 0, 0, k=3) == [(0.0, 1, 1), (50.0, 2, 1), (55.0, 4, 2)]
+
+    updateRoom(2, {"x": 1, "y": 0})
+    updateRoom(4, {"x": None, "y": None})
+    spatial.sync()
+    assert spatial.nearest(1, 0, 0, 0, k=3) == [(0.0, 1, 1), (1.0, 2, 1)]
+    assert spatial.position(4) is None
+
+
+def test_nearest_endpoint(client):
+    updateRoom(1, {"x": 0, "y": 0})
+    updateRoom(2, {"x": 3, "y": 4})
+    updateRoom(3, {"x": 6, "y": 8})
+    response = client.get("/api/rooms/nearest?room_id=1&k=5")
+    assert [(item["id"], item["distance"]) for item in response.get_json()["items"]] == [(2, 5.0), (3, 10.0)]
+    response = client.get("/api/rooms/nearest?floor_plan_id=1&x=0&y=0&people=8")
+    assert [item["id"] for item in response.get_json()["items"]] == [3]
+    assert client.get("/api/rooms/nearest?floor_plan_id=1").status_code == 400
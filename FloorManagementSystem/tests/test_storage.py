@@ -0,0 +1,67 @@
+import os
+import sqlite3
+
+import pytest
+from task_app import create_app, db, storage
+from task_app.models import Building
+from task_app.storage import beginWrite
+
+
+def _raw():
+    return db.session.connection().connection.dbapi_connection
+
+
+def _locked(app):
+    # another process trying to write
+    other = sqlite3.connect(app.config["SQLALCHEMY_DATABASE_URI"].removeprefix("sqlite:///"), timeout=0)
+    try:
+        other.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError:
+        return True
+    finally:
+        other.close()
+    return False
+
+
+def test_reads_hold_no_transaction(floor):
+    assert db.session.query(Building).count() == 1
+    assert not _raw().in_transaction
+
+
+def test_first_write_takes_the_write_lock(app, floor):
+    db.session.query(Building).count()
+    db.session.add(Building(name="Other", address="Street"))
+    db.session.flush()
+    assert _raw().in_transaction and _locked(app)
+    db.session.rollback()
+    assert db.session.query(Building).count() == 1 and not _locked(app)
+
+
+def test_begin_write_takes_the_write_lock_up_front(app, floor):
+    beginWrite()
+    assert _raw().in_transaction and _locked(app)
+    db.session.rollback()
+
+
+def test_fork_hook_is_registered_once(app, monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(os, "register_at_fork", lambda **kwargs: calls.append(kwargs))
+    monkeypatch.setattr(storage, "_fork_registered", False)
+    for name in ("one", "two"):
+        monkeypatch.setenv("FLASK_SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / name}.db")
+        other = create_app("worker")
+        with other.app_context():
+            assert db.engine in storage._engines
+    assert len(calls) == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_drops_the_inherited_connections(app, floor):
+    db.session.query(Building).count()
+    pool = db.engine.pool
+    assert pool.checkedin() + pool.checkedout() > 0
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if db.engine.pool is not pool and db.engine.pool.checkedout() == 0 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
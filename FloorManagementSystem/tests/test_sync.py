@@ -0,0 +1,117 @@
+from datetime import datetime
+
+from task_app import db, sync
+from task_app.databaseControl import updateRoom
+from task_app.models import FloorPlanVersion, Room, SyncOperation, User
+from task_app.sync import applySync
+from task_app.versioning import latestVersion
+
+
+def _admin():
+    return db.session.query(User).one()
+
+
+def _rename(op_id, target, name, base_version=1, **op):
+    return {"id": op_id, "op": "updateRoom", "target": target, "values": {"name": name},
+            "base_version": base_version, "timestamp": datetime.now().isoformat(), **op}
+
+
+def test_operations_are_applied_once(client):
+    first = applySync("laptop", _admin(), [_rename("a", 1, "First")])
+    assert first["results"][0]["status"] == "applied"
+    replay = applySync("laptop", _admin(), [_rename("a", 1, "Ignored")], first["token"])
+    assert replay["results"][0]["replayed"] and db.session.get(Room, 1).name == "First"
+
+
+def test_operations_without_id_are_invalid_and_not_stored(client):
+    result = applySync("laptop", _admin(), [_rename(None, 1, "First")])
+    assert result["results"][0]["status"] == "invalid"
+    result = applySync("laptop", _admin(), [{k: v for k, v in _rename(None, 2, "Second").items() if k != "id"}])
+    assert result["results"][0]["status"] == "invalid"
+    assert db.session.get(Room, 1).name == "R2" and db.session.get(Room, 2).name == "R4"
+    assert db.session.query(SyncOperation).count() == 0
+
+
+def test_created_objects_are_referenced_by_op_id(client):
+    result = applySync("laptop", _admin(), [
+        {"id": "room", "op": "createRoom", "floor_plan_id": 1, "values": {"name": "New", "capacity": 3}},
+        {"id": "seat", "op": "createSeat", "room_id": "@room", "values": {"label": "S1"}},
+    ])
+    assert [item["status"] for item in result["results"]] == ["applied", "applied"]
+    room = db.session.query(Room).filter_by(name="New").one()
+    assert [seat.label for seat in room.seats] == ["S1"]
+
+
+def test_invalid_operation_is_skipped_without_losing_the_others(client):
+    result = applySync("laptop", _admin(), [
+        {"id": "bad", "op": "updateRoom", "target": 1, "values": {"capacity": "many"}, "base_version": 1},
+        _rename("good", 2, "Kept"),
+    ])
+    assert [item["status"] for item in result["results"]] == ["invalid", "applied"]
+    assert db.session.get(Room, 2).name == "Kept"
+
+
+def test_malformed_values_are_invalid(client):
+    result = applySync("laptop", _admin(), [
+        {"id": "list", "op": "updateRoom", "target": 1, "values": ["name"], "base_version": 1},
+        {"id": "label", "op": "createSeat", "room_id": 1, "values": {"label": ["S1"]}},
+        {"id": "orphan", "op": "createFloor", "building_id": 99, "values": {"name": "F"}},
+        _rename("good", 2, "Kept"),
+    ])
+    assert [item["status"] for item in result["results"]] == ["invalid", "invalid", "invalid", "applied"]
+    assert db.session.get(Room, 2).name == "Kept" and not db.session.get(Room, 1).seats
+
+
+def test_server_change_of_the_same_field_by_a_higher_role_wins(client):
+    admin = _admin()
+    manager = User(email="manager@example.com", first_name="Manager", role="manager", password="x")
+    db.session.add(manager)
+    db.session.commit()
+    base_version = latestVersion(1)
+    updateRoom(1, {"name": "Server"})
+    db.session.query(FloorPlanVersion).filter(FloorPlanVersion.version > base_version).update({"user_id": admin.id})
+    db.session.commit()
+
+    result = applySync("tablet", manager, [_rename("name", 1, "Client", base_version),
+                                           {"id": "capacity", "op": "updateRoom", "target": 1, "values": {"capacity": 3},
+                                            "base_version": base_version}])
+    # the name changed on the server by an admin stays, the capacity nobody else changed is merged
+    assert [item["status"] for item in result["results"]] == ["conflict", "applied"]
+    room = db.session.get(Room, 1)
+    assert room.name == "Server" and room.capacity == 3
+
+    result = applySync("laptop", admin, [_rename("name", 1, "Admin", base_version)])
+    assert result["results"][0]["status"] == "applied" and db.session.get(Room, 1).name == "Admin"
+
+
+def test_rejected_operations_can_be_corrected_and_resent(client):
+    bad = {"id": "op", "op": "updateRoom", "target": 1, "values": {"capacity": "many"}, "base_version": 1}
+    assert applySync("laptop", _admin(), [bad])["results"][0]["status"] == "invalid"
+    assert db.session.query(SyncOperation).count() == 0
+    fixed = {**bad, "values": {"capacity": 5}}
+    result = applySync("laptop", _admin(), [fixed])["results"][0]
+    assert result["status"] == "applied" and "replayed" not in result
+    assert db.session.get(Room, 1).capacity == 5 and db.session.query(SyncOperation).count() == 1
+
+
+def test_changes_are_paged(client, monkeypatch):
+    monkeypatch.setattr(sync, "MAX_SYNC_CHANGES", 2)
+    # the floor and its three rooms made four versions
+    assert latestVersion(1) == 4
+    first = applySync("laptop", _admin(), [_rename("a", 1, "First", 4)])
+    assert first["more"] and [change["id"] for change in first["changes"]] == [1, 2] and first["token"] == 2
+    assert first["recorded"] == [5]
+    second = applySync("laptop", _admin(), [], first["token"])
+    assert second["more"] and [change["id"] for change in second["changes"]] == [3, 4] and second["token"] == 4
+    last = applySync("laptop", _admin(), [], second["token"])
+    assert not last["more"] and [change["id"] for change in last["changes"]] == [5] and last["token"] == 5
+    assert last["recorded"] == []
+
+
+def test_sync_is_for_admins(client):
+    body = {"client_id": "laptop", "operations": [_rename("a", 1, "First")]}
+    assert client.post("/api/sync", json=body).status_code == 200
+    db.session.query(User).update({"role": "manager"})
+    db.session.commit()
+    assert client.post("/api/sync", json={**body, "operations": [_rename("b", 1, "Second")]}).status_code == 403
+    assert db.session.get(Room, 1).name == "First"
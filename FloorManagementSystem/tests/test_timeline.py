@@ -0,0 +1,68 @@
+import random
+from datetime import date, datetime
+
+import pytest
+from task_app import db
+from task_app.models import Booking
+from task_app.timeline import bits, dayGrid, slotMask, windowStarts
+
+
+def _starts(free, length, slots):
+    # the slots i with i .. i + length - 1 all free, one at a time
+    return sum(1 << i for i in range(slots - length + 1) if all(free >> j & 1 for j in range(i, i + length)))
+
+
+def _book(admin, room_id, start, end, status="open"):
+    db.session.add(Booking(room_id=room_id, user_id=admin, people_count=1, start_time=start, end_time=end, purpose="",
+                           status=status, updated_at=start))
+    db.session.commit()
+
+
+def test_slot_mask_and_bits():
+    assert slotMask(2, 5) == 0b11100
+    assert slotMask(3, 3) == slotMask(4, 1) == 0
+    assert bits(0b1101, 6) == "101100"
+    assert bits(0, 0) == ""
+
+
+@pytest.mark.parametrize("length", [1, 2, 3, 4, 5, 7, 8, 13, 96])
+def test_window_starts_matches_brute_force(length):
+    rng = random.Random(length)
+    for _ in range(200):
+        free = rng.getrandbits(96) | rng.getrandbits(96)
+        assert windowStarts(free, length) == _starts(free, length, 96)
+    assert windowStarts(slotMask(0, 96), length) == slotMask(0, 96 - length + 1)
+    assert windowStarts(0, length) == 0
+
+
+def test_day_grid_marks_every_touched_slot(admin):
+    day = date(2030, 1, 2)
+    _book(admin, 1, datetime(2030, 1, 2, 9, 0), datetime(2030, 1, 2, 10, 0))
+    # a booking ending inside a slot takes it whole, and one running over midnight is cut at the day
+    _book(admin, 2, datetime(2030, 1, 2, 10, 5), datetime(2030, 1, 2, 10, 20))
+    _book(admin, 3, datetime(2030, 1, 1, 23, 0), datetime(2030, 1, 2, 0, 30))
+    _book(admin, 3, datetime(2030, 1, 2, 23, 50), datetime(2030, 1, 3, 1, 0))
+    # closed bookings and other days are free
+    _book(admin, 1, datetime(2030, 1, 2, 12, 0), datetime(2030, 1, 2, 13, 0), "closed")
+    _book(admin, 2, datetime(2030, 1, 3, 9, 0), datetime(2030, 1, 3, 10, 0))
+
+    grid = dayGrid(day, floor_plan_id=1)
+    assert grid["start"] == datetime(2030, 1, 2) and grid["slots"] == 96
+    busy = {room["id"]: room["busy"] for room in grid["rooms"]}
+    assert busy == {1: slotMask(36, 40), 2: slotMask(40, 42), 3: slotMask(0, 2) | slotMask(95, 96)}
+    assert [room["id"] for room in dayGrid(day, building_id=1, slot_minutes=60, people=4)["rooms"]] == [2, 3]
+
+
+def test_timeline_endpoint(client, admin):
+    _book(admin, 1, datetime(2030, 1, 2, 0, 0), datetime(2030, 1, 2, 12, 0))
+    _book(admin, 2, datetime(2030, 1, 2, 6, 0), datetime(2030, 1, 3, 0, 0))
+    _book(admin, 3, datetime(2030, 1, 2, 11, 0), datetime(2030, 1, 2, 13, 0))
+    result = client.get("/api/timeline?floor_plan_id=1&date=2030-01-02&slot=360&duration=600").get_json()
+    assert result["slots"] == 4
+    assert [room["busy"] for room in result["rooms"]] == ["1100", "0111", "0110"]
+    assert result["any_free"] == "1011" and result["all_free"] == "0000"
+    assert [room["starts"] for room in result["rooms"]] == ["0010", "0000", "0000"]
+    assert result["any_start"] == "0010"
+    assert client.get("/api/timeline?floor_plan_id=1&date=2030-01-02&slot=7").status_code == 400
+    assert client.get("/api/timeline?floor_plan_id=1&date=tomorrow").status_code == 400
+    assert client.get("/api/timeline?date=2030-01-02").status_code == 400
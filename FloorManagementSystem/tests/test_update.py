@@ -0,0 +1,77 @@
+import pytest
+from task_app import db
+from task_app.databaseControl import (
+    ConflictError,
+    deleteRoom,
+    mergeChanges,
+    updateFloorPlan,
+    updateRoom,
+)
+from task_app.models import FloorPlanVersion, Room, User
+
+
+def test_update_bumps_the_version(floor):
+    row = updateRoom(1, {"capacity": "6", "x": "1.5", "y": 2})
+    assert row["capacity"] == 6 and row["x"] == 1.5 and row["version"] == 2
+    assert db.session.get(Room, 1).capacity == 6
+
+
+@pytest.mark.parametrize("values", [{"capacity": "abc"}, {"capacity": -1}, {"capacity": 2.5}, {"x": "left"},
+                                    {"name": ["R"]}])
+def test_update_rejects_invalid_values_before_writing(floor, values):
+    versions = db.session.query(FloorPlanVersion).count()
+    with pytest.raises(ValueError):
+        updateRoom(1, values)
+    room = db.session.get(Room, 1)
+    assert room.capacity == 2 and room.x is None and room.version == 1
+    assert db.session.query(FloorPlanVersion).count() == versions
+
+
+def test_update_rejects_invalid_level(floor):
+    with pytest.raises(ValueError):
+        updateFloorPlan(1, {"level": "x"})
+
+
+def test_update_rejects_invalid_version(floor):
+    with pytest.raises(ValueError):
+        updateRoom(1, {"name": "A"}, "one")
+    with pytest.raises(ValueError):
+        deleteRoom(1, "one")
+    assert db.session.get(Room, 1).name == "R2"
+
+
+def test_outdated_update_is_merged_or_conflicts(floor):
+    updateRoom(1, {"name": "Renamed"}, 1)
+    row = updateRoom(1, {"capacity": 3}, 1, base={"name": "R2", "capacity": 2})
+    assert row["name"] == "Renamed" and row["capacity"] == 3
+    with pytest.raises(ConflictError) as error:
+        updateRoom(1, {"name": "Other"}, 1, base={"name": "R2"})
+    assert error.value.fields == ["name"]
+
+
+def test_merge_changes():
+    merged, conflicts = mergeChanges({"a": 1, "b": 1}, {"a": 2, "b": 1}, {"a": 1, "b": 3})
+    assert merged == {"a": 2, "b": 3} and conflicts == []
+    merged, conflicts = mergeChanges({"a": 1}, {"a": 2}, {"a": 3})
+    assert merged == {"a": 3} and conflicts == ["a"]
+
+
+def test_patch_answers_400_for_invalid_values(client):
+    response = client.patch("/api/rooms/1", json={"values": {"capacity": "abc"}})
+    assert response.status_code == 400
+    response = client.patch("/api/floors/1", json={"values": {"name": "G"}, "version": "x"})
+    assert response.status_code == 400
+    assert client.patch("/api/rooms/1", json={"values": {"capacity": 5}}).get_json()["capacity"] == 5
+
+
+def test_delete_form_answers_400_for_invalid_version(client):
+    assert client.post("/rooms/1", data={"version": "x"}).status_code == 400
+
+
+def test_patch_is_for_admins(client):
+    db.session.query(User).update({"role": "user"})
+    db.session.commit()
+    assert client.patch("/api/floors/1", json={"values": {"name": "G"}}).status_code == 403
+    assert client.patch("/api/rooms/1", json={"values": {"capacity": 5}}).status_code == 403
+    assert client.patch("/api/seats/1", json={"values": {"label": "S"}}).status_code == 403
+    assert db.session.get(Room, 1).capacity == 2
@@ -0,0 +1,60 @@
+from sqlalchemy import event, text
+from task_app import db
+from task_app.models import User
+from task_app.usercache import UserCache, userCache
+
+
+def test_cached_users_are_served_without_a_query(admin):
+    queries = []
+
+    def record(conn, cursor, statement, *args):
+        if "FROM users" in statement:
+            queries.append(statement)
+
+    userCache.load(admin)
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        assert userCache.load(admin).role == "admin"
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert queries == []
+
+
+def test_role_change_is_seen_at_once(client, admin):
+    assert client.patch("/api/rooms/1", json={"values": {"name": "A"}, "version": 1}).status_code == 200
+    user = db.session.get(User, admin)
+    user.role = "user"
+    db.session.commit()
+    assert userCache.load(admin).role == "user"
+    assert client.patch("/api/rooms/1", json={"values": {"name": "B"}}).status_code == 403
+
+
+def test_bulk_update_and_delete_drop_the_entries(admin):
+    userCache.load(admin)
+    db.session.query(User).update({"role": "user"})
+    db.session.commit()
+    assert userCache.load(admin).role == "user"
+
+    db.session.delete(db.session.get(User, admin))
+    db.session.commit()
+    assert userCache.load(admin) is None
+
+
+def test_raw_sql_changes_are_seen_after_the_ttl(admin):
+    cache = UserCache(ttl=3600)
+    cache.load(admin)
+    db.session.execute(text("UPDATE users SET role = 'user'"))
+    db.session.commit()
+    assert cache.load(admin).role == "admin"
+    cache.configure(16, 0)
+    assert cache.load(admin).role == "user"
+
+
+def test_least_recently_used_entry_is_evicted(admin):
+    for i in range(2):
+        db.session.add(User(email=f"u{i}@example.com", first_name=f"U{i}", role="user", password="x"))
+    db.session.commit()
+    cache = UserCache(max_entries=2)
+    for id in (1, 2, 1, 3):
+        cache.load(id)
+    assert list(cache._entries) == [1, 3]
@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+import pytest
+from task_app import db
+from task_app.models import RoomUsage, User
+from task_app.tasks import bookRoom, cancel
+from task_app.utilization import _cells, hourSlices, rebuildUsage, usageReport
+
+
+def _usage():
+    return sorted((row.room_id, row.day, row.hour, row.bookings, row.booked_minutes, row.people_minutes)
+                  for row in db.session.query(RoomUsage))
+
+
+def test_hour_slices():
+    slices = list(hourSlices(datetime(2030, 1, 7, 9, 45), datetime(2030, 1, 7, 11, 15)))
+    assert slices == [(date(2030, 1, 7), 9, 15), (date(2030, 1, 7), 10, 60), (date(2030, 1, 7), 11, 15)]
+    assert list(hourSlices(datetime(2030, 1, 7, 23, 30), datetime(2030, 1, 8, 0, 30))) == [
+        (date(2030, 1, 7), 23, 30), (date(2030, 1, 8), 0, 30)]
+
+
+def test_cells_count_a_booking_once_in_the_hour_it_starts():
+    cells = _cells([(1, datetime(2030, 1, 7, 9, 30), datetime(2030, 1, 7, 11), 3)], 1)
+    assert cells == {(1, date(2030, 1, 7), 9): [1, 30, 90], (1, date(2030, 1, 7), 10): [0, 60, 180]}
+    # clipped to a range starting after the booking: the minutes count, the booking does not
+    cells = _cells([(1, datetime(2030, 1, 6, 23), datetime(2030, 1, 7, 1), 1)], 1,
+                   datetime(2030, 1, 7), datetime(2030, 1, 8))
+    assert cells == {(1, date(2030, 1, 7), 0): [0, 60, 60]}
+
+
+def test_live_aggregates_match_a_rebuild(admin):
+    user = admin
+    bookRoom("a", "09:30", "11:00", 1, "2030-01-07", 2, user)
+    bookRoom("b", "10:00", "12:15", 2, "2030-01-07", 3, user)
+    booked = bookRoom("c", "16:00", "17:00", 3, "2030-01-07", 5, user)
+    bookRoom("d", "14:00", "15:00", 3, "2030-01-08", 6, user)
+    cancel(booked["booking_id"])
+    live = _usage()
+    assert live
+
+    rebuildUsage(date(2030, 1, 1), date(2030, 2, 1))
+    db.session.commit()
+    assert _usage() == live
+
+
+def test_report(admin):
+    bookRoom("a", "09:00", "11:00", 1, "2030-01-07", 1, admin)
+    report = usageReport(date(2030, 1, 7), date(2030, 1, 7))
+    room = next(item for item in report if item["id"] == 1)
+    assert room["bookings"] == 1 and room["booked_minutes"] == 120
+    assert room["utilization"] == round(120 / 600, 4) and room["fill"] == 0.5
+
+
+@pytest.mark.parametrize("query", ["room_id=abc", "floor_plan_id=1.5", "building_id=x"])
+def test_report_rejects_invalid_scope(client, query):
+    assert client.get(f"/api/utilization?{query}").status_code == 400
+    assert client.get(f"/api/utilization/peak?{query}").status_code == 400
+
+
+def test_backfill_is_for_admins(client):
+    assert client.post("/api/utilization/backfill").status_code == 200
+    db.session.query(User).update({"role": "user"})
+    db.session.commit()
+    assert client.post("/api/utilization/backfill").status_code == 403
@@ -0,0 +1,55 @@
+from sqlalchemy import delete
+from task_app import db
+from task_app.databaseControl import (
+    createSeat,
+    deleteRoom,
+    deleteSeat,
+    restoreFloorPlan,
+    updateRoom,
+)
+from task_app.models import Room, Seat, User
+from task_app.versioning import diffVersions, latestVersion, versionState
+
+
+def test_versions_rebuild_and_diff(floor):
+    first = latestVersion(1)
+    updateRoom(1, {"name": "Renamed"})
+    assert versionState(1, first)["rooms"]["1"]["name"] == "R2"
+    assert versionState(1, latestVersion(1))["rooms"]["1"]["name"] == "Renamed"
+    assert diffVersions(1, first, latestVersion(1))["rooms"]["1"][1]["name"] == "Renamed"
+
+
+def test_restore_brings_back_deleted_rooms_and_seats(floor):
+    createSeat(1, "S1")
+    version = latestVersion(1)
+    deleteRoom(1)
+    result = restoreFloorPlan(1, version)
+    assert result == {"version": version + 2, "skipped_seats": []}
+    room = db.session.get(Room, 1)
+    assert room.name == "R2" and [seat.label for seat in room.seats] == ["S1"]
+
+
+def test_restore_skips_seats_whose_room_is_gone(floor):
+    createSeat(1, "S1")
+    createSeat(2, "S2")
+    version = latestVersion(1)
+    deleteSeat(1)
+    deleteSeat(2)
+    # a room removed without a version of its own, the seat's room is neither restored nor there
+    db.session.execute(delete(Room).where(Room.id == 1))
+    db.session.commit()
+
+    result = restoreFloorPlan(1, version)
+    assert result["skipped_seats"] == [1]
+    assert [seat.label for seat in db.session.query(Seat)] == ["S2"]
+
+
+def test_restore_endpoint_is_for_admins(client):
+    updateRoom(1, {"name": "Renamed"})
+    db.session.query(User).update({"role": "user"})
+    db.session.commit()
+    assert client.post("/api/floors/1/versions/4/restore").status_code == 403
+    db.session.query(User).update({"role": "admin"})
+    db.session.commit()
+    assert client.post("/api/floors/1/versions/4/restore").get_json()["version"] == 6
+    assert db.session.get(Room, 1).name == "R2"